@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from datetime import timedelta
 import os
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -34,7 +35,7 @@ ALLOWED_HOSTS = ["*"]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': ( 
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'api.authentication.PrincipalJWTAuthentication',
     ),
     "DEFAULT_PERMISSION_CLASSES": (
         "rest_framework.permissions.IsAuthenticated",
@@ -46,6 +47,102 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
 }
 
+# Cache used for lookups and cached API responses. Cached entries are invalidated by
+# signals, which only reach the cache they run against. The default is per-process memory:
+# fine for a single worker, but with several workers each keeps its own copy, so entries
+# there expire after the short *_LOCAL_* timeouts below. To share entries (and invalidations)
+# set CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache and a CACHE_LOCATION
+# directory for workers on one host, or django.core.cache.backends.redis.RedisCache and a
+# redis:// CACHE_LOCATION across hosts.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# How long cached API responses (profile, subject list, session list) are kept
+RESPONSE_CACHE_SECONDS = int(os.getenv('RESPONSE_CACHE_SECONDS', '3600'))
+RESPONSE_CACHE_LOCAL_SECONDS = int(os.getenv('RESPONSE_CACHE_LOCAL_SECONDS', '10'))
+
+# How long each user's (token_version, is_active) pair is cached for authentication.
+# Revoking tokens (password, role or activation change) clears the entry in the cache it
+# runs against; with the per-process default, other workers keep honouring revoked tokens
+# until their copy expires, so that case uses the much shorter local timeout.
+TOKEN_STATE_CACHE_SECONDS = int(os.getenv('TOKEN_STATE_CACHE_SECONDS', '300'))
+TOKEN_STATE_LOCAL_CACHE_SECONDS = int(os.getenv('TOKEN_STATE_LOCAL_CACHE_SECONDS', '15'))
+
+# Request metrics are published at /metrics to scrapers sending "Authorization: Bearer <token>";
+# without a token the endpoint answers 404, except with DEBUG on
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# Slow-query journal: statements at or over the threshold are appended as JSON lines,
+# with their query plan the first time each statement shape is seen. Parameters are logged
+# as numbers or type placeholders, never string values. Off unless a threshold (e.g. 200) is set.
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '-1'))
+SLOW_QUERY_LOG_PATH = os.getenv('SLOW_QUERY_LOG_PATH', str(BASE_DIR / 'slow_queries.log'))
+SLOW_QUERY_LOG_MAX_BYTES = int(os.getenv('SLOW_QUERY_LOG_MAX_BYTES', str(10 * 1024 * 1024)))
+SLOW_QUERY_LOG_BACKUPS = int(os.getenv('SLOW_QUERY_LOG_BACKUPS', '5'))
+
+# Login password hashing runs in a bounded pool; when every worker is busy and the
+# queue is full, further logins get an immediate 429 instead of waiting
+LOGIN_HASH_WORKERS = int(os.getenv('LOGIN_HASH_WORKERS', str(os.cpu_count() or 2)))
+LOGIN_HASH_QUEUE = int(os.getenv('LOGIN_HASH_QUEUE', str(4 * (os.cpu_count() or 2))))
+LOGIN_RETRY_AFTER_SECONDS = int(os.getenv('LOGIN_RETRY_AFTER_SECONDS', '1'))
+
+# Keyset pagination for session history and attendance record lists
+API_PAGE_SIZE = int(os.getenv('API_PAGE_SIZE', '50'))
+API_MAX_PAGE_SIZE = int(os.getenv('API_MAX_PAGE_SIZE', '200'))
+
+# Dynamic QR configuration
+# 'stored' keeps the rotating code on the AttendanceSession row, 'signed' derives it
+# from the session id and the current time window so no database write is needed.
+QR_TOKEN_MODE = os.getenv('QR_TOKEN_MODE', 'stored')
+QR_ROTATION_SECONDS = int(os.getenv('QR_ROTATION_SECONDS', '10'))
+# Number of neighbouring windows accepted in 'signed' mode to absorb clock skew
+QR_TOKEN_GRACE_WINDOWS = int(os.getenv('QR_TOKEN_GRACE_WINDOWS', '1'))
+QR_TOKEN_SECRET = os.getenv('QR_TOKEN_SECRET', SECRET_KEY)
+# Rendered QR images kept in memory per worker, keyed by token
+QR_IMAGE_CACHE_SIZE = int(os.getenv('QR_IMAGE_CACHE_SIZE', '512'))
+
+# Live attendance stream (Server-Sent Events). runserver/WSGI serves it with one worker thread per viewer;
+# an ASGI server on ClassCue.asgi holds many viewers on one event loop.
+# The in-process broker only fans out within one worker; swap in a shared broker for multi-process setups.
+ATTENDANCE_EVENT_BROKER = os.getenv('ATTENDANCE_EVENT_BROKER', 'api.events.InProcessBroker')
+ATTENDANCE_EVENT_QUEUE_SIZE = int(os.getenv('ATTENDANCE_EVENT_QUEUE_SIZE', '256'))
+ATTENDANCE_EVENT_KEEPALIVE_SECONDS = int(os.getenv('ATTENDANCE_EVENT_KEEPALIVE_SECONDS', '15'))
+# Seconds a stream token (passed as ?token= because EventSource cannot send headers) stays usable
+ATTENDANCE_EVENT_TOKEN_MAX_AGE = int(os.getenv('ATTENDANCE_EVENT_TOKEN_MAX_AGE', '60'))
+
+# Incremental attendance feed: cursors trail the newest records by this much so
+# rows committed slightly out of order are re-sent instead of skipped
+ATTENDANCE_FEED_SETTLE_SECONDS = float(os.getenv('ATTENDANCE_FEED_SETTLE_SECONDS', '1'))
+
+# Attendance ingestion: 'direct' inserts each scan in its own transaction, 'log' appends
+# accepted scans to a durable local log and commits them in batches. Each worker process
+# locks a log of its own (ATTENDANCE_MARK_LOG_PATH, then .1, .2, ...); entries that still
+# fail after ATTENDANCE_MARK_LOG_MAX_ATTEMPTS tries are moved to <log>.dead.
+ATTENDANCE_INGEST_MODE = os.getenv('ATTENDANCE_INGEST_MODE', 'direct')
+ATTENDANCE_MARK_LOG_PATH = os.getenv('ATTENDANCE_MARK_LOG_PATH', str(BASE_DIR / 'attendance_marks.log'))
+ATTENDANCE_GROUP_COMMIT_SIZE = int(os.getenv('ATTENDANCE_GROUP_COMMIT_SIZE', '500'))
+ATTENDANCE_GROUP_COMMIT_INTERVAL = float(os.getenv('ATTENDANCE_GROUP_COMMIT_INTERVAL', '0.5'))
+ATTENDANCE_MARK_LOG_MAX_ATTEMPTS = int(os.getenv('ATTENDANCE_MARK_LOG_MAX_ATTEMPTS', '5'))
+
+# Keep AttendanceSession.valid_record_count up to date on every insert/invalidation and read it
+# instead of counting. Run `manage.py recount_attendance_sessions` before switching it on.
+ATTENDANCE_SESSION_COUNTER = os.getenv('ATTENDANCE_SESSION_COUNTER', 'False') == 'True'
+
+# Defaulter reports list students below this attendance percentage in a subject
+ATTENDANCE_THRESHOLD_PERCENT = int(os.getenv('ATTENDANCE_THRESHOLD_PERCENT', '75'))
+# Attendance rows fetched per round trip while reports build their matrices
+REPORT_CHUNK_SIZE = int(os.getenv('REPORT_CHUNK_SIZE', '20000'))
+# Rows per fetch while streaming exports (a server-side cursor batch on PostgreSQL)
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', '2000'))
+
+# Bulk account import: rows inserted per transaction, and processes hashing passwords
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', '500'))
+IMPORT_HASH_WORKERS = int(os.getenv('IMPORT_HASH_WORKERS', str(os.cpu_count() or 2)))
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -62,6 +159,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -95,20 +193,13 @@ WSGI_APPLICATION = 'ClassCue.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-# Database configuration with fallback to SQLite
-try:
-    # Try to import psycopg2 to check if PostgreSQL is available
-    import psycopg2
-    # Test connection to PostgreSQL
-    conn = psycopg2.connect(
-        host=os.getenv('DB_HOST', 'localhost'),
-        port=os.getenv('DB_PORT', '5432'),
-        user=os.getenv('DB_USER', 'postgres'),
-        # password=os.getenv('DB_PASSWORD', 'Aryan1824'),
-        password=os.getenv('DB_PASSWORD', 'PriPostgres'),
-        database=os.getenv('DB_NAME', 'classcue_db')
-    )
-    conn.close()
+# Database selection comes from configuration alone, so importing settings never
+# touches the network. DB_ENGINE picks the backend: 'sqlite' (the default, also used by
+# `manage.py test` out of the box) or 'postgresql', which must be chosen explicitly;
+# the DB_* connection settings are ignored until it is.
+DB_ENGINE = os.getenv('DB_ENGINE') or 'sqlite'
+
+if DB_ENGINE == 'postgresql':
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.postgresql',
@@ -117,18 +208,48 @@ try:
             'PASSWORD': os.getenv('DB_PASSWORD', 'PriPostgres'),
             'HOST': os.getenv('DB_HOST', 'localhost'),
             'PORT': os.getenv('DB_PORT', '5432'),
+            # Seconds a connection is kept for reuse across requests (0 closes it after each request)
+            'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', '0')),
+            # Ping a reused connection before the first query of a request
+            'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'True') == 'True',
+            'OPTIONS': {},
         }
     }
-    print("Using PostgreSQL database")
-except (ImportError, psycopg2.OperationalError) as e:
-    # Fallback to SQLite if PostgreSQL is not available or connection fails
+    # Connection pool (psycopg 3 with psycopg_pool); replaces per-thread persistent connections.
+    # With CONN_HEALTH_CHECKS on, the pool pre-pings each connection as it is handed out.
+    if os.getenv('DB_POOL', 'False') == 'True':
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS']['pool'] = {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            # Connections are recycled after this many seconds
+            'max_lifetime': float(os.getenv('DB_POOL_MAX_LIFETIME', '1800')),
+            # Seconds a request waits for a free connection before failing
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+        }
+elif DB_ENGINE == 'sqlite':
     DATABASES = {
         'default': {
             'ENGINE': 'django.db.backends.sqlite3',
-            'NAME': BASE_DIR / 'db.sqlite3',
+            'NAME': os.getenv('SQLITE_PATH', str(BASE_DIR / 'db.sqlite3')),
         }
     }
-    print(f"PostgreSQL not available ({e}), using SQLite database")
+    # Concurrent writers (a class scanning at once) on a single SQLite file:
+    # WAL lets readers proceed during a write, writers queue on the busy timeout
+    # instead of failing with "database is locked", and BEGIN IMMEDIATE takes the
+    # write lock up front so a transaction never fails upgrading from a read lock.
+    # Every atomic() block here is a write, so IMMEDIATE applies to all of them.
+    if os.getenv('SQLITE_CONCURRENT_MODE', 'False') == 'True':
+        DATABASES['default']['OPTIONS'] = {
+            # synchronous=NORMAL is durable across application crashes in WAL mode;
+            # only a power loss can drop the last commits
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+            'transaction_mode': 'IMMEDIATE',
+            # Seconds a writer waits for the lock before giving up
+            'timeout': float(os.getenv('SQLITE_BUSY_TIMEOUT', '20')),
+        }
+else:
+    raise ImproperlyConfigured(f"DB_ENGINE must be 'postgresql' or 'sqlite', not {DB_ENGINE!r}")
 
 
 # Password validation
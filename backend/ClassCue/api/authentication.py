@@ -0,0 +1,112 @@
+# api/authentication.py
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .cache import cache_is_shared
+from .models import User
+from .signals import users_access_changed
+
+TOKEN_VERSION_CLAIM = 'tv'
+
+
+class Principal(TokenUser):
+    """Request user rebuilt from access-token claims, without touching the users table"""
+
+    @cached_property
+    def role(self):
+        return self.token.get('role')
+
+    @cached_property
+    def email(self):
+        return self.token.get('email', '')
+
+    @cached_property
+    def enrollment_number(self):
+        return self.token.get('enrollment_number')
+
+    @cached_property
+    def teacher_profile_id(self):
+        return self.token.get('teacher_profile_id')
+
+
+def issue_tokens(user, student_profile=None, teacher_profile=None):
+    """Refresh token (and its access token) carrying the claims Principal reads"""
+    refresh = RefreshToken.for_user(user)
+    refresh['role'] = user.role
+    refresh['email'] = user.email
+    refresh[TOKEN_VERSION_CLAIM] = user.token_version
+    if student_profile is not None:
+        refresh['enrollment_number'] = student_profile.enrollment_number
+    if teacher_profile is not None:
+        refresh['teacher_profile_id'] = teacher_profile.id
+    return refresh
+
+
+def token_state_key(user_id):
+    return f"token-state:{user_id}"
+
+
+def token_state_timeout():
+    # Revocation clears the entry only in the cache it runs against, so a
+    # per-process cache must let other workers' copies expire quickly
+    if cache_is_shared():
+        return settings.TOKEN_STATE_CACHE_SECONDS
+    return settings.TOKEN_STATE_LOCAL_CACHE_SECONDS
+
+
+def get_token_state(user_id):
+    """Return (token_version, is_active) for a user, or None if the user is gone"""
+    key = token_state_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        state = User.objects.filter(id=user_id).values_list('token_version', 'is_active').first()
+        if state is None:
+            return None
+        state = tuple(state)
+        cache.set(key, state, token_state_timeout())
+    return state
+
+
+class PrincipalJWTAuthentication(JWTAuthentication):
+    """JWT authentication that trusts the token's claims once its version is current.
+
+    The only per-request lookup is the user's (token_version, is_active) pair,
+    served from the cache; password, role and activation changes bump the
+    version and so revoke every token issued before them, in other workers
+    once their cached copy expires (see token_state_timeout). Tokens issued
+    without the version claim fall back to loading the User row.
+    """
+
+    def get_user(self, validated_token):
+        if TOKEN_VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        state = get_token_state(validated_token[api_settings.USER_ID_CLAIM])
+        if state is None:
+            raise AuthenticationFailed('User not found', code='user_not_found')
+        token_version, is_active = state
+        if not is_active:
+            raise AuthenticationFailed('User is inactive', code='user_inactive')
+        if validated_token[TOKEN_VERSION_CLAIM] != token_version:
+            raise AuthenticationFailed('Token has been revoked', code='token_revoked')
+        return Principal(validated_token)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_token_state(sender, instance, **kwargs):
+    cache.delete(token_state_key(instance.id))
+
+
+@receiver(users_access_changed)
+def forget_updated_token_states(sender, user_ids, **kwargs):
+    cache.delete_many([token_state_key(user_id) for user_id in user_ids])
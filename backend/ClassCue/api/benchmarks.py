@@ -0,0 +1,272 @@
+# api/benchmarks.py
+
+from dataclasses import dataclass
+from datetime import timedelta
+from time import perf_counter
+from typing import Callable, Optional
+
+from django.contrib.auth.hashers import check_password, make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .authentication import issue_tokens
+from .cache import SUBJECTS, bump_version, profile_namespace, teacher_sessions_namespace
+from .models import AttendanceRecord, AttendanceSession, StudentProfile, Subject, TeacherProfile, User
+from .qr_images import qr_image_cache
+from .qr_tokens import issue_token, verify_token
+from .serializers import (
+    AttendanceRecordSerializer, AttendanceSessionSerializer, StudentProfileSerializer,
+    StudentProfileUpdateSerializer, SubjectSerializer, TeacherProfileSerializer, TeacherProfileUpdateSerializer,
+    UserSerializer
+)
+from .views import generate_qr_code
+
+PASSWORD = 'benchmark-password'
+
+# Sizes of a large lecture and a busy teacher's history
+STUDENTS = 200
+SESSIONS = 100
+SUBJECTS_COUNT = 30
+
+
+@dataclass
+class Benchmark:
+    name: str
+    run: Callable
+    number: int
+    setup: Optional[Callable] = None
+    count_queries: bool = False
+
+
+BENCHMARKS = []
+
+
+def benchmark(name, number=100, setup=None, count_queries=False):
+    """Register `fn(fixture)` as a benchmark; `setup(fixture)` runs untimed before each call"""
+    def register(fn):
+        BENCHMARKS.append(Benchmark(name, fn, number, setup, count_queries))
+        return fn
+    return register
+
+
+class Fixture:
+    """Campus-sized data set the benchmarks share; built once per run"""
+
+    def __init__(self):
+        encoded = make_password(PASSWORD)
+        self.teacher = User.objects.create(email='bench-teacher@example.com', password=encoded, role='teacher')
+        self.teacher_profile = TeacherProfile.objects.create(user=self.teacher, full_name='Bench Teacher', department='CE')
+        self.subjects = Subject.objects.bulk_create(
+            Subject(subject_code=f'BENCH{number:03d}', name=f'Subject {number}', semester=number % 8 + 1)
+            for number in range(SUBJECTS_COUNT)
+        )
+        users = User.objects.bulk_create(
+            User(email=f'bench-student-{number}@example.com', password=encoded, role='student')
+            for number in range(STUDENTS)
+        )
+        self.students = StudentProfile.objects.bulk_create(
+            StudentProfile(user=user, enrollment_number=f'BENCH{number:07d}', full_name=f'Student {number}',
+                           department='CE', semester=5)
+            for number, user in enumerate(users)
+        )
+        self.student_user = users[0]
+
+        AttendanceSession.objects.bulk_create(
+            AttendanceSession(teacher=self.teacher, subject=self.subjects[0], session_name=f'Lecture {number}',
+                              is_active=False, end_time=timezone.now())
+            for number in range(SESSIONS)
+        )
+        expires_at = timezone.now() + timedelta(days=1)
+        self.session = AttendanceSession.objects.create(
+            teacher=self.teacher, subject=self.subjects[0], session_name='Live lecture', qr_expires_at=expires_at
+        )
+        self.session.current_qr_code = f'{self.session.id}|benchmark|0'
+        self.session.save(update_fields=['current_qr_code'])
+        AttendanceRecord.objects.bulk_create(
+            AttendanceRecord(session=self.session, student=student, qr_code_used=self.session.current_qr_code)
+            for student in self.students[1:]
+        )
+
+        self.signed_token, _ = issue_token(self.session.id)
+        self.teacher_client = self.client_for(self.teacher, teacher_profile=self.teacher_profile)
+        self.student_client = self.client_for(self.student_user, student_profile=self.students[0])
+
+        self.records = list(AttendanceRecord.objects.filter(session=self.session).select_related('student'))
+        self.listing = list(AttendanceSession.objects.with_listing_data().filter(teacher=self.teacher)[:50])
+
+    def client_for(self, user, **profiles):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_tokens(user, **profiles).access_token}")
+        return client
+
+
+# QR rendering
+
+@benchmark('qr.generate_qr_code', number=20, setup=lambda fixture: qr_image_cache.clear())
+def bench_generate_qr_code(fixture):
+    qr_image_cache.get(generate_qr_code(fixture.session.id), fixture.session.qr_expires_at)
+
+
+# Serializers, at the list sizes the endpoints return
+
+@benchmark(f'serializer.AttendanceRecordSerializer[{STUDENTS - 1}]', number=10)
+def bench_record_serializer(fixture):
+    AttendanceRecordSerializer(fixture.records, many=True).data
+
+
+@benchmark('serializer.AttendanceSessionSerializer[50]', number=20)
+def bench_session_serializer(fixture):
+    AttendanceSessionSerializer(fixture.listing, many=True).data
+
+
+@benchmark(f'serializer.SubjectSerializer[{SUBJECTS_COUNT}]', number=50)
+def bench_subject_serializer(fixture):
+    SubjectSerializer(fixture.subjects, many=True).data
+
+
+@benchmark(f'serializer.StudentProfileSerializer[{STUDENTS}]', number=10)
+def bench_student_profile_serializer(fixture):
+    StudentProfileSerializer(fixture.students, many=True).data
+
+
+@benchmark('serializer.TeacherProfileSerializer[1]', number=200)
+def bench_teacher_profile_serializer(fixture):
+    TeacherProfileSerializer(fixture.teacher_profile).data
+
+
+@benchmark(f'serializer.UserSerializer[{STUDENTS}]', number=10)
+def bench_user_serializer(fixture):
+    UserSerializer([student.user for student in fixture.students], many=True).data
+
+
+@benchmark('serializer.StudentProfileUpdateSerializer.is_valid', number=200)
+def bench_student_update_serializer(fixture):
+    StudentProfileUpdateSerializer(fixture.students[0], data={'full_name': 'Student 0'}, partial=True).is_valid()
+
+
+@benchmark('serializer.TeacherProfileUpdateSerializer.is_valid', number=200)
+def bench_teacher_update_serializer(fixture):
+    TeacherProfileUpdateSerializer(fixture.teacher_profile, data={'full_name': 'Bench Teacher'}, partial=True).is_valid()
+
+
+# Login hashing and QR token parsing
+
+@benchmark('login.check_password', number=3)
+def bench_check_password(fixture):
+    check_password(PASSWORD, fixture.teacher.password)
+
+
+@benchmark('mark.parse_stored_token', number=10000)
+def bench_parse_stored_token(fixture):
+    int(fixture.session.current_qr_code.split('|')[0])
+
+
+@benchmark('mark.verify_signed_token', number=2000)
+def bench_verify_signed_token(fixture):
+    verify_token(fixture.signed_token, now=fixture.session.start_time)
+
+
+# Endpoints, with the number of queries each one issues
+
+def expect(response, status_code):
+    # A failing request is usually faster than a working one; never time it by mistake
+    if response.status_code != status_code:
+        raise AssertionError(f"{response.request['PATH_INFO']} answered {response.status_code}, expected {status_code}")
+
+def forget_cached_listing(fixture):
+    bump_version(teacher_sessions_namespace(fixture.teacher.id))
+
+
+@benchmark('endpoint.get_teacher_sessions[10]', number=20, setup=forget_cached_listing, count_queries=True)
+def bench_teacher_sessions_small(fixture):
+    expect(fixture.teacher_client.get(reverse('attendance-sessions'), {'page_size': 10}), 200)
+
+
+@benchmark('endpoint.get_teacher_sessions[100]', number=20, setup=forget_cached_listing, count_queries=True)
+def bench_teacher_sessions_large(fixture):
+    expect(fixture.teacher_client.get(reverse('attendance-sessions'), {'page_size': 100}), 200)
+
+
+def unmark_student(fixture):
+    AttendanceRecord.objects.filter(session=fixture.session, student=fixture.students[0]).delete()
+
+
+@benchmark('endpoint.mark_attendance', number=50, setup=unmark_student, count_queries=True)
+def bench_mark_attendance(fixture):
+    expect(fixture.student_client.post(reverse('mark-attendance'), {'qr_code': fixture.session.current_qr_code}), 201)
+
+
+@benchmark('endpoint.get_current_qr_code', number=50, count_queries=True)
+def bench_current_qr_code(fixture):
+    expect(fixture.teacher_client.get(reverse('get-current-qr', args=[fixture.session.id])), 200)
+
+
+@benchmark('endpoint.get_session_attendance', number=10, count_queries=True)
+def bench_session_attendance(fixture):
+    expect(fixture.teacher_client.get(reverse('get-session-attendance', args=[fixture.session.id])), 200)
+
+
+@benchmark('endpoint.user_profile', number=50, count_queries=True,
+           setup=lambda fixture: bump_version(profile_namespace(fixture.student_user.id)))
+def bench_user_profile(fixture):
+    expect(fixture.student_client.get(reverse('user-profile')), 200)
+
+
+@benchmark('endpoint.subjects_list', number=50, count_queries=True, setup=lambda fixture: bump_version(SUBJECTS))
+def bench_subjects_list(fixture):
+    expect(fixture.teacher_client.get(reverse('subjects-list')), 200)
+
+
+@benchmark('endpoint.login', number=3, count_queries=True)
+def bench_login(fixture):
+    expect(fixture.teacher_client.post(reverse('login'), {'email': fixture.students[0].enrollment_number, 'password': PASSWORD}), 200)
+
+
+def run_benchmarks(fixture, repeat=5, pattern=None):
+    """Return {name: {'seconds': per-call time of the best round, 'queries': count or None}}
+
+    The best round, as with timeit, is the one least disturbed by the rest of
+    the machine, which keeps comparisons against the baseline stable.
+    """
+    results = {}
+    for bench in BENCHMARKS:
+        if pattern and pattern not in bench.name:
+            continue
+        bench.run(fixture)  # warm-up: caches, connections, lazy imports
+        rounds = []
+        queries = None
+        for _ in range(repeat):
+            elapsed = 0.0
+            for _ in range(bench.number):
+                if bench.setup:
+                    bench.setup(fixture)
+                if bench.count_queries:
+                    with CaptureQueriesContext(connection) as captured:
+                        started = perf_counter()
+                        bench.run(fixture)
+                        elapsed += perf_counter() - started
+                    queries = len(captured)
+                else:
+                    started = perf_counter()
+                    bench.run(fixture)
+                    elapsed += perf_counter() - started
+            rounds.append(elapsed / bench.number)
+        results[bench.name] = {'seconds': min(rounds), 'queries': queries}
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """List (name, reason) for results slower than baseline * (1 + tolerance) or over their query budget"""
+    regressions = []
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['seconds'] > expected['seconds'] * (1 + tolerance):
+            regressions.append((name, f"{result['seconds'] / expected['seconds'] - 1:+.0%} time"))
+        if expected.get('queries') is not None and result['queries'] is not None and result['queries'] > expected['queries']:
+            regressions.append((name, f"{result['queries']} queries, budget {expected['queries']}"))
+    return regressions
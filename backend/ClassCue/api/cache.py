@@ -0,0 +1,169 @@
+# api/cache.py
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from rest_framework.renderers import JSONRenderer
+
+from .models import AttendanceSession, StudentProfile, Subject, TeacherProfile, User
+from .signals import attendance_invalidated, users_access_changed
+
+STUDENT_IDENTITY_TIMEOUT = 60 * 60
+
+# Namespaces whose version is part of cached response keys
+SUBJECTS = 'subjects'
+ATTENDANCE_COUNTS = 'attendance-counts'
+
+
+def cache_is_shared():
+    """False when the default cache lives in each worker's own memory, where invalidations stay local"""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def response_timeout():
+    # Version bumps only reach the cache they run against; with a per-process
+    # cache other workers keep serving (and 304-ing) their copy until it expires
+    if cache_is_shared():
+        return settings.RESPONSE_CACHE_SECONDS
+    return settings.RESPONSE_CACHE_LOCAL_SECONDS
+
+
+def student_identity_key(user_id):
+    return f"student-identity:{user_id}"
+
+
+def get_student_identity(user_id):
+    """Return (enrollment_number, full_name) for a student user, or None if there is no profile"""
+    key = student_identity_key(user_id)
+    identity = cache.get(key)
+    if identity is None:
+        profile = StudentProfile.objects.filter(user_id=user_id).values_list('enrollment_number', 'full_name').first()
+        if profile is None:
+            return None
+        identity = tuple(profile)
+        cache.set(key, identity, STUDENT_IDENTITY_TIMEOUT)
+    return identity
+
+
+def profile_namespace(user_id):
+    return f"profile:{user_id}"
+
+
+def teacher_sessions_namespace(teacher_id):
+    return f"teacher-sessions:{teacher_id}"
+
+
+def version_key(namespace):
+    return f"cache-version:{namespace}"
+
+
+def fresh_version():
+    # Seeded from the clock so a namespace whose version was evicted never
+    # comes back at a number that older cached entries still carry
+    return time.time_ns() // 1000
+
+
+def bump_version(namespace):
+    """Invalidate every cached response built from this namespace"""
+    key = version_key(namespace)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, fresh_version(), None)
+
+
+def versioned_key(name, *namespaces):
+    """Cache key for `name` that changes whenever any of the namespaces is bumped"""
+    keys = [version_key(namespace) for namespace in namespaces]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, fresh_version(), None)
+            versions[key] = cache.get(key)
+    return f"response:{name}:" + ':'.join(str(versions[key]) for key in keys)
+
+
+def response_etag(body):
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def cached_json_response(request, key, build, cacheable=None):
+    """Serve the JSON body cached under `key`, building and storing it on a miss.
+
+    `build` returns the payload to serialize, or an HttpResponse (errors are
+    passed through uncached). `cacheable(payload)` can veto storing a payload
+    that is about to change anyway. The body carries a strong ETag, so a
+    matching If-None-Match is answered with 304.
+    """
+    entry = cache.get(key)
+    if entry is None:
+        payload = build()
+        if isinstance(payload, HttpResponse):
+            return payload
+        body = JSONRenderer().render(payload)
+        entry = (body, response_etag(body))
+        if cacheable is None or cacheable(payload):
+            cache.set(key, entry, response_timeout())
+
+    body, etag = entry
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and etag in parse_etags(if_none_match):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+def forget_student_identity(sender, instance, **kwargs):
+    cache.delete(student_identity_key(instance.user_id))
+
+
+@receiver(post_save, sender=StudentProfile)
+@receiver(post_delete, sender=StudentProfile)
+@receiver(post_save, sender=TeacherProfile)
+@receiver(post_delete, sender=TeacherProfile)
+def bump_profile_version(sender, instance, **kwargs):
+    bump_version(profile_namespace(instance.user_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def bump_user_version(sender, instance, **kwargs):
+    bump_version(profile_namespace(instance.id))
+
+
+@receiver(users_access_changed)
+def bump_updated_users_versions(sender, user_ids, **kwargs):
+    for user_id in user_ids:
+        bump_version(profile_namespace(user_id))
+
+
+@receiver(post_save, sender=Subject)
+@receiver(post_delete, sender=Subject)
+def bump_subjects_version(sender, instance, **kwargs):
+    bump_version(SUBJECTS)
+
+
+@receiver(post_save, sender=AttendanceSession)
+@receiver(post_delete, sender=AttendanceSession)
+def bump_teacher_sessions_version(sender, instance, **kwargs):
+    bump_version(teacher_sessions_namespace(instance.teacher_id))
+
+
+@receiver(attendance_invalidated)
+def bump_invalidated_session_version(sender, session_id, **kwargs):
+    teacher_id = AttendanceSession.objects.filter(id=session_id).values_list('teacher_id', flat=True).first()
+    if teacher_id is not None:
+        bump_version(teacher_sessions_namespace(teacher_id))
@@ -0,0 +1,83 @@
+# api/cursors.py
+
+import base64
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Q
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor that was not produced by encode_cursor"""
+
+
+def timestamp_to_micros(value):
+    """Exact integer microseconds since the epoch, so cursors survive round trips"""
+    if value is None:
+        return 0
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def micros_to_timestamp(value):
+    return EPOCH + timedelta(microseconds=value)
+
+
+def encode_cursor(*parts):
+    """Encode integer parts into an opaque URL-safe cursor"""
+    raw = '.'.join(str(int(part)) for part in parts)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Decode a cursor produced by encode_cursor into `size` integers"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        parts = [int(part) for part in base64.urlsafe_b64decode(padded.encode()).decode().split('.')]
+    except (TypeError, ValueError, UnicodeDecodeError):
+        raise InvalidCursor('Malformed cursor')
+    if len(parts) != size:
+        raise InvalidCursor('Malformed cursor')
+    return parts
+
+
+def parse_page_size(value):
+    """Clamp a ?page_size= value to API_MAX_PAGE_SIZE, defaulting to API_PAGE_SIZE"""
+    if value in (None, ''):
+        return settings.API_PAGE_SIZE
+    try:
+        page_size = int(value)
+    except ValueError:
+        raise InvalidCursor('page_size must be an integer')
+    if page_size < 1:
+        raise InvalidCursor('page_size must be positive')
+    return min(page_size, settings.API_MAX_PAGE_SIZE)
+
+
+def keyset_page(queryset, time_field, cursor, page_size, descending=False):
+    """Return (items, next_cursor) for one page ordered by (time_field, id).
+
+    The cursor holds the last row's key, so every page is an index range
+    scan of page_size + 1 rows no matter how deep it is.
+    """
+    if descending:
+        queryset = queryset.order_by(f'-{time_field}', '-id')
+    else:
+        queryset = queryset.order_by(time_field, 'id')
+
+    if cursor:
+        after_micros, after_id = decode_cursor(cursor, 2)
+        after_time = micros_to_timestamp(after_micros)
+        direction = 'lt' if descending else 'gt'
+        queryset = queryset.filter(
+            Q(**{f'{time_field}__{direction}': after_time}) |
+            Q(**{time_field: after_time, f'id__{direction}': after_id})
+        )
+
+    items = list(queryset[:page_size + 1])
+    if len(items) <= page_size:
+        return items, None
+    items = items[:page_size]
+    last = items[-1]
+    return items, encode_cursor(timestamp_to_micros(getattr(last, time_field)), last.id)
@@ -0,0 +1,320 @@
+# api/dataset.py
+
+import math
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from time import perf_counter
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import (
+    AttendanceRecord, AttendanceRollup, AttendanceSession, SessionSnapshot, StudentProfile, StudentSubjectAttendance,
+    Subject, TeacherProfile, User
+)
+
+EMAIL_DOMAIN = 'campus.example.com'
+DEPARTMENTS = [
+    ('CE', 'Computer Engineering'),
+    ('IT', 'Information Technology'),
+    ('ME', 'Mechanical Engineering'),
+    ('CV', 'Civil Engineering'),
+    ('EE', 'Electrical Engineering'),
+    ('EC', 'Electronics and Communication Engineering'),
+    ('CH', 'Chemical Engineering'),
+    ('AU', 'Automobile Engineering'),
+]
+SEMESTERS = 8
+FIRST_NAMES = [
+    'Aarav', 'Aditi', 'Ananya', 'Arjun', 'Dev', 'Diya', 'Ishaan', 'Kavya', 'Krish', 'Meera', 'Neha', 'Nikhil',
+    'Pooja', 'Priya', 'Rahul', 'Riya', 'Rohan', 'Saanvi', 'Sahil', 'Shreya', 'Tanvi', 'Varun', 'Vihaan', 'Zara',
+]
+LAST_NAMES = [
+    'Bhatt', 'Chauhan', 'Desai', 'Gandhi', 'Iyer', 'Jain', 'Joshi', 'Kapoor', 'Mehta', 'Modi', 'Nair', 'Parekh',
+    'Patel', 'Rao', 'Reddy', 'Shah', 'Sharma', 'Singh', 'Trivedi', 'Verma',
+]
+TOPICS = [
+    'Mathematics', 'Physics', 'Programming', 'Data Structures', 'Algorithms', 'Databases', 'Networks',
+    'Operating Systems', 'Thermodynamics', 'Mechanics', 'Circuits', 'Signals', 'Control Systems', 'Materials',
+    'Design', 'Statistics', 'Economics', 'Communication Skills', 'Machine Learning', 'Project Management',
+]
+# Lecture slots: weekdays Monday-Friday, hours around a lunch break
+LECTURE_HOURS = (9, 10, 11, 12, 14, 15, 16)
+LECTURE_MINUTES = 50
+# Share of scheduled lectures that do not happen (holidays, absent teacher)
+CANCELLED_SHARE = 0.03
+# Share of records a teacher later invalidates
+INVALIDATED_SHARE = 0.004
+RECORD_COLUMNS = ['session_id', 'student_id', 'qr_code_used', 'marked_at', 'is_valid', 'invalidated_at']
+
+
+@dataclass
+class DatasetSpec:
+    seed: int = 42
+    departments: int = 6
+    students: int = 6000
+    teachers: int = 300
+    subjects: int = 400
+    weeks: int = 16
+    lectures_per_week: int = 3
+    start: date = date(2025, 7, 7)
+    password: str = 'password123'
+    batch_size: int = 5000
+
+
+class DatasetGenerator:
+    """Deterministic synthetic campus for measuring behaviour at scale.
+
+    Students and subjects are spread evenly over department × semester
+    cohorts; each subject is taught by a teacher of its department in fixed
+    weekly slots. Every student gets an attendance propensity (most attend
+    three lectures in four, a tail are defaulters), lowered on early mornings,
+    Fridays and mid-semester, and arrivals follow a log-normal curve from the
+    start of the lecture. The same spec and seed always give the same rows
+    (ids aside). Snapshots, session counters and the summary tables are filled
+    in too, so every read path sees consistent data.
+    """
+
+    def __init__(self, spec, log=None):
+        if not 1 <= spec.departments <= len(DEPARTMENTS):
+            raise ValueError(f'departments must be between 1 and {len(DEPARTMENTS)}')
+        if not 1 <= spec.lectures_per_week <= 5 * len(LECTURE_HOURS):
+            raise ValueError(f'lectures_per_week must be between 1 and {5 * len(LECTURE_HOURS)}')
+        if spec.teachers < spec.departments or spec.subjects < 1 or spec.students < 1:
+            raise ValueError('every department needs a teacher, and there must be students and subjects')
+        self.spec = spec
+        self.log = log or (lambda message: None)
+        self.rng = np.random.default_rng(spec.seed)
+        self.departments = DEPARTMENTS[:spec.departments]
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name):
+        started = perf_counter()
+        yield
+        self.log(f'{name}: {perf_counter() - started:.1f}s')
+
+    def generate(self):
+        """Write the whole campus in one transaction; returns row counts per model"""
+        if User.objects.filter(email__endswith=f'@{EMAIL_DOMAIN}').exists():
+            raise ValueError('This database already holds a generated dataset; start from an empty one')
+        with transaction.atomic():
+            with self.phase('accounts'):
+                cohorts, teachers = self.create_accounts()
+            with self.phase('subjects'):
+                subjects = self.create_subjects(teachers)
+            with self.phase('sessions'):
+                sessions = self.create_sessions(subjects)
+            with self.phase('attendance'):
+                self.create_attendance(sessions, cohorts)
+            with self.phase('summaries'):
+                self.counts['summaries'] = StudentSubjectAttendance.objects.rebuild()
+                self.counts['rollup cells'] = AttendanceRollup.objects.rebuild()
+        return self.counts
+
+    def names(self, count):
+        first = self.rng.choice(FIRST_NAMES, count)
+        last = self.rng.choice(LAST_NAMES, count)
+        return [f'{first_name} {last_name}' for first_name, last_name in zip(first, last)]
+
+    def create_accounts(self):
+        """Students per (department, semester) cohort and teachers per department"""
+        spec = self.spec
+        encoded = make_password(spec.password)  # one hash shared by every account
+        cohort_keys = [(code, semester) for code, _ in self.departments for semester in range(1, SEMESTERS + 1)]
+        department_names = dict(self.departments)
+        intake_year = spec.start.year
+
+        users = User.objects.bulk_create(
+            (User(email=f'student{number:06d}@{EMAIL_DOMAIN}', password=encoded, role='student')
+             for number in range(spec.students)),
+            batch_size=spec.batch_size
+        )
+        profiles = []
+        for number, (user, full_name) in enumerate(zip(users, self.names(spec.students))):
+            code, semester = cohort_keys[number % len(cohort_keys)]
+            profiles.append(StudentProfile(
+                user=user, full_name=full_name, department=department_names[code], semester=semester,
+                enrollment_number=f'{intake_year - (semester - 1) // 2}{code}{number:06d}'
+            ))
+        StudentProfile.objects.bulk_create(profiles, batch_size=spec.batch_size)
+
+        # Cohort members sorted by enrollment number, with how likely each is to turn up
+        propensities = self.rng.beta(6, 1.8, spec.students)
+        cohorts = {key: ([], []) for key in cohort_keys}
+        for number, (profile, propensity) in enumerate(zip(profiles, propensities)):
+            members, chances = cohorts[cohort_keys[number % len(cohort_keys)]]
+            members.append(profile.enrollment_number)
+            chances.append(propensity)
+        cohorts = {
+            key: (np.array(members), np.array(chances)) for key, (members, chances) in cohorts.items()
+        }
+
+        teacher_users = User.objects.bulk_create(
+            (User(email=f'teacher{number:04d}@{EMAIL_DOMAIN}', password=encoded, role='teacher')
+             for number in range(spec.teachers)),
+            batch_size=spec.batch_size
+        )
+        teachers = TeacherProfile.objects.bulk_create(
+            (TeacherProfile(user=user, full_name=full_name, department=self.departments[number % len(self.departments)][1])
+             for number, (user, full_name) in enumerate(zip(teacher_users, self.names(spec.teachers)))),
+            batch_size=spec.batch_size
+        )
+        self.counts['students'] = len(profiles)
+        self.counts['teachers'] = len(teachers)
+        return cohorts, teachers
+
+    def create_subjects(self, teachers):
+        """Subjects spread over cohorts, each assigned to a teacher of its department in turn"""
+        spec = self.spec
+        cohort_keys = [(code, semester) for code, _ in self.departments for semester in range(1, SEMESTERS + 1)]
+        department_teachers = {
+            code: [teacher for teacher in teachers if teacher.department == name] for code, name in self.departments
+        }
+        per_cohort = {}
+        subjects = []
+        assignments = []
+        topics = self.rng.choice(TOPICS, spec.subjects)
+        for number in range(spec.subjects):
+            code, semester = cohort_keys[number % len(cohort_keys)]
+            index = per_cohort[(code, semester)] = per_cohort.get((code, semester), 0) + 1
+            candidates = department_teachers[code]
+            teacher = candidates[(number // len(cohort_keys)) % len(candidates)]
+            subjects.append(Subject(
+                subject_code=f'{code}{semester}{index:02d}', name=f'{topics[number]} {code}-{semester}.{index}',
+                semester=semester
+            ))
+            assignments.append(((code, semester), teacher))
+        if Subject.objects.filter(subject_code__in=[subject.subject_code for subject in subjects]).exists():
+            raise ValueError('Generated subject codes clash with existing subjects; start from an empty database')
+        subjects = Subject.objects.bulk_create(subjects, batch_size=spec.batch_size)
+        TeacherProfile.subjects.through.objects.bulk_create(
+            (TeacherProfile.subjects.through(teacherprofile_id=teacher.id, subject_id=subject.id)
+             for subject, (_, teacher) in zip(subjects, assignments)),
+            batch_size=spec.batch_size
+        )
+        self.counts['subjects'] = len(subjects)
+        return [(subject, cohort, teacher) for subject, (cohort, teacher) in zip(subjects, assignments)]
+
+    def create_sessions(self, subjects):
+        """A semester of weekly lectures per subject, created in the order they were held"""
+        spec = self.spec
+        slots = [(weekday, hour) for weekday in range(5) for hour in LECTURE_HOURS]
+        tz = timezone.get_current_timezone()
+        planned = []
+        for subject, cohort, teacher in subjects:
+            chosen = self.rng.choice(len(slots), spec.lectures_per_week, replace=False)
+            cancelled = self.rng.random((spec.weeks, spec.lectures_per_week)) < CANCELLED_SHARE
+            lecture = 0
+            for week in range(spec.weeks):
+                for slot, (weekday, hour) in enumerate(sorted(slots[index] for index in chosen)):
+                    if cancelled[week, slot]:
+                        continue
+                    lecture += 1
+                    day = spec.start + timedelta(weeks=week, days=weekday)
+                    start = timezone.make_aware(datetime.combine(day, time(hour)), tz)
+                    planned.append((start, subject, cohort, teacher, week, f'{subject.subject_code} Lecture {lecture}'))
+        planned.sort(key=lambda plan: (plan[0], plan[1].subject_code))
+
+        sessions = AttendanceSession.objects.bulk_create(
+            (AttendanceSession(teacher_id=teacher.user_id, subject=subject, session_name=name, is_active=False,
+                               end_time=start + timedelta(minutes=LECTURE_MINUTES))
+             for start, subject, _, teacher, _, name in planned),
+            batch_size=spec.batch_size
+        )
+        # start_time is auto_now_add, so bulk_create stamped it with the current time; finish_sessions writes these
+        for session, (start, *_) in zip(sessions, planned):
+            session.start_time = start
+        self.counts['sessions'] = len(sessions)
+        return [(session, cohort, week) for session, (_, _, cohort, _, week, _) in zip(sessions, planned)]
+
+    def attendance_chance(self, session, week):
+        """How much of their usual attendance students show at this lecture"""
+        local = timezone.localtime(session.start_time)
+        factor = 1 - 0.12 * math.sin(math.pi * (week + 0.5) / self.spec.weeks)  # mid-semester dip
+        if local.hour == LECTURE_HOURS[0]:
+            factor *= 0.93
+        if local.weekday() == 4:
+            factor *= 0.92
+        return factor * self.rng.normal(1, 0.04)
+
+    def create_attendance(self, sessions, cohorts):
+        """Records, snapshots and session counters, inserted in batches as the semester is simulated"""
+        spec = self.spec
+        rotation = settings.QR_ROTATION_SECONDS
+        records = []
+        snapshots = []
+        total = 0
+        for session, cohort, week in sessions:
+            members, chances = cohorts[cohort]
+            present = self.rng.random(len(members)) < chances * self.attendance_chance(session, week)
+            attendees = members[present]
+            offsets = np.clip(self.rng.lognormal(math.log(90), 0.9, len(attendees)), 5, LECTURE_MINUTES * 60 - 1)
+            invalid = self.rng.random(len(attendees)) < INVALIDATED_SHARE
+            start = session.start_time
+            start_seconds = start.timestamp()
+            end = session.end_time
+            valid = []
+            arrivals = []
+            for enrollment_number, offset, is_invalid in zip(attendees.tolist(), offsets.tolist(), invalid.tolist()):
+                marked_at = start + timedelta(seconds=offset)
+                window = int((start_seconds + offset) // rotation * rotation)
+                records.append((session.id, enrollment_number, f'{session.id}|{spec.seed}|{window}', marked_at,
+                                not is_invalid, end + timedelta(minutes=10) if is_invalid else None))
+                if not is_invalid:
+                    valid.append(enrollment_number)
+                    arrivals.append(marked_at)
+            session.valid_record_count = len(valid)
+            snapshots.append(SessionSnapshot(
+                session=session, present_count=len(valid), invalidated_count=len(attendees) - len(valid),
+                present=valid, first_arrival=min(arrivals, default=None), last_arrival=max(arrivals, default=None)
+            ))
+            if len(records) >= spec.batch_size:
+                total += self.insert_records(records)
+                records = []
+            if len(snapshots) >= 1000:
+                SessionSnapshot.objects.bulk_create(snapshots)
+                snapshots = []
+        total += self.insert_records(records)
+
+        SessionSnapshot.objects.bulk_create(snapshots, batch_size=1000)
+        self.finish_sessions([session for session, _, _ in sessions])
+        self.counts['records'] = total
+
+    def insert_records(self, rows):
+        """COPY on PostgreSQL, a parameterised executemany elsewhere; rows are in RECORD_COLUMNS order.
+
+        Both skip building a model instance per record, which is what limits
+        bulk_create at millions of rows.
+        """
+        if not rows:
+            return 0
+        table = connection.ops.quote_name(AttendanceRecord._meta.db_table)
+        columns = ', '.join(RECORD_COLUMNS)
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                with cursor.copy(f'COPY {table} ({columns}) FROM STDIN') as copy:
+                    for row in rows:
+                        copy.write_row(row)
+            else:
+                adapt = connection.ops.adapt_datetimefield_value
+                cursor.executemany(
+                    f"INSERT INTO {table} ({columns}) VALUES ({', '.join(['%s'] * len(RECORD_COLUMNS))})",
+                    [(session_id, student_id, qr_code_used, adapt(marked_at), is_valid, adapt(invalidated_at))
+                     for session_id, student_id, qr_code_used, marked_at, is_valid, invalidated_at in rows]
+                )
+        return len(rows)
+
+    def finish_sessions(self, sessions):
+        """Write the real start times (bulk_create stamped them with now) and the valid-record counters"""
+        table = connection.ops.quote_name(AttendanceSession._meta.db_table)
+        adapt = connection.ops.adapt_datetimefield_value
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'UPDATE {table} SET start_time = %s, valid_record_count = %s WHERE id = %s',
+                [(adapt(session.start_time), session.valid_record_count, session.id) for session in sessions]
+            )
@@ -0,0 +1,239 @@
+# api/events.py
+
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .qr_tokens import issue_token, signed_mode_enabled
+from .signals import attendance_invalidated, attendance_marked, qr_rotated, session_ended
+
+# Pushed to a subscriber whose queue overflowed; the stream closes and the client reconnects
+OVERFLOW = object()
+
+
+def session_channel(session_id):
+    return f"attendance-session:{session_id}"
+
+
+STREAM_TOKEN_SALT = 'api.events.session-stream'
+
+
+def issue_stream_token(session_id, user_id):
+    """Short-lived token that opens one session's event stream and nothing else.
+
+    EventSource cannot send an Authorization header, so the token travels in
+    the query string, where it ends up in access logs; unlike an access JWT it
+    is worthless once ATTENDANCE_EVENT_TOKEN_MAX_AGE has passed.
+    """
+    return signing.TimestampSigner(salt=STREAM_TOKEN_SALT).sign_object({'s': session_id, 'u': user_id})
+
+
+def verify_stream_token(token, session_id):
+    """Return the user id a stream token was issued to, or None if it is invalid, expired or for another session"""
+    try:
+        claims = signing.TimestampSigner(salt=STREAM_TOKEN_SALT).unsign_object(
+            token, max_age=settings.ATTENDANCE_EVENT_TOKEN_MAX_AGE
+        )
+    except signing.BadSignature:
+        return None
+    if claims.get('s') != session_id:
+        return None
+    return claims.get('u')
+
+
+def encode_event(event, data):
+    """Encode one server-sent event; done once per event, not once per viewer"""
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f"event: {event}\ndata: {payload}\n\n".encode()
+
+
+ENDED_PREFIX = b'event: ended\n'
+KEEPALIVE = b': keepalive\n\n'
+
+
+class Subscription:
+    """One viewer's queue of encoded events, bound to the event loop that reads it"""
+
+    def __init__(self, broker, channel, max_pending):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=max_pending)
+
+    def deliver(self, message):
+        # Publishers run in worker threads, so hand the message over to the loop
+        try:
+            self.loop.call_soon_threadsafe(self._put, message)
+        except RuntimeError:
+            self.close()
+
+    def _put(self, message):
+        if self.queue.full():
+            self.close()
+            self.queue.get_nowait()
+            self.queue.put_nowait(OVERFLOW)
+        else:
+            self.queue.put_nowait(message)
+
+    async def get(self, timeout):
+        """Return the next message, or None if nothing arrived within the timeout"""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """Fans events out to subscribers living in the same process.
+
+    Enough for a single ASGI worker and for tests; multi-process deployments
+    should point ATTENDANCE_EVENT_BROKER at a broker with the same interface.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel, settings.ATTENDANCE_EVENT_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscribers = list(self._subscribers.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(message)
+        return len(subscribers)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._subscribers.get(channel, ()))
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.ATTENDANCE_EVENT_BROKER)()
+    return _broker
+
+
+def publish(session_id, event, data):
+    """Publish an event to every viewer of a session once the transaction commits"""
+    message = encode_event(event, data)
+    transaction.on_commit(lambda: get_broker().publish(session_channel(session_id), message))
+
+
+async def stream_session_events(session_id, subscription, snapshot):
+    """Yield the initial snapshot, then every event published for the session"""
+    keepalive = settings.ATTENDANCE_EVENT_KEEPALIVE_SECONDS
+    try:
+        yield encode_event('snapshot', snapshot)
+        last_token = snapshot.get('qr_code')
+        idle_since = time.monotonic()
+        while True:
+            timeout = keepalive - (time.monotonic() - idle_since)
+
+            # Signed tokens rotate with the clock, so the stream announces them itself
+            if signed_mode_enabled():
+                token, expires_at = issue_token(session_id)
+                if token != last_token:
+                    last_token = token
+                    yield encode_event('qr', {'qr_code': token, 'expires_at': expires_at})
+                    idle_since = time.monotonic()
+                timeout = min(timeout, (expires_at - timezone.now()).total_seconds())
+
+            message = await subscription.get(max(timeout, 0.05))
+            if message is OVERFLOW:
+                return
+            if message is not None:
+                yield message
+                idle_since = time.monotonic()
+                if message.startswith(ENDED_PREFIX):
+                    return
+            elif time.monotonic() - idle_since >= keepalive:
+                yield KEEPALIVE
+                idle_since = time.monotonic()
+    finally:
+        subscription.close()
+
+
+async def _subscribe(channel):
+    # Subscriptions bind to the running loop, so create this one inside it
+    return get_broker().subscribe(channel)
+
+
+def iterate_session_events(session_id, load_snapshot):
+    """Blocking twin of stream_session_events for WSGI servers such as runserver.
+
+    WSGI only consumes sync iterators, so the same generator is driven on an
+    event loop private to the worker thread. The subscription is taken before
+    load_snapshot() runs, so no record falls between the two. Each viewer
+    holds a worker thread until the stream ends; serve through ClassCue.asgi
+    when many viewers are expected.
+    """
+    loop = asyncio.new_event_loop()
+    events = None
+    try:
+        subscription = loop.run_until_complete(_subscribe(session_channel(session_id)))
+        events = stream_session_events(session_id, subscription, load_snapshot())
+        while True:
+            try:
+                yield loop.run_until_complete(events.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        # Also runs when the client disconnects and the server closes the iterator
+        if events is not None:
+            loop.run_until_complete(events.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
+
+
+@receiver(attendance_marked)
+def publish_attendance_marked(sender, session_id, records, **kwargs):
+    for record in records:
+        publish(session_id, 'attendance', record)
+
+
+@receiver(attendance_invalidated)
+def publish_attendance_invalidated(sender, session_id, record, **kwargs):
+    publish(session_id, 'invalidated', {'id': record.id, 'invalidated_at': record.invalidated_at})
+
+
+@receiver(qr_rotated)
+def publish_qr_rotated(sender, session_id, qr_code, expires_at, **kwargs):
+    publish(session_id, 'qr', {'qr_code': qr_code, 'expires_at': expires_at})
+
+
+@receiver(session_ended)
+def publish_session_ended(sender, session, **kwargs):
+    publish(session.id, 'ended', {'session_id': session.id, 'end_time': session.end_time})
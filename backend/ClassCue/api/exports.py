@@ -0,0 +1,135 @@
+# api/exports.py
+
+import csv
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+from .models import AttendanceRecord
+
+EXPORT_COLUMNS = [
+    ('record_id', 'id'),
+    ('session_id', 'session_id'),
+    ('session_name', 'session__session_name'),
+    ('session_start', 'session__start_time'),
+    ('subject_code', 'session__subject__subject_code'),
+    ('subject_name', 'session__subject__name'),
+    ('enrollment_number', 'student_id'),
+    ('student_name', 'student__full_name'),
+    ('department', 'student__department'),
+    ('semester', 'student__semester'),
+    ('marked_at', 'marked_at'),
+    ('is_valid', 'is_valid'),
+    ('invalidated_at', 'invalidated_at'),
+]
+EXPORT_FIELDS = [name for name, _ in EXPORT_COLUMNS]
+
+
+def attendance_export_rows(department=None, semester=None, subject_codes=None, since=None, until=None, chunk_size=None):
+    """Yield every matching attendance record as a flat dict, in id order.
+
+    Rows come from .iterator(), which uses a server-side cursor on PostgreSQL
+    and fetches chunk_size rows at a time elsewhere, so memory does not grow
+    with the export. Department and semester are the student's; the date
+    range applies to the day the session started.
+    """
+    records = AttendanceRecord.objects.order_by('id')
+    if department:
+        records = records.filter(student__department=department)
+    if semester is not None:
+        records = records.filter(student__semester=semester)
+    if subject_codes:
+        records = records.filter(session__subject__subject_code__in=subject_codes)
+    if since is not None:
+        records = records.filter(session__start_time__date__gte=since)
+    if until is not None:
+        records = records.filter(session__start_time__date__lte=until)
+
+    lookups = [lookup for _, lookup in EXPORT_COLUMNS]
+    for values in records.values_list(*lookups).iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE):
+        row = dict(zip(EXPORT_FIELDS, values))
+        for name in ('session_start', 'marked_at', 'invalidated_at'):
+            if row[name] is not None:
+                row[name] = row[name].isoformat()
+        yield row
+
+
+class Echo:
+    """File-like object whose write() hands the line back, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows, fields):
+    writer = csv.DictWriter(Echo(), fieldnames=fields)
+    yield writer.writeheader()
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_json(rows):
+    """A JSON array written one element at a time"""
+    separator = '['
+    for row in rows:
+        yield separator + json.dumps(row, cls=DjangoJSONEncoder)
+        separator = ','
+    yield ']' if separator == ',' else '[]'
+
+
+def stream_jsonl(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+def batched_bytes(pieces, batch_size=500):
+    """Join text pieces into UTF-8 blocks of batch_size pieces, so the server writes blocks rather than lines"""
+    batch = []
+    for piece in pieces:
+        batch.append(piece)
+        if len(batch) >= batch_size:
+            yield ''.join(batch).encode()
+            batch = []
+    if batch:
+        yield ''.join(batch).encode()
+
+
+def gzip_stream(blocks):
+    compressor = zlib.compressobj(wbits=31)  # 31: gzip container
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def iterate_in_thread(iterator):
+    """Async view of a sync iterator that queries the database, one thread hop per block.
+
+    The ASGI handler would otherwise read a sync iterator to the end into a
+    list before sending anything.
+    """
+    done = object()
+    next_block = sync_to_async(next, thread_sensitive=True)
+    while (block := await next_block(iterator, done)) is not done:
+        yield block
+
+
+def streaming_response(request, pieces, content_type, filename=None, compress=False):
+    """StreamingHttpResponse over text pieces, optionally gzipped, async under ASGI"""
+    blocks = batched_bytes(pieces)
+    if compress:
+        blocks = gzip_stream(blocks)
+        content_type = 'application/gzip'
+        filename = filename and f'{filename}.gz'
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        blocks = iterate_in_thread(blocks)
+    response = StreamingHttpResponse(blocks, content_type=content_type)
+    if filename:
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,95 @@
+# api/hashing.py
+
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, get_hasher, identify_hasher, make_password
+
+
+class HashingPoolSaturated(Exception):
+    """Raised when every hashing slot is taken and the request should be shed"""
+
+
+class PasswordHashingPool:
+    """Bounded pool for password hashing with admission control.
+
+    At most `workers` hashes run at once and at most `max_pending` more may
+    wait; anything beyond that is refused immediately instead of queueing
+    until the client times out. Threads are enough because hashlib's PBKDF2
+    releases the GIL while it runs.
+    """
+
+    def __init__(self, workers, max_pending):
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='password-hash')
+        self._slots = threading.BoundedSemaphore(workers + max_pending)
+
+    def run(self, fn, *args, timeout=None):
+        if not self._slots.acquire(blocking=False):
+            raise HashingPoolSaturated()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future.result(timeout)
+
+    def check_password(self, raw_password, encoded, timeout=None):
+        """Verify a password against a stored hash without saving anything"""
+        return self.run(check_password, raw_password, encoded, timeout=timeout)
+
+    def make_password(self, raw_password, timeout=None):
+        return self.run(make_password, raw_password, timeout=timeout)
+
+
+def password_needs_rehash(encoded):
+    """Same upgrade rule as User.check_password, minus the hashing"""
+    preferred = get_hasher('default')
+    try:
+        hasher = identify_hasher(encoded)
+    except ValueError:
+        return False
+    return hasher.algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_hashing_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PasswordHashingPool(settings.LOGIN_HASH_WORKERS, settings.LOGIN_HASH_QUEUE)
+    return _pool
+
+
+def _configure_hashing_process(password_hashers):
+    # Spawned workers need the hasher list and nothing else from the project
+    settings.configure(PASSWORD_HASHERS=password_hashers)
+
+
+def hash_passwords(passwords, workers=None):
+    """Yield make_password() of each password, in order, hashed across worker processes.
+
+    For bulk imports, where thousands of PBKDF2 runs would otherwise take
+    minutes on one core. Every hash is submitted up front, so callers storing
+    earlier results overlap with hashing of later ones. Workers are spawned
+    rather than forked, which is safe from a threaded server process.
+    """
+    passwords = list(passwords)
+    workers = min(workers or settings.IMPORT_HASH_WORKERS, len(passwords))
+    if workers < 2:
+        yield from map(make_password, passwords)
+        return
+    executor = ProcessPoolExecutor(
+        workers, mp_context=multiprocessing.get_context('spawn'),
+        initializer=_configure_hashing_process, initargs=(list(settings.PASSWORD_HASHERS),)
+    )
+    try:
+        yield from executor.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 8)))
+    finally:
+        executor.shutdown(cancel_futures=True)
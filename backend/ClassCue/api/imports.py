@@ -0,0 +1,188 @@
+# api/imports.py
+
+import csv
+from contextlib import closing
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import DatabaseError, transaction
+
+from .hashing import hash_passwords
+from .models import StudentProfile, TeacherProfile, User
+
+IMPORT_COLUMNS = {
+    'student': ['email', 'password', 'full_name', 'enrollment_number', 'department', 'semester'],
+    'teacher': ['email', 'password', 'full_name', 'department'],
+}
+REPORT_FIELDS = ['row', 'status', 'email', 'enrollment_number', 'errors']
+LOOKUP_CHUNK_SIZE = 500
+
+
+def _chunks(items, size):
+    items = iter(items)
+    while chunk := list(islice(items, size)):
+        yield chunk
+
+
+def _clean_row(values, role):
+    """Normalised account fields and a list of problems for one CSV row"""
+    row = {name: (values.get(name) or '').strip() for name in IMPORT_COLUMNS[role]}
+    errors = [f'{name} is required' for name, value in row.items() if not value]
+    if row['email']:
+        row['email'] = User.objects.normalize_email(row['email'])
+        try:
+            validate_email(row['email'])
+        except ValidationError:
+            errors.append('email is not a valid address')
+    if row['password']:
+        # The AUTH_PASSWORD_VALIDATORS a password set through the site has to pass
+        try:
+            validate_password(row['password'], User(email=row['email'], role=role))
+        except ValidationError as e:
+            errors.extend(f'password: {message}' for message in e.messages)
+    for name, limit in (('full_name', 100), ('department', 100), ('enrollment_number', 20)):
+        if len(row.get(name, '')) > limit:
+            errors.append(f'{name} is longer than {limit} characters')
+    if row.get('semester'):
+        try:
+            row['semester'] = int(row['semester'])
+        except ValueError:
+            row['semester'] = None
+        if not row['semester'] or row['semester'] < 1:
+            errors.append('semester must be a positive whole number')
+    return row, errors
+
+
+def validate_import(lines, role):
+    """Read and check a whole CSV file of accounts in one pass.
+
+    Returns (accounts, report): the rows to create and a report entry for
+    every other row. Rows whose account already exists with the same role
+    (and enrollment number) are reported as skipped rather than invalid, so
+    re-running an interrupted import picks up where it stopped. Raises
+    ValueError when the header lacks a required column.
+    """
+    reader = csv.DictReader(lines)
+    missing = [name for name in IMPORT_COLUMNS[role] if name not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"missing column(s): {', '.join(missing)}")
+
+    rows = []
+    first_seen = {}
+    for values in reader:
+        row, errors = _clean_row(values, role)
+        for name in ('email', 'enrollment_number'):
+            key = (name, row.get(name))
+            if not row.get(name):
+                continue
+            if key in first_seen:
+                errors.append(f'{name} repeats row {first_seen[key]}')
+            else:
+                first_seen[key] = reader.line_num
+        rows.append((reader.line_num, row, errors))
+
+    # Accounts that already exist, looked up in chunks of the file's emails and enrollment numbers
+    existing_users = {}
+    existing_enrollments = set()
+    emails = [row['email'] for _, row, _ in rows if row['email']]
+    for chunk in _chunks(emails, LOOKUP_CHUNK_SIZE):
+        users = User.objects.filter(email__in=chunk).values_list(
+            'email', 'role', 'studentprofile__enrollment_number', 'teacherprofile__id'
+        )
+        existing_users.update((email, (user_role, enrollment_number, teacher_id))
+                              for email, user_role, enrollment_number, teacher_id in users)
+    if role == 'student':
+        enrollment_numbers = [row['enrollment_number'] for _, row, _ in rows if row['enrollment_number']]
+        for chunk in _chunks(enrollment_numbers, LOOKUP_CHUNK_SIZE):
+            existing_enrollments.update(
+                StudentProfile.objects.filter(enrollment_number__in=chunk).values_list('enrollment_number', flat=True)
+            )
+
+    accounts = []
+    report = []
+    for line, row, errors in rows:
+        existing = existing_users.get(row['email'])
+        if not errors and existing is not None:
+            user_role, enrollment_number, teacher_id = existing
+            imported = user_role == role and (
+                enrollment_number == row['enrollment_number'] if role == 'student' else teacher_id is not None
+            )
+            if imported:
+                report.append(report_entry(line, row, 'skipped', ['account already exists']))
+                continue
+            errors.append('email is already registered')
+        if role == 'student' and row['enrollment_number'] in existing_enrollments and existing is None:
+            errors.append('enrollment_number is already registered')
+        if errors:
+            report.append(report_entry(line, row, 'invalid', errors))
+        else:
+            accounts.append((line, row))
+    return accounts, report
+
+
+def report_entry(line, row, status, errors=()):
+    return {
+        'row': line,
+        'status': status,
+        'email': row.get('email', ''),
+        'enrollment_number': row.get('enrollment_number', ''),
+        'errors': '; '.join(errors),
+    }
+
+
+def _create_batch(batch, hashes, role):
+    users = [
+        User(email=row['email'], password=password, role=role)
+        for (_, row), password in zip(batch, hashes)
+    ]
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        if users and users[0].pk is None:
+            # Backends that cannot return ids from a bulk insert
+            ids = dict(User.objects.filter(email__in=[user.email for user in users]).values_list('email', 'id'))
+            for user in users:
+                user.pk = ids[user.email]
+        if role == 'student':
+            StudentProfile.objects.bulk_create([
+                StudentProfile(
+                    user=user, full_name=row['full_name'], enrollment_number=row['enrollment_number'],
+                    department=row['department'], semester=row['semester']
+                )
+                for (_, row), user in zip(batch, users)
+            ])
+        else:
+            TeacherProfile.objects.bulk_create([
+                TeacherProfile(user=user, full_name=row['full_name'], department=row['department'])
+                for (_, row), user in zip(batch, users)
+            ])
+
+
+def import_accounts(lines, role, batch_size=None, workers=None, dry_run=False):
+    """Create the student or teacher accounts listed in a CSV file; returns one report entry per row.
+
+    Passwords are hashed across worker processes while earlier batches are
+    inserted. Each batch of users and profiles is bulk-inserted in its own
+    transaction, so a failure loses at most that batch; its rows are
+    reported as failed and the file can simply be imported again. Save
+    signals do not fire, which is fine for accounts nothing has cached yet.
+    """
+    if role not in IMPORT_COLUMNS:
+        raise ValueError(f"role must be one of {', '.join(IMPORT_COLUMNS)}")
+    accounts, report = validate_import(lines, role)
+    if dry_run:
+        report.extend(report_entry(line, row, 'valid') for line, row in accounts)
+        return sorted(report, key=lambda entry: entry['row'])
+
+    with closing(hash_passwords((row['password'] for _, row in accounts), workers)) as hashes:
+        for batch in _chunks(accounts, batch_size or settings.IMPORT_BATCH_SIZE):
+            batch_hashes = list(islice(hashes, len(batch)))
+            try:
+                _create_batch(batch, batch_hashes, role)
+            except DatabaseError as e:
+                report.extend(report_entry(line, row, 'failed', [str(e)]) for line, row in batch)
+            else:
+                report.extend(report_entry(line, row, 'created') for line, row in batch)
+    return sorted(report, key=lambda entry: entry['row'])
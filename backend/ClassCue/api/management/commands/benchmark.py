@@ -0,0 +1,75 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from api.benchmarks import Fixture, compare, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = 'Run the hot-path microbenchmarks on a throwaway SQLite database and compare them with a baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--baseline', default=str(settings.BASE_DIR / 'benchmark_baseline.json'),
+                            help='Baseline JSON file to compare against')
+        parser.add_argument('--tolerance', type=float, default=0.5,
+                            help='Allowed slowdown over the baseline before a benchmark counts as a regression')
+        parser.add_argument('--queries-only', action='store_true',
+                            help='Only enforce query budgets (timings depend on the machine the baseline came from)')
+        parser.add_argument('--repeat', type=int, default=5, help='Rounds per benchmark; the best round is reported')
+        parser.add_argument('--filter', default=None, help='Only run benchmarks whose name contains this text')
+        parser.add_argument('--update-baseline', action='store_true', help='Write the results as the new baseline')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('Benchmarks run offline against SQLite; run with DB_ENGINE=sqlite')
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            cache.clear()
+            results = run_benchmarks(Fixture(), repeat=options['repeat'], pattern=options['filter'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        baseline_path = Path(options['baseline'])
+        baseline = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+        self.report(results, baseline)
+
+        if options['update_baseline']:
+            baseline.update(results)
+            baseline_path.write_text(json.dumps(baseline, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Baseline written to {baseline_path}'))
+            return
+
+        tolerance = float('inf') if options['queries_only'] else options['tolerance']
+        regressions = compare(results, baseline, tolerance)
+        for name, reason in regressions:
+            self.stdout.write(self.style.ERROR(f'REGRESSION {name}: {reason}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regression(s) against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def report(self, results, baseline):
+        self.stdout.write(f"{'benchmark':<52}{'per call':>12}{'baseline':>12}{'change':>9}{'queries':>9}")
+        for name, result in results.items():
+            expected = baseline.get(name)
+            change = f"{result['seconds'] / expected['seconds'] - 1:+.0%}" if expected else '-'
+            self.stdout.write(
+                f"{name:<52}{format_seconds(result['seconds']):>12}"
+                f"{format_seconds(expected['seconds']) if expected else '-':>12}{change:>9}"
+                f"{result['queries'] if result['queries'] is not None else '-':>9}"
+            )
+
+
+def format_seconds(seconds):
+    if seconds >= 1:
+        return f'{seconds:.2f}s'
+    if seconds >= 1e-3:
+        return f'{seconds * 1e3:.2f}ms'
+    return f'{seconds * 1e6:.1f}us'
@@ -0,0 +1,37 @@
+import itertools
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.mark_log import MarkLog, MarkLogLocked, mark_log_slot
+
+
+class Command(BaseCommand):
+    help = (
+        'Replay every per-process attendance mark log into AttendanceRecord '
+        '(safe to run repeatedly; refuses while a server holds any of the logs)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.ATTENDANCE_MARK_LOG_PATH, help='Mark log file to replay')
+
+    def handle(self, *args, **options):
+        # Lock every slot before committing anything, so a running server is never raced
+        mark_logs = []
+        try:
+            for index in itertools.count():
+                path = mark_log_slot(options['path'], index)
+                if not path.exists():
+                    break
+                try:
+                    mark_logs.append(MarkLog(
+                        path, batch_size=settings.ATTENDANCE_GROUP_COMMIT_SIZE,
+                        max_attempts=settings.ATTENDANCE_MARK_LOG_MAX_ATTEMPTS
+                    ))
+                except MarkLogLocked:
+                    raise CommandError(f'{path} is held by a running server; stop it before replaying the log')
+            committed = sum(mark_log.commit_pending() for mark_log in mark_logs)
+        finally:
+            for mark_log in mark_logs:
+                mark_log.stop()
+        self.stdout.write(self.style.SUCCESS(f'Committed {committed} logged scans'))
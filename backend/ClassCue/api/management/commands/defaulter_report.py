@@ -0,0 +1,38 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.exports import stream_csv, stream_json
+from api.reports import DEFAULTER_FIELDS, defaulter_rows
+
+
+class Command(BaseCommand):
+    help = "Write the students below the attendance threshold in each of a department's subjects"
+
+    def add_arguments(self, parser):
+        parser.add_argument('department', help='Department name, as stored on student and teacher profiles')
+        parser.add_argument('--semester', type=int, help='Only subjects of this semester')
+        parser.add_argument('--subject', action='append', dest='subject_codes', metavar='CODE',
+                            help='Only this subject code (repeatable)')
+        parser.add_argument('--threshold', type=int, help='Attendance percentage (default ATTENDANCE_THRESHOLD_PERCENT)')
+        parser.add_argument('--since', type=date.fromisoformat, help='Only sessions held on or after this date')
+        parser.add_argument('--until', type=date.fromisoformat, help='Only sessions held on or before this date')
+        parser.add_argument('--all', action='store_true', help='List every student, not only defaulters')
+        parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+        parser.add_argument('--output', help='File to write (default stdout)')
+
+    def handle(self, *args, **options):
+        rows = defaulter_rows(
+            options['department'], options['semester'], options['subject_codes'], options['threshold'],
+            options['since'], options['until'], include_all=options['all']
+        )
+        chunks = stream_csv(rows, DEFAULTER_FIELDS) if options['format'] == 'csv' else stream_json(rows)
+        try:
+            if options['output']:
+                with open(options['output'], 'w', newline='') as output:
+                    output.writelines(chunks)
+            else:
+                for chunk in chunks:
+                    self.stdout.write(chunk, ending='')
+        except ValueError as e:
+            raise CommandError(e)
@@ -0,0 +1,32 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from api.exports import EXPORT_FIELDS, attendance_export_rows, batched_bytes, gzip_stream, stream_csv, stream_jsonl
+
+
+class Command(BaseCommand):
+    help = 'Stream attendance records to a CSV or JSON-lines file in constant memory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='File to write')
+        parser.add_argument('--department', help="Only students of this department")
+        parser.add_argument('--semester', type=int, help="Only students of this semester")
+        parser.add_argument('--subject', action='append', dest='subject_codes', metavar='CODE',
+                            help='Only this subject code (repeatable)')
+        parser.add_argument('--since', type=date.fromisoformat, help='Only sessions held on or after this date')
+        parser.add_argument('--until', type=date.fromisoformat, help='Only sessions held on or before this date')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], default='csv')
+        parser.add_argument('--gzip', action='store_true', help='Compress the output')
+
+    def handle(self, *args, **options):
+        rows = attendance_export_rows(
+            options['department'], options['semester'], options['subject_codes'], options['since'], options['until']
+        )
+        pieces = stream_csv(rows, EXPORT_FIELDS) if options['format'] == 'csv' else stream_jsonl(rows)
+        blocks = batched_bytes(pieces)
+        if options['gzip']:
+            blocks = gzip_stream(blocks)
+        with open(options['output'], 'wb') as output:
+            output.writelines(blocks)
+        self.stdout.write(self.style.SUCCESS(f"Exported attendance to {options['output']}"))
@@ -0,0 +1,40 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.dataset import DatasetGenerator, DatasetSpec
+
+DEFAULTS = DatasetSpec()
+
+
+class Command(BaseCommand):
+    help = 'Fill the database with a deterministic synthetic campus (accounts, subjects, a semester of attendance)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=DEFAULTS.seed)
+        parser.add_argument('--departments', type=int, default=DEFAULTS.departments)
+        parser.add_argument('--students', type=int, default=DEFAULTS.students)
+        parser.add_argument('--teachers', type=int, default=DEFAULTS.teachers)
+        parser.add_argument('--subjects', type=int, default=DEFAULTS.subjects)
+        parser.add_argument('--weeks', type=int, default=DEFAULTS.weeks, help='Length of the semester')
+        parser.add_argument('--lectures-per-week', type=int, default=DEFAULTS.lectures_per_week,
+                            help='Lectures of each subject per week')
+        parser.add_argument('--start', type=date.fromisoformat, default=DEFAULTS.start,
+                            help='Monday the semester starts (YYYY-MM-DD)')
+        parser.add_argument('--password', default=DEFAULTS.password, help='Password of every generated account')
+        parser.add_argument('--batch-size', type=int, default=DEFAULTS.batch_size, help='Rows per insert')
+
+    def handle(self, *args, **options):
+        spec = DatasetSpec(
+            seed=options['seed'], departments=options['departments'], students=options['students'],
+            teachers=options['teachers'], subjects=options['subjects'], weeks=options['weeks'],
+            lectures_per_week=options['lectures_per_week'], start=options['start'], password=options['password'],
+            batch_size=options['batch_size']
+        )
+        try:
+            counts = DatasetGenerator(spec, log=self.stdout.write).generate()
+        except ValueError as e:
+            raise CommandError(e)
+        summary = ', '.join(f'{count} {name}' for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Generated {summary}'))
+        self.stdout.write(f"Every account's password is {spec.password!r}")
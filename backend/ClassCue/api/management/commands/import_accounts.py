@@ -0,0 +1,44 @@
+import csv
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.imports import IMPORT_COLUMNS, REPORT_FIELDS, import_accounts
+
+
+class Command(BaseCommand):
+    help = 'Create student or teacher accounts from a CSV file; re-run the same file to resume an interrupted import'
+
+    def add_arguments(self, parser):
+        parser.add_argument('role', choices=list(IMPORT_COLUMNS))
+        parser.add_argument('file', help='CSV with a header row: ' + '; '.join(
+            f"{role}s: {', '.join(columns)}" for role, columns in IMPORT_COLUMNS.items()
+        ))
+        parser.add_argument('--report', help='Write the outcome of every row to this CSV file')
+        parser.add_argument('--batch-size', type=int, help='Accounts per transaction (default IMPORT_BATCH_SIZE)')
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default IMPORT_HASH_WORKERS)')
+        parser.add_argument('--dry-run', action='store_true', help='Only validate the file')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['file'], newline='', encoding='utf-8-sig') as lines:
+                report = import_accounts(
+                    lines, options['role'], options['batch_size'], options['workers'], options['dry_run']
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        if options['report']:
+            with open(options['report'], 'w', newline='') as output:
+                writer = csv.DictWriter(output, fieldnames=REPORT_FIELDS)
+                writer.writeheader()
+                writer.writerows(report)
+        else:
+            for entry in report:
+                if entry['status'] in ('invalid', 'failed'):
+                    self.stderr.write(f"Row {entry['row']}: {entry['status']}: {entry['errors']}")
+
+        counts = Counter(entry['status'] for entry in report)
+        summary = ', '.join(f'{count} {state}' for state, count in sorted(counts.items())) or 'no rows'
+        style = self.style.WARNING if counts['invalid'] or counts['failed'] else self.style.SUCCESS
+        self.stdout.write(style(f'Imported {options["role"]} accounts: {summary}'))
@@ -0,0 +1,329 @@
+import json
+import math
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+PASSWORD = 'loadtest-password'
+METRIC_LINE = re.compile(r'^classcue_request_(queries|sql_seconds)_(sum|count)\{view="([^"]*)",method="([^"]*)"\} (\S+)$')
+
+
+class HttpClient:
+    """Minimal JSON client over urllib so the harness needs nothing beyond the stdlib"""
+
+    def __init__(self, base_url, timeout):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+        self.token = None
+
+    def request(self, method, path, data=None, headers=None):
+        """Return (status, body, headers); status 0 means the request never got an answer"""
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        request.add_header('Content-Type', 'application/json')
+        if self.token:
+            request.add_header('Authorization', f'Bearer {self.token}')
+        for name, value in (headers or {}).items():
+            request.add_header(name, value)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read(), response.headers
+        except urllib.error.HTTPError as e:
+            return e.code, e.read(), e.headers
+        except (urllib.error.URLError, OSError) as e:
+            return 0, str(e).encode(), {}
+
+
+def classify(status, body):
+    """Bucket a response into ok or one of the error classes the report tracks"""
+    if 200 <= status < 400:
+        return 'ok'
+    text = body.decode(errors='replace')
+    if status == 0:
+        return 'timeout' if 'timed out' in text else 'connection'
+    if status == 429:
+        return 'shed'
+    if 'database is locked' in text or 'lock timeout' in text or 'deadlock' in text:
+        return 'lock_timeout'
+    if 'expired' in text:
+        return 'expired'
+    if 'already marked' in text:
+        return 'duplicate'
+    if status >= 500:
+        return 'server_error'
+    return f'http_{status}'
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    # Nearest rank: the smallest value with at least `fraction` of samples at or below it
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def call(self, client, endpoint, method, path, data=None, headers=None):
+        started = time.perf_counter()
+        status, body, response_headers = client.request(method, path, data, headers)
+        elapsed = time.perf_counter() - started
+        outcome = classify(status, body)
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append((started, elapsed, outcome))
+        return status, body, response_headers, outcome
+
+    def summary(self):
+        endpoints = {}
+        for endpoint, samples in self._samples.items():
+            latencies = sorted(elapsed for _, elapsed, _ in samples)
+            first = min(started for started, _, _ in samples)
+            last = max(started + elapsed for started, elapsed, _ in samples)
+            errors = {}
+            for _, _, outcome in samples:
+                if outcome != 'ok':
+                    errors[outcome] = errors.get(outcome, 0) + 1
+            endpoints[endpoint] = {
+                'requests': len(samples),
+                'ok': len(samples) - sum(errors.values()),
+                'throughput_rps': round(len(samples) / (last - first), 2) if last > first else None,
+                'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+                'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+                'max_ms': round(latencies[-1] * 1000, 2),
+                'errors': errors,
+            }
+        return endpoints
+
+
+def scrape_query_totals(client, token):
+    """Per-view query and SQL-time totals from the server's /metrics endpoint"""
+    headers = {'Authorization': f'Bearer {token}'} if token else {}
+    status, body, _ = HttpClient(client.base_url.rsplit('/api', 1)[0], client.timeout).request('GET', '/metrics', headers=headers)
+    if status != 200:
+        return None
+    totals = {}
+    for line in body.decode().splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            metric, kind, view, method = match.group(1, 2, 3, 4)
+            totals.setdefault(f'{method} {view}', {})[f'{metric}_{kind}'] = float(match.group(5))
+    return totals
+
+
+def query_delta(before, after):
+    if before is None or after is None:
+        return None
+    delta = {}
+    for view, values in after.items():
+        previous = before.get(view, {})
+        requests = values.get('queries_count', 0) - previous.get('queries_count', 0)
+        if requests:
+            delta[view] = {
+                'requests': int(requests),
+                'queries': int(values.get('queries_sum', 0) - previous.get('queries_sum', 0)),
+                'sql_seconds': round(values.get('sql_seconds_sum', 0) - previous.get('sql_seconds_sum', 0), 4),
+            }
+    return delta
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Replay a class-start burst (logins, QR polling, marks) against a running server and report latencies'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/api', help='API root of the server under test')
+        parser.add_argument('--students', type=int, default=100, help='Students in the lecture')
+        parser.add_argument('--concurrency', type=int, default=None, help='Client threads (default: one per student)')
+        parser.add_argument('--spread', type=float, default=10.0, help='Seconds over which marks arrive (the QR window)')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Teacher QR poll interval in seconds')
+        parser.add_argument('--subject-id', type=int, default=None, help='Subject for the session (default: first listed)')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+        parser.add_argument('--metrics-token', default='', help="The server's METRICS_TOKEN, for reading /metrics (not needed when it runs with DEBUG on)")
+        parser.add_argument('--seed', type=int, default=None, help='Seed for arrival times')
+        parser.add_argument('--output', default=None, help='Write machine-readable results to this JSON file')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.recorder = Recorder()
+        self.random = random.Random(options['seed'])
+        students = options['students']
+        concurrency = options['concurrency'] or students
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            self.stdout.write(f'Preparing {students} student accounts and one teacher...')
+            teacher = self.ensure_account('teacher', 0)
+            list(pool.map(lambda number: self.ensure_account('student', number), range(students)))
+
+            queries_before = scrape_query_totals(teacher, options['metrics_token'])
+            started = time.perf_counter()
+
+            # Everyone signs in as the lecture starts
+            self.stdout.write('Logging in...')
+            if self.login(teacher, 'teacher', 0) is None:
+                raise CommandError('Teacher login failed')
+            clients = list(pool.map(lambda number: self.login(self.client(), 'student', number), range(students)))
+            # Students whose login failed (already counted under login errors) never get to scan
+            clients = [client for client in clients if client is not None]
+
+            session_id = self.create_session(teacher)
+            qr = {'code': None}
+            qr_ready = threading.Event()
+            stop_polling = threading.Event()
+            poller = threading.Thread(target=self.poll_qr, args=(teacher, session_id, qr, qr_ready, stop_polling), daemon=True)
+            poller.start()
+            if not qr_ready.wait(options['timeout']):
+                raise CommandError('Teacher never received a QR code')
+
+            self.stdout.write(f'Marking {len(clients)} students over {options["spread"]}s...')
+            burst_start = time.monotonic()
+            offsets = [self.random.uniform(0, options['spread']) for _ in clients]
+            outcomes = list(pool.map(lambda args: self.mark(*args, qr, burst_start), zip(clients, offsets)))
+
+            stop_polling.set()
+            poller.join()
+            self.recorder.call(teacher, 'end_session', 'POST', f'/attendance/sessions/{session_id}/end/')
+            elapsed = time.perf_counter() - started
+
+        queries_after = scrape_query_totals(teacher, options['metrics_token'])
+        results = {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'commit': git_commit(),
+            'config': {key: options[key] for key in ('base_url', 'students', 'spread', 'poll_interval', 'seed')},
+            'concurrency': concurrency,
+            'session_id': session_id,
+            'elapsed_seconds': round(elapsed, 3),
+            'marks_accepted': outcomes.count('ok'),
+            'endpoints': self.recorder.summary(),
+            'queries': query_delta(queries_before, queries_after),
+        }
+        self.report(results)
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
+            self.stdout.write(f'Results written to {options["output"]}')
+
+    def client(self):
+        return HttpClient(self.options['base_url'], self.options['timeout'])
+
+    def credentials(self, role, number):
+        if role == 'teacher':
+            return 'loadtest-teacher@example.com', None
+        return f'loadtest-student-{number}@example.com', f'LT{number:08d}'
+
+    def ensure_account(self, role, number):
+        """Register the account unless it already exists from an earlier run"""
+        client = self.client()
+        email, enrollment_number = self.credentials(role, number)
+        if role == 'teacher':
+            path = '/register/teacher/'
+            data = {'email': email, 'password': PASSWORD, 'full_name': 'Load Test Teacher', 'department': 'Load Testing'}
+        else:
+            path = '/register/student/'
+            data = {
+                'email': email, 'password': PASSWORD, 'full_name': f'Load Test Student {number}',
+                'enrollment_number': enrollment_number, 'department': 'Load Testing', 'semester': 1,
+            }
+
+        # Setup is not measured; shed or locked requests are simply retried
+        deadline = time.monotonic() + self.options['timeout']
+        while True:
+            status, body, _ = client.request('POST', '/login/', {'email': email, 'password': PASSWORD, 'role': role})
+            if status == 200:
+                return client
+            if status == 401:
+                status, body, _ = client.request('POST', path, data)
+                if status == 201:
+                    return client
+            if time.monotonic() > deadline:
+                raise CommandError(f'Could not prepare {email}: {status} {body[:200]!r}')
+            time.sleep(random.uniform(0.5, 1.5))
+
+    def login(self, client, role, number):
+        email, enrollment_number = self.credentials(role, number)
+        identifier = enrollment_number or email
+        # Shed logins are retried after Retry-After (with jitter), as the app would
+        deadline = time.monotonic() + self.options['timeout']
+        while True:
+            status, body, headers, outcome = self.recorder.call(
+                client, 'login', 'POST', '/login/', {'email': identifier, 'password': PASSWORD, 'role': role}
+            )
+            if outcome == 'ok':
+                client.token = json.loads(body)['access']
+                return client
+            if outcome != 'shed' or time.monotonic() > deadline:
+                return None
+            time.sleep(float(headers.get('Retry-After', 1)) * (1 + random.random()))
+
+    def create_session(self, teacher):
+        subject_id = self.options['subject_id']
+        if subject_id is None:
+            status, body, _ = teacher.request('GET', '/subjects/')
+            subjects = json.loads(body) if status == 200 else []
+            if not subjects:
+                raise CommandError('No subjects on the server; create one or pass --subject-id')
+            subject_id = subjects[0]['id']
+        status, body, _, outcome = self.recorder.call(
+            teacher, 'create_session', 'POST', '/attendance/sessions/',
+            {'session_name': f'Load test {datetime.now():%Y-%m-%d %H:%M:%S}', 'subject_id': subject_id}
+        )
+        if outcome != 'ok':
+            raise CommandError(f'Could not create a session: {status} {body[:200]!r}')
+        return json.loads(body)['id']
+
+    def poll_qr(self, teacher, session_id, qr, qr_ready, stop_polling):
+        etag = None
+        while not stop_polling.is_set():
+            headers = {'If-None-Match': etag} if etag else {}
+            status, body, response_headers, _ = self.recorder.call(
+                teacher, 'qr', 'GET', f'/attendance/sessions/{session_id}/qr/', headers=headers
+            )
+            if status == 200:
+                qr['code'] = json.loads(body)['qr_code']
+                etag = response_headers.get('ETag')
+                qr_ready.set()
+            stop_polling.wait(self.options['poll_interval'])
+
+    def mark(self, client, offset, qr, burst_start):
+        delay = burst_start + offset - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        # Students scan whatever the projector shows at that moment
+        return self.recorder.call(client, 'mark', 'POST', '/attendance/mark/', {'qr_code': qr['code']})[3]
+
+    def report(self, results):
+        self.stdout.write('')
+        self.stdout.write(f"{'endpoint':<16}{'requests':>9}{'ok':>7}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  errors")
+        for endpoint, summary in results['endpoints'].items():
+            errors = ', '.join(f'{name}={count}' for name, count in sorted(summary['errors'].items())) or '-'
+            self.stdout.write(
+                f"{endpoint:<16}{summary['requests']:>9}{summary['ok']:>7}{summary['throughput_rps'] or 0:>9}"
+                f"{summary['p50_ms']:>10}{summary['p95_ms']:>10}{summary['p99_ms']:>10}  {errors}"
+            )
+        self.stdout.write(f"\nMarks accepted: {results['marks_accepted']}/{results['config']['students']}"
+                          f" in {results['elapsed_seconds']}s")
+        if results['queries'] is None:
+            self.stdout.write('Query totals unavailable (could not read /metrics)')
+        else:
+            for view, totals in sorted(results['queries'].items()):
+                self.stdout.write(
+                    f"  {view:<40} {totals['requests']:>6} requests {totals['queries']:>7} queries "
+                    f"{totals['sql_seconds']:>8}s SQL"
+                )
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from api.models import AttendanceRollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute the department/semester/subject/day attendance rollup from sessions and records'
+
+    def handle(self, *args, **options):
+        written = AttendanceRollup.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} rollup cells'))
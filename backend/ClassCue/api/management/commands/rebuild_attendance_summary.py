@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from api.models import StudentSubjectAttendance
+
+
+class Command(BaseCommand):
+    help = 'Recompute per-student, per-subject attendance summaries from sessions and records'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', action='append', dest='students', metavar='ENROLLMENT_NUMBER',
+                            help='Only rebuild this student (repeatable)')
+        parser.add_argument('--subject', action='append', dest='subjects', type=int, metavar='SUBJECT_ID',
+                            help='Only rebuild this subject (repeatable)')
+
+    def handle(self, *args, **options):
+        written = StudentSubjectAttendance.objects.rebuild(students=options['students'], subjects=options['subjects'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} student subject summaries'))
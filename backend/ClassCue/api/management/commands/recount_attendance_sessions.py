@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import ATTENDANCE_COUNTS, bump_version
+from api.models import AttendanceSession
+
+
+class Command(BaseCommand):
+    help = 'Recompute AttendanceSession.valid_record_count from attendance records'
+
+    def handle(self, *args, **options):
+        updated = AttendanceSession.objects.recount_records()
+        bump_version(ATTENDANCE_COUNTS)
+        self.stdout.write(self.style.SUCCESS(f'Recounted {updated} sessions'))
@@ -0,0 +1,64 @@
+import json
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = 'Summarize the slow-query journal, worst statement shapes first'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default=settings.SLOW_QUERY_LOG_PATH, help='Journal file (rotated backups are read too)')
+        parser.add_argument('--top', type=int, default=10, help='Number of statement shapes to show')
+        parser.add_argument('--sort', choices=['total', 'count', 'max'], default='total', help='Ranking order')
+
+    def handle(self, *args, **options):
+        shapes = {}
+        for entry in self.read_entries(Path(options['path'])):
+            summary = shapes.setdefault(entry['shape'], {
+                'sql': entry['sql'], 'count': 0, 'total': 0.0, 'max': 0.0, 'views': {}, 'plan': None,
+            })
+            summary['count'] += 1
+            summary['total'] += entry['duration_ms']
+            summary['max'] = max(summary['max'], entry['duration_ms'])
+            view = entry.get('view') or '(outside a request)'
+            summary['views'][view] = summary['views'].get(view, 0) + 1
+            if entry.get('plan'):
+                summary['plan'] = entry['plan']
+
+        if not shapes:
+            self.stdout.write('No slow queries recorded')
+            return
+
+        ranked = sorted(shapes.items(), key=lambda item: item[1][options['sort']], reverse=True)
+        for shape, summary in ranked[:options['top']]:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{shape}  count={summary['count']}  total={summary['total']:.1f}ms  "
+                f"avg={summary['total'] / summary['count']:.1f}ms  max={summary['max']:.1f}ms"
+            ))
+            views = ', '.join(f'{view} ({count})' for view, count in
+                              sorted(summary['views'].items(), key=lambda item: item[1], reverse=True))
+            self.stdout.write(f'  views: {views}')
+            self.stdout.write(f"  sql:   {summary['sql']}")
+            for line in summary['plan'] or []:
+                self.stdout.write(f'  plan:  {line}')
+
+    def read_entries(self, path):
+        for journal_path in self.journal_files(path):
+            with open(journal_path) as journal_file:
+                for line in journal_file:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def journal_files(self, path):
+        # RotatingFileHandler keeps path.1 .. path.N, higher numbers being older;
+        # reading oldest first lets the most recent plan for a shape win
+        backups = []
+        for backup in path.parent.glob(path.name + '.*'):
+            number = backup.name[len(path.name) + 1:]
+            if number.isdigit():
+                backups.append((int(number), backup))
+        return [backup for _, backup in sorted(backups, reverse=True)] + ([path] if path.exists() else [])
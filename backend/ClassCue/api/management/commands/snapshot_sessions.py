@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from api.models import AttendanceSession, SessionSnapshot
+
+
+class Command(BaseCommand):
+    help = 'Take attendance snapshots of ended sessions that do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--retake', action='store_true', help='Retake every ended session, not only missing ones')
+
+    def handle(self, *args, **options):
+        sessions = AttendanceSession.objects.filter(is_active=False).only('id')
+        if not options['retake']:
+            sessions = sessions.filter(snapshot__isnull=True)
+        taken = 0
+        for session in sessions.iterator():
+            SessionSnapshot.objects.take(session)
+            taken += 1
+        self.stdout.write(self.style.SUCCESS(f'Took {taken} session snapshots'))
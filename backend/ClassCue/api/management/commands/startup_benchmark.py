@@ -0,0 +1,68 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Runs in a fresh interpreter so nothing is already imported or set up
+PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import django
+from django.conf import settings
+settings.INSTALLED_APPS
+phases = {'settings': time.perf_counter() - started}
+django.setup()
+phases['setup'] = time.perf_counter() - started
+from django.urls import get_resolver
+get_resolver().url_patterns
+phases['urls'] = time.perf_counter() - started
+from django.test import Client
+client = Client()
+client.get('/metrics')
+phases['first_request'] = time.perf_counter() - started
+client.post('/api/login/', {}, content_type='application/json')
+phases['first_api_request'] = time.perf_counter() - started
+heavy = [name for name in ('qrcode', 'PIL', 'numpy', 'psycopg', 'psycopg2', 'pkg_resources') if name in sys.modules]
+print(json.dumps({'phases': phases, 'heavy_modules': heavy}))
+'''
+
+
+class Command(BaseCommand):
+    help = 'Measure cold start: settings import, app setup, URL loading and the first requests, in fresh interpreters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help='Fresh interpreters to start; medians are reported')
+        parser.add_argument('--output', default=None, help='Write the results to this JSON file')
+
+    def handle(self, *args, **options):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'ClassCue.settings')}
+        runs = []
+        for _ in range(options['runs']):
+            probe = subprocess.run(
+                [sys.executable, '-c', PROBE], cwd=settings.BASE_DIR, env=env, capture_output=True, text=True
+            )
+            if probe.returncode != 0:
+                raise CommandError(f'Startup probe failed:\n{probe.stderr}')
+            runs.append(json.loads(probe.stdout.strip().splitlines()[-1]))
+
+        # Phases are cumulative from interpreter start
+        results = {
+            'runs': options['runs'],
+            'median_ms': {
+                phase: round(statistics.median(run['phases'][phase] for run in runs) * 1000, 1)
+                for phase in runs[0]['phases']
+            },
+            'heavy_modules_after_first_requests': runs[-1]['heavy_modules'],
+        }
+        for phase, milliseconds in results['median_ms'].items():
+            self.stdout.write(f'{phase:<20}{milliseconds:>10.1f} ms')
+        heavy = ', '.join(results['heavy_modules_after_first_requests']) or 'none'
+        self.stdout.write(f'Heavy modules loaded by then: {heavy}')
+
+        if options['output']:
+            with open(options['output'], 'w') as output_file:
+                json.dump(results, output_file, indent=2)
@@ -0,0 +1,316 @@
+# api/mark_log.py
+
+import itertools
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from django.conf import settings
+from django.db import DataError, IntegrityError, close_old_connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from .cache import ATTENDANCE_COUNTS, bump_version
+from .models import (
+    AttendanceRecord, AttendanceRollup, AttendanceSession, SessionSnapshot, StudentSubjectAttendance, session_counter_enabled
+)
+from .serializers import AttendanceRecordSerializer
+from .signals import attendance_marked
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the entries themselves (a deleted student or session, a malformed value);
+# anything else, such as a lost connection, is retried without counting against the batch
+POISON_ERRORS = (IntegrityError, DataError, KeyError, TypeError, ValueError)
+
+
+class MarkLogLocked(Exception):
+    """Another process holds the mark log"""
+
+
+def _lock_file(path):
+    """Open and exclusively lock `path` without waiting; the lock lasts until the file is closed"""
+    lock_file = open(path, 'a+b')
+    try:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+    except OSError:
+        lock_file.close()
+        raise MarkLogLocked(f'{path} is locked by another process')
+    return lock_file
+
+
+class MarkLog:
+    """Durable append-only log of accepted scans, drained into AttendanceRecord in batches.
+
+    A scan is acknowledged once its line is fsynced. The committer thread
+    bulk-inserts batches with ignore_conflicts and only then advances the
+    checkpoint, so replaying after a crash relies on the (session, student)
+    unique constraint to commit each scan exactly once.
+
+    The log belongs to one process: opening it takes an exclusive lock on
+    `<path>.lock` (MarkLogLocked if another process has it), so appends,
+    repairs and truncation never race another writer. A batch that keeps
+    failing on its data is committed entry by entry after max_attempts
+    tries, and the entries that still fail are moved to `<path>.dead`.
+    """
+
+    def __init__(self, path, batch_size=500, interval=0.5, max_attempts=5):
+        self.path = Path(path)
+        self.checkpoint_path = self.path.with_name(self.path.name + '.offset')
+        self.dead_letter_path = self.path.with_name(self.path.name + '.dead')
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+
+        self._append_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+        self._written = 0
+        self._synced = 0
+        self._pending = set()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._attempts = 0
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = _lock_file(self.path.with_name(self.path.name + '.lock'))
+        self._repair_tail()
+        self._file = open(self.path, 'ab')
+
+    def append(self, session_id, enrollment_number, qr_code, marked_at):
+        """Durably record a scan; returns False if the same scan is already pending"""
+        key = (session_id, enrollment_number)
+        line = json.dumps({
+            'session': session_id,
+            'student': enrollment_number,
+            'qr_code': qr_code,
+            'marked_at': marked_at.isoformat(),
+        }, separators=(',', ':')).encode() + b'\n'
+
+        with self._append_lock:
+            if key in self._pending:
+                return False
+            self._file.write(line)
+            self._file.flush()
+            self._pending.add(key)
+            self._written += 1
+            sequence = self._written
+
+        # Group commit: one fsync covers every line written before it started
+        with self._sync_lock:
+            if self._synced < sequence:
+                target = self._written
+                os.fsync(self._file.fileno())
+                self._synced = target
+
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='mark-log-committer', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._file.close()
+        self._lock.close()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            try:
+                self.commit_pending()
+            except Exception:
+                logger.exception('Mark log group commit failed; will retry')
+            finally:
+                close_old_connections()
+        self.commit_pending()
+
+    def commit_pending(self):
+        """Commit everything past the checkpoint; returns the number of lines committed"""
+        committed = 0
+        with self._commit_lock:
+            offset = self._read_checkpoint()
+            with open(self.path, 'rb') as log_file:
+                log_file.seek(offset)
+                while True:
+                    entries, offset = self._read_batch(log_file, offset)
+                    if not entries:
+                        break
+                    self._commit_or_set_aside(entries)
+                    self._write_checkpoint(offset)
+                    with self._append_lock:
+                        self._pending.difference_update((entry['session'], entry['student']) for entry in entries)
+                    committed += len(entries)
+            self._compact(offset)
+        return committed
+
+    def _commit_or_set_aside(self, entries):
+        try:
+            self._commit_batch(entries)
+        except POISON_ERRORS:
+            self._attempts += 1
+            if self._attempts < self.max_attempts:
+                raise
+            # The batch keeps failing on its data: commit what can be committed, set the rest aside
+            logger.exception('Mark log batch failed %d times; committing its entries one by one', self._attempts)
+            for entry in entries:
+                try:
+                    self._commit_batch([entry])
+                except POISON_ERRORS as e:
+                    logger.error('Moving mark log entry %r to %s: %s', entry, self.dead_letter_path, e)
+                    self._dead_letter(entry, e)
+        self._attempts = 0
+
+    def _dead_letter(self, entry, error):
+        line = json.dumps({**entry, 'error': str(error)}, separators=(',', ':')).encode() + b'\n'
+        with open(self.dead_letter_path, 'ab') as dead_letter_file:
+            dead_letter_file.write(line)
+            dead_letter_file.flush()
+            os.fsync(dead_letter_file.fileno())
+
+    def _read_batch(self, log_file, offset):
+        entries = []
+        while len(entries) < self.batch_size:
+            line = log_file.readline()
+            # A line without its newline is a torn write still in progress (or lost in a crash)
+            if not line or not line.endswith(b'\n'):
+                break
+            offset += len(line)
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                logger.error('Skipping corrupt mark log line at offset %d', offset - len(line))
+        return entries, offset
+
+    def _commit_batch(self, entries):
+        records = [
+            AttendanceRecord(
+                session_id=entry['session'],
+                student_id=entry['student'],
+                qr_code_used=entry['qr_code'],
+                marked_at=parse_datetime(entry['marked_at']),
+            )
+            for entry in entries
+        ]
+        with transaction.atomic():
+            AttendanceRecord.objects.bulk_create(records, batch_size=self.batch_size, ignore_conflicts=True)
+            if session_counter_enabled():
+                # ignore_conflicts hides which rows were new, so recount the touched sessions
+                AttendanceSession.objects.recount_records({entry['session'] for entry in entries})
+        # Late commits can change counts of sessions that already ended and were cached or summarized
+        bump_version(ATTENDANCE_COUNTS)
+        session_ids = {entry['session'] for entry in entries}
+        StudentSubjectAttendance.objects.refresh_late_records(session_ids, {entry['student'] for entry in entries})
+        AttendanceRollup.objects.refresh_late_records(session_ids)
+        SessionSnapshot.objects.refresh_late_records(session_ids)
+        self._announce(entries)
+
+    def _announce(self, entries):
+        # bulk_create with ignore_conflicts returns no ids, so read the batch back once
+        sessions = {}
+        for entry in entries:
+            sessions.setdefault(entry['session'], set()).add(entry['student'])
+        for session_id, students in sessions.items():
+            saved = AttendanceRecord.objects.filter(
+                session_id=session_id, student_id__in=students
+            ).select_related('student')
+            records = AttendanceRecordSerializer(saved, many=True).data
+            attendance_marked.send(sender=AttendanceRecord, session_id=session_id, records=records)
+
+    def _compact(self, offset):
+        # Once everything is committed the log can start over from an empty file.
+        # The checkpoint is reset first: a crash in between only replays committed lines.
+        with self._append_lock:
+            if offset and offset == os.fstat(self._file.fileno()).st_size:
+                self._write_checkpoint(0)
+                self._file.truncate(0)
+                os.fsync(self._file.fileno())
+
+    def _repair_tail(self):
+        # A crash mid-write leaves a partial last line that was never acknowledged;
+        # drop it so the next append does not get glued onto it
+        try:
+            with open(self.path, 'rb+') as log_file:
+                data = log_file.read()
+                if data and not data.endswith(b'\n'):
+                    log_file.truncate(data.rfind(b'\n') + 1)
+        except FileNotFoundError:
+            pass
+
+    def _read_checkpoint(self):
+        try:
+            offset = int(self.checkpoint_path.read_text() or 0)
+        except FileNotFoundError:
+            return 0
+        return offset if offset <= self.path.stat().st_size else 0
+
+    def _write_checkpoint(self, offset):
+        temporary_path = self.checkpoint_path.with_name(self.checkpoint_path.name + '.tmp')
+        with open(temporary_path, 'w') as checkpoint_file:
+            checkpoint_file.write(str(offset))
+            checkpoint_file.flush()
+            os.fsync(checkpoint_file.fileno())
+        os.replace(temporary_path, self.checkpoint_path)
+
+
+_mark_log = None
+_mark_log_lock = threading.Lock()
+
+
+def log_ingest_enabled():
+    return settings.ATTENDANCE_INGEST_MODE == 'log'
+
+
+def mark_log_slot(path, index):
+    """Path of the index-th per-process log: the configured path, then path.1, path.2, ..."""
+    path = Path(path)
+    return path if index == 0 else path.with_name(f'{path.name}.{index}')
+
+
+def open_process_mark_log(path, **options):
+    """Open the first mark log slot no other process holds.
+
+    Each worker gets a log of its own; a restarted worker takes over the
+    lowest free slot and replays whatever its predecessor left there.
+    """
+    for index in itertools.count():
+        try:
+            return MarkLog(mark_log_slot(path, index), **options)
+        except MarkLogLocked:
+            continue
+
+
+def get_mark_log():
+    """Return this process's mark log, replaying anything left from a previous run"""
+    global _mark_log
+    if _mark_log is None:
+        with _mark_log_lock:
+            if _mark_log is None:
+                mark_log = open_process_mark_log(
+                    settings.ATTENDANCE_MARK_LOG_PATH,
+                    batch_size=settings.ATTENDANCE_GROUP_COMMIT_SIZE,
+                    interval=settings.ATTENDANCE_GROUP_COMMIT_INTERVAL,
+                    max_attempts=settings.ATTENDANCE_MARK_LOG_MAX_ATTEMPTS,
+                )
+                mark_log.start()
+                _mark_log = mark_log
+    return _mark_log
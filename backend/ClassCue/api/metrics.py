@@ -0,0 +1,185 @@
+# api/metrics.py
+
+import bisect
+import threading
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class RequestStats:
+    """Counters for the request being served, shared by the SQL hook and serializers"""
+
+    __slots__ = ('view', 'queries', 'sql_time', 'serializer_time', 'serializer_depth')
+
+    def __init__(self):
+        self.view = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+_current_stats = ContextVar('request_stats', default=None)
+
+
+def current_stats():
+    return _current_stats.get()
+
+
+def start_request():
+    """Begin collecting stats for this context; returns a token for finish_request"""
+    stats = RequestStats()
+    return stats, _current_stats.set(stats)
+
+
+def finish_request(token):
+    _current_stats.reset(token)
+
+
+def sql_timer(execute, sql, params, many, context):
+    """Execute wrapper that charges query count and time to the current request"""
+    stats = _current_stats.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.sql_time += perf_counter() - started
+
+
+@receiver(connection_created)
+def install_sql_timer(sender, connection, **kwargs):
+    # Installed per connection rather than per request so sync views run by the
+    # ASGI handler in worker threads are measured too; the contextvar decides
+    if sql_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(sql_timer)
+
+
+class TimedSerializerMixin:
+    """Adds the outermost to_representation call to the request's serializer time.
+
+    Nested serializers and list children run inside that call and are not
+    counted again. Lazy queries made while serializing count towards both.
+    """
+
+    def to_representation(self, instance):
+        stats = _current_stats.get()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_depth -= 1
+            stats.serializer_time += perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+
+
+class MetricsRegistry:
+    """Per-process request histograms, labelled by view and method.
+
+    Each worker process keeps its own registry, so a scrape sees only the
+    worker that answered it.
+    """
+
+    METRICS = (
+        ('classcue_request_duration_seconds', 'Wall time spent producing the response', DURATION_BUCKETS),
+        ('classcue_request_queries', 'SQL queries executed per request', QUERY_BUCKETS),
+        ('classcue_request_sql_seconds', 'Time spent in SQL per request', DURATION_BUCKETS),
+        ('classcue_request_serializer_seconds', 'Time spent in serializers per request', DURATION_BUCKETS),
+        ('classcue_response_size_bytes', 'Response body size (streaming responses excluded)', SIZE_BUCKETS),
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._responses = {}
+
+    def record(self, view, method, status_code, duration, stats, size=None):
+        values = (duration, stats.queries, stats.sql_time, stats.serializer_time, size)
+        with self._lock:
+            labels = (view, method)
+            for (name, _, buckets), value in zip(self.METRICS, values):
+                if value is None:
+                    continue
+                histogram = self._histograms.get((name, labels))
+                if histogram is None:
+                    histogram = self._histograms[(name, labels)] = Histogram(buckets)
+                histogram.observe(value)
+            key = (view, method, str(status_code))
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+            self._responses.clear()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, help_text, _ in self.METRICS:
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, (view, method)), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    labels = f'view="{escape_label(view)}",method="{method}"'
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    cumulative += histogram.counts[-1]
+                    lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {cumulative}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.total}')
+                    lines.append(f'{name}_count{{{labels}}} {cumulative}')
+
+            lines.append('# HELP classcue_responses_total Responses by view, method and status code')
+            lines.append('# TYPE classcue_responses_total counter')
+            for (view, method, status_code), count in sorted(self._responses.items()):
+                lines.append(
+                    f'classcue_responses_total{{view="{escape_label(view)}",method="{method}",status="{status_code}"}} {count}'
+                )
+        return '\n'.join(lines) + '\n'
+
+
+def escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+def database_pool_metrics(databases=None):
+    """Prometheus gauges from psycopg_pool statistics for every pooled database"""
+    lines = []
+    for alias in databases or connections:
+        connection = connections[alias]
+        if connection.vendor != 'postgresql' or 'pool' not in connection.settings_dict.get('OPTIONS', {}):
+            continue
+        for name, value in sorted(connection.pool.get_stats().items()):
+            metric = f"classcue_db_pool_{name.removeprefix('pool_')}"
+            lines.append(f'# TYPE {metric} gauge')
+            lines.append(f'{metric}{{alias="{escape_label(alias)}"}} {value}')
+    return '\n'.join(lines) + '\n' if lines else ''
@@ -0,0 +1,65 @@
+# api/middleware.py
+
+from time import perf_counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import current_stats, finish_request, registry, start_request
+
+
+class RequestMetricsMiddleware:
+    """Times each request and reports SQL, serializer and size figures.
+
+    The figures go out as a Server-Timing header (visible in browser dev
+    tools) and into the per-process histograms published at /metrics.
+    Works for both sync views and the async event stream.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        started = perf_counter()
+        stats, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            finish_request(token)
+        self.report(request, response, stats, perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = perf_counter()
+        stats, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            finish_request(token)
+        self.report(request, response, stats, perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        # Lets the SQL hooks attribute queries to the view while it runs
+        stats = current_stats()
+        if stats is not None and request.resolver_match is not None:
+            stats.view = request.resolver_match.view_name
+
+    def report(self, request, response, stats, duration):
+        size = None if response.streaming else len(response.content)
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unresolved'
+        registry.record(view, request.method, response.status_code, duration, stats, size)
+
+        response['Server-Timing'] = ', '.join((
+            f'app;dur={duration * 1000:.1f}',
+            f'db;dur={stats.sql_time * 1000:.1f};desc="{stats.queries} queries"',
+            f'serialize;dur={stats.serializer_time * 1000:.1f}',
+        ))
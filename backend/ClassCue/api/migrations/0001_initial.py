@@ -90,7 +90,9 @@ class Migration(migrations.Migration):
                 ('marked_at', models.DateTimeField(auto_now_add=True)),
                 ('is_valid', models.BooleanField(default=True)),
                 ('session', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='attendance_records', to='api.attendancesession')),
-                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.studentprofile')),
+                # Created without a constraint: 0002 drops the StudentProfile.id column it would reference,
+                # which SQLite rejects; 0012 adds the constraint against the enrollment_number key
+                ('student', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='api.studentprofile')),
             ],
             options={
                 'unique_together': {('session', 'student')},
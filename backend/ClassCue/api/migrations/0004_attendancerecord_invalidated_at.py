@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_studentprofile_goals_studentprofile_interests_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancerecord',
+            name='invalidated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['session', 'marked_at', 'id'], name='api_attenda_session_213579_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancerecord',
+            index=models.Index(fields=['session', 'invalidated_at'], name='api_attenda_session_742929_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:17
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_attendancerecord_invalidated_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendancerecord',
+            name='marked_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
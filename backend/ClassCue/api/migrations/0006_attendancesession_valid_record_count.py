@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_valid_record_count(apps, schema_editor):
+    AttendanceSession = apps.get_model('api', 'AttendanceSession')
+    AttendanceRecord = apps.get_model('api', 'AttendanceRecord')
+    db_alias = schema_editor.connection.alias
+    valid_counts = AttendanceRecord.objects.using(db_alias).filter(
+        session=OuterRef('pk'), is_valid=True
+    ).order_by().values('session').annotate(count=Count('id')).values('count')
+    AttendanceSession.objects.using(db_alias).update(valid_record_count=Coalesce(
+        Subquery(valid_counts, output_field=models.PositiveIntegerField()), 0
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_attendancerecord_marked_at_default'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesession',
+            name='valid_record_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_valid_record_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_attendancesession_valid_record_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendancesession',
+            index=models.Index(fields=['teacher', '-start_time', '-id'], name='api_attenda_teacher_eae0bb_idx'),
+        ),
+    ]
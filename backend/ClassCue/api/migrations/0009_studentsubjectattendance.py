@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_user_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StudentSubjectAttendance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('held', models.PositiveIntegerField(default=0)),
+                ('student', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subject_attendance', to='api.studentprofile')),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.subject')),
+            ],
+            options={
+                'unique_together': {('student', 'subject')},
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.6 on 2026-10-17 18:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_studentsubjectattendance'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AttendanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department', models.CharField(max_length=100)),
+                ('semester', models.IntegerField()),
+                ('date', models.DateField()),
+                ('sessions', models.PositiveIntegerField(default=0)),
+                ('expected', models.PositiveIntegerField(default=0)),
+                ('attended', models.PositiveIntegerField(default=0)),
+                ('subject', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.subject')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['subject', 'date'], name='api_attenda_subject_aee064_idx'), models.Index(fields=['date'], name='api_attenda_date_af5096_idx')],
+                'unique_together': {('department', 'semester', 'subject', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.6 on 2026-10-17 19:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_attendancerollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SessionSnapshot',
+            fields=[
+                ('session', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='api.attendancesession')),
+                ('present_count', models.PositiveIntegerField(default=0)),
+                ('invalidated_count', models.PositiveIntegerField(default=0)),
+                ('present', models.JSONField(default=list)),
+                ('first_arrival', models.DateTimeField(blank=True, null=True)),
+                ('last_arrival', models.DateTimeField(blank=True, null=True)),
+                ('taken_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
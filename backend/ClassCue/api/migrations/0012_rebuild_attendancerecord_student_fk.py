@@ -0,0 +1,41 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Point AttendanceRecord.student at the enrollment_number primary key in the database.
+
+    0001 created the column as a bigint for StudentProfile.id, which 0002
+    dropped: the column kept its type, and on SQLite databases created before
+    0001 deferred the constraint it still references the dropped column.
+    Detaching it to a plain bigint and re-attaching it makes the schema editor
+    convert the column and add the constraint against enrollment_number.
+    """
+
+    dependencies = [
+        ('api', '0011_sessionsnapshot'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[
+                migrations.AlterField(
+                    model_name='attendancerecord',
+                    name='student',
+                    field=models.BigIntegerField(db_column='student_id'),
+                ),
+                migrations.AlterField(
+                    model_name='attendancerecord',
+                    name='student',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.studentprofile'),
+                ),
+            ],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='attendancerecord',
+                    name='student',
+                    field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.studentprofile'),
+                ),
+            ],
+        ),
+    ]
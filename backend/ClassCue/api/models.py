@@ -1,9 +1,36 @@
 # api/models.py
 
+import bisect
+from collections import defaultdict
+from contextlib import nullcontext
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, TruncDate, TruncMonth
+from django.utils import timezone
+from django.utils.functional import cached_property
+
+from .signals import users_access_changed
+
+# Changing any of these revokes the user's tokens
+ACCESS_FIELDS = ('password', 'role', 'is_active')
+
+
+class UserQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        """Bulk updates that change access bump token_version too, as User.save() does"""
+        if not any(field in kwargs for field in ACCESS_FIELDS):
+            return super().update(**kwargs)
+        kwargs.setdefault('token_version', F('token_version') + 1)
+        user_ids = list(self.values_list('id', flat=True))
+        updated = super().update(**kwargs)
+        users_access_changed.send(sender=self.model, user_ids=user_ids)
+        return updated
+
 
-class UserManager(BaseUserManager):
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     """Define a model manager for User model with no username field."""
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -33,12 +60,42 @@ class User(AbstractUser):
     username = None
     email = models.EmailField(unique=True)
     role = models.CharField(max_length=10, choices=ROLE_CHOICES)
+    # Bumped whenever password, role or activation changes; tokens carrying an older value are rejected
+    token_version = models.PositiveIntegerField(default=0)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
 
     objects = UserManager()
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_access = instance._access_state()
+        return instance
+
+    def _access_state(self):
+        return tuple(self.__dict__.get(field) for field in ACCESS_FIELDS)
+
+    def save(self, *args, **kwargs):
+        loaded_access = getattr(self, '_loaded_access', None)
+        if loaded_access is not None and loaded_access != self._access_state():
+            self.token_version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'token_version'}
+        super().save(*args, **kwargs)
+        self._loaded_access = self._access_state()
+
+    @cached_property
+    def enrollment_number(self):
+        # Same interface as api.authentication.Principal for session/forced authentication
+        profile = StudentProfile.objects.filter(user_id=self.id).values_list('enrollment_number', flat=True)
+        return profile.first()
+
+    @cached_property
+    def teacher_profile_id(self):
+        return TeacherProfile.objects.filter(user_id=self.id).values_list('id', flat=True).first()
+
 
 class Subject(models.Model):
     subject_code = models.CharField(max_length=20, unique=True)
@@ -71,6 +128,44 @@ class StudentProfile(models.Model):
         return self.full_name
 
 
+def session_counter_enabled():
+    return settings.ATTENDANCE_SESSION_COUNTER
+
+
+class AttendanceSessionQuerySet(models.QuerySet):
+    def with_listing_data(self):
+        """Join teacher profile and subject, and count valid records in the same query.
+
+        Ended sessions take the count from their snapshot; the records of a
+        session are only counted while it has none (COALESCE stops at the first
+        non-null argument, so the subquery is skipped for snapshotted rows).
+        """
+        queryset = self.select_related('teacher__teacherprofile', 'subject')
+        if session_counter_enabled():
+            return queryset
+        valid_counts = AttendanceRecord.objects.filter(
+            session=OuterRef('pk'), is_valid=True
+        ).order_by().values('session').annotate(count=Count('id')).values('count')
+        return queryset.annotate(valid_attendance_count=Coalesce(
+            'snapshot__present_count', Subquery(valid_counts, output_field=models.PositiveIntegerField()), 0
+        ))
+
+    def adjust_record_count(self, session_id, delta):
+        """Atomically move the denormalized valid-record counter (no-op unless enabled)"""
+        if session_counter_enabled():
+            self.filter(id=session_id).update(valid_record_count=F('valid_record_count') + delta)
+
+    def recount_records(self, session_ids=None):
+        """Recompute the denormalized counter from AttendanceRecord rows"""
+        queryset = self if session_ids is None else self.filter(id__in=session_ids)
+        valid_counts = AttendanceRecord.objects.filter(
+            session=OuterRef('pk'), is_valid=True
+        ).order_by().values('session').annotate(count=Count('id')).values('count')
+        return queryset.update(valid_record_count=Coalesce(
+            Subquery(valid_counts, output_field=models.PositiveIntegerField()), 0
+        ))
+
+
 class AttendanceSession(models.Model):
     teacher = models.ForeignKey(User, on_delete=models.CASCADE, related_name='attendance_sessions')
     subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
@@ -80,22 +175,441 @@ class AttendanceSession(models.Model):
     is_active = models.BooleanField(default=True)
     current_qr_code = models.CharField(max_length=500, null=True, blank=True)
     qr_expires_at = models.DateTimeField(null=True, blank=True)
+    # Denormalized count of valid records, maintained only when ATTENDANCE_SESSION_COUNTER is on
+    valid_record_count = models.PositiveIntegerField(default=0)
+    
+    objects = AttendanceSessionQuerySet.as_manager()
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['teacher', '-start_time', '-id']),
+        ]
     
     def __str__(self):
         return f"{self.session_name} - {self.subject.name}"
+    
+    def audience(self):
+        """Students the session counts as held for: the subject's semester in the teacher's department, plus anyone with a record"""
+        semester = Subject.objects.filter(id=self.subject_id).values('semester')
+        department = TeacherProfile.objects.filter(user_id=self.teacher_id).values('department')
+        return StudentProfile.objects.filter(
+            Q(semester=Subquery(semester), department=Subquery(department)) |
+            Q(enrollment_number__in=AttendanceRecord.objects.filter(session_id=self.id).values('student'))
+        )
+
+
+class AttendanceRecordManager(models.Manager):
+    def insert_if_absent(self, session_id, enrollment_number, qr_code, marked_at, expires_after=None):
+        """Insert a record in one statement if the session is active and the student has no record yet.
+
+        The session check is folded into INSERT ... SELECT and duplicates are
+        absorbed by the (session, student) unique constraint, so this is a
+        single round trip. Returns the new record id, or None if nothing was
+        inserted (inactive/expired session or attendance already marked).
+        """
+        connection = connections[self.db]
+        record_table = connection.ops.quote_name(self.model._meta.db_table)
+        session_table = connection.ops.quote_name(AttendanceSession._meta.db_table)
+        expiry_clause = 'AND qr_expires_at >= %s' if expires_after is not None else ''
+        params = [
+            enrollment_number,
+            qr_code,
+            connection.ops.adapt_datetimefield_value(marked_at),
+            True,
+            session_id,
+            True,
+        ]
+        if expires_after is not None:
+            params.append(connection.ops.adapt_datetimefield_value(expires_after))
+
+        sql = (
+            f'INSERT INTO {record_table} (session_id, student_id, qr_code_used, marked_at, is_valid) '
+            f'SELECT id, %s, %s, %s, %s FROM {session_table} '
+            f'WHERE id = %s AND is_active = %s {expiry_clause} '
+            f'ON CONFLICT (session_id, student_id) DO NOTHING RETURNING id'
+        )
+        with transaction.atomic(using=self.db, savepoint=False) if session_counter_enabled() else nullcontext():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+                row = cursor.fetchone()
+            if row:
+                AttendanceSession.objects.db_manager(self.db).adjust_record_count(session_id, 1)
+        return row[0] if row else None
 
 
 class AttendanceRecord(models.Model):
     session = models.ForeignKey(AttendanceSession, on_delete=models.CASCADE, related_name='attendance_records')
     student = models.ForeignKey(StudentProfile, on_delete=models.CASCADE, to_field='enrollment_number')
     qr_code_used = models.CharField(max_length=500)
-    marked_at = models.DateTimeField(auto_now_add=True)
+    marked_at = models.DateTimeField(default=timezone.now)
     is_valid = models.BooleanField(default=True)
+    invalidated_at = models.DateTimeField(null=True, blank=True)
+    
+    objects = AttendanceRecordManager()
     
     class Meta:
         unique_together = ['session', 'student']
+        indexes = [
+            models.Index(fields=['session', 'marked_at', 'id']),
+            models.Index(fields=['session', 'invalidated_at']),
+        ]
     
     def __str__(self):
         return f"{self.student.full_name} - {self.session.session_name}"
+    
+    def invalidate(self):
+        """Mark the record invalid; returns False if it already was"""
+        invalidated_at = timezone.now()
+        with transaction.atomic():
+            updated = AttendanceRecord.objects.filter(id=self.id, is_valid=True).update(
+                is_valid=False, invalidated_at=invalidated_at
+            )
+            if updated:
+                AttendanceSession.objects.adjust_record_count(self.session_id, -1)
+        if updated:
+            self.is_valid = False
+            self.invalidated_at = invalidated_at
+        return bool(updated)
+
+   
+
+
+class StudentSubjectAttendanceQuerySet(models.QuerySet):
+    def credit_session(self, session):
+        """Count an ended session as held for its audience and as attended for its valid records"""
+        audience = session.audience().values('enrollment_number')
+        attended = AttendanceRecord.objects.filter(session_id=session.id, is_valid=True).values('student')
+        with transaction.atomic(using=self.db):
+            self.bulk_create(
+                (self.model(student_id=enrollment_number, subject_id=session.subject_id)
+                 for enrollment_number in audience.values_list('enrollment_number', flat=True)),
+                batch_size=1000, ignore_conflicts=True
+            )
+            rows = self.filter(subject_id=session.subject_id, student_id__in=audience)
+            rows.update(held=F('held') + 1)
+            rows.filter(student_id__in=attended).update(attended=F('attended') + 1)
+
+    def debit_record(self, record):
+        """Take back the attendance of a record invalidated after its session ended (one UPDATE)"""
+        ended_subject = AttendanceSession.objects.filter(id=record.session_id, is_active=False).values('subject_id')
+        self.filter(student_id=record.student_id, subject_id=Subquery(ended_subject), attended__gt=0).update(
+            attended=F('attended') - 1
+        )
 
-   
\ No newline at end of file
+    def refresh_late_records(self, session_ids, students):
+        """Recompute the rows touched by records written into sessions that had already ended"""
+        subjects = set(AttendanceSession.objects.filter(id__in=session_ids, is_active=False).values_list('subject_id', flat=True))
+        if subjects:
+            self.rebuild(students=students, subjects=subjects)
+
+    def rebuild(self, students=None, subjects=None):
+        """Recompute rows from ended sessions and their records, optionally for some students/subjects only.
+
+        Returns the number of rows written.
+        """
+        sessions = AttendanceSession.objects.filter(is_active=False)
+        records = AttendanceRecord.objects.filter(session__is_active=False)
+        profiles = StudentProfile.objects.all()
+        rows = self.all()
+        if students is not None:
+            records = records.filter(student_id__in=students)
+            profiles = profiles.filter(enrollment_number__in=students)
+            rows = rows.filter(student_id__in=students)
+        if subjects is not None:
+            sessions = sessions.filter(subject_id__in=subjects)
+            records = records.filter(session__subject_id__in=subjects)
+            rows = rows.filter(subject_id__in=subjects)
+
+        counts = defaultdict(lambda: [0, 0])  # (student, subject) -> [attended, held]
+        cohorts = defaultdict(list)  # (semester, department) -> [(subject, sessions held)]
+        held_by_cohort = sessions.order_by().values(
+            'subject_id', 'subject__semester', 'teacher__teacherprofile__department'
+        ).annotate(held=Count('id'))
+        for row in held_by_cohort:
+            cohorts[(row['subject__semester'], row['teacher__teacherprofile__department'])].append(
+                (row['subject_id'], row['held'])
+            )
+        for enrollment_number, semester, department in profiles.values_list('enrollment_number', 'semester', 'department').iterator():
+            for subject_id, held in cohorts.get((semester, department), ()):
+                counts[(enrollment_number, subject_id)][1] += held
+
+        # Records are grouped per student, subject and cohort, so this is one row per pair in practice
+        record_counts = records.order_by().values_list(
+            'student_id', 'session__subject_id', 'student__semester', 'student__department',
+            'session__subject__semester', 'session__teacher__teacherprofile__department'
+        ).annotate(total=Count('id'), valid=Count('id', filter=Q(is_valid=True)))
+        for student_id, subject_id, semester, department, subject_semester, teacher_department, total, valid in record_counts.iterator():
+            entry = counts[(student_id, subject_id)]
+            entry[0] += valid
+            # Sessions outside the student's cohort are held only for those with a record in them
+            if (semester, department) != (subject_semester, teacher_department):
+                entry[1] += total
+
+        with transaction.atomic(using=self.db):
+            rows.delete()
+            self.bulk_create(
+                (self.model(student_id=student_id, subject_id=subject_id, attended=attended, held=held)
+                 for (student_id, subject_id), (attended, held) in counts.items()),
+                batch_size=1000
+            )
+        return len(counts)
+
+
+class StudentSubjectAttendance(models.Model):
+    """Attended and held counts per student and subject, over ended sessions.
+
+    Maintained incrementally by api.summaries as sessions end, records are
+    invalidated and late scans are committed; `manage.py
+    rebuild_attendance_summary` recomputes it from scratch.
+    """
+    student = models.ForeignKey(
+        StudentProfile, on_delete=models.CASCADE, to_field='enrollment_number', related_name='subject_attendance'
+    )
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    attended = models.PositiveIntegerField(default=0)
+    held = models.PositiveIntegerField(default=0)
+    
+    objects = StudentSubjectAttendanceQuerySet.as_manager()
+    
+    class Meta:
+        unique_together = ['student', 'subject']
+    
+    def __str__(self):
+        return f"{self.student_id} - {self.subject_id}: {self.attended}/{self.held}"
+    
+    @property
+    def percentage(self):
+        return round(100 * self.attended / self.held, 2) if self.held else None
+
+
+
+# Dimensions the rollup can be grouped by, and the values() each one contributes
+ROLLUP_DIMENSIONS = {
+    'department': 'department',
+    'semester': 'semester',
+    'subject': 'subject_code',
+    'date': 'date',
+    'month': 'month',
+}
+
+
+class AttendanceRollupQuerySet(models.QuerySet):
+    def add_session(self, session):
+        """Fold an ended session into its cells: held for the cohort, expected and attended per student group"""
+        day = timezone.localdate(session.start_time)
+        cohort = AttendanceSession.objects.filter(id=session.id).values(
+            'subject__semester', 'teacher__teacherprofile__department'
+        ).get()
+        cells = defaultdict(lambda: [0, 0, 0])  # (department, semester) -> [sessions, expected, attended]
+        if cohort['teacher__teacherprofile__department'] is not None:
+            cells[(cohort['teacher__teacherprofile__department'], cohort['subject__semester'])][0] += 1
+        for row in session.audience().order_by().values('department', 'semester').annotate(expected=Count('enrollment_number')):
+            cells[(row['department'], row['semester'])][1] += row['expected']
+        attended = AttendanceRecord.objects.filter(session_id=session.id, is_valid=True).order_by().values(
+            'student__department', 'student__semester'
+        ).annotate(attended=Count('id'))
+        for row in attended:
+            cells[(row['student__department'], row['student__semester'])][2] += row['attended']
+
+        with transaction.atomic(using=self.db):
+            self.bulk_create(
+                [self.model(department=department, semester=semester, subject_id=session.subject_id, date=day)
+                 for department, semester in cells],
+                ignore_conflicts=True
+            )
+            for (department, semester), (sessions, expected, attended) in cells.items():
+                self.filter(department=department, semester=semester, subject_id=session.subject_id, date=day).update(
+                    sessions=F('sessions') + sessions, expected=F('expected') + expected,
+                    attended=F('attended') + attended
+                )
+
+    def remove_record(self, record):
+        """Take back a record invalidated after its session ended"""
+        session = AttendanceSession.objects.filter(id=record.session_id, is_active=False).values(
+            'subject_id', 'start_time'
+        ).first()
+        if session is None:
+            return
+        self.filter(
+            department=record.student.department, semester=record.student.semester, subject_id=session['subject_id'],
+            date=timezone.localdate(session['start_time']), attended__gt=0
+        ).update(attended=F('attended') - 1)
+
+    def refresh_late_records(self, session_ids):
+        """Rebuild the (subject, date) slices of sessions that received records after they ended"""
+        ended = AttendanceSession.objects.filter(id__in=session_ids, is_active=False).annotate(
+            day=TruncDate('start_time')
+        ).values_list('subject_id', 'day').distinct()
+        scope = set(ended)
+        if scope:
+            self.rebuild(scope)
+
+    def rebuild(self, scope=None):
+        """Recompute cells from ended sessions and their records; `scope` limits it to (subject id, date) pairs.
+
+        Returns the number of cells written.
+        """
+        sessions = AttendanceSession.objects.filter(is_active=False).annotate(day=TruncDate('start_time'))
+        cells = self.all()
+        if scope is not None:
+            pairs = list(scope)
+            sessions = sessions.filter(_any_of(Q(subject_id=subject_id, day=day) for subject_id, day in pairs))
+            cells = cells.filter(_any_of(Q(subject_id=subject_id, date=day) for subject_id, day in pairs))
+
+        totals = defaultdict(lambda: [0, 0, 0])  # (department, semester, subject, date) -> [sessions, expected, attended]
+        cohort_sizes = {
+            (row['department'], row['semester']): row['students']
+            for row in StudentProfile.objects.order_by().values('department', 'semester').annotate(students=Count('enrollment_number'))
+        }
+        cohorts = {}  # session id -> (subject, date, cohort department, cohort semester)
+        for session_id, subject_id, day, semester, department in sessions.values_list(
+            'id', 'subject_id', 'day', 'subject__semester', 'teacher__teacherprofile__department'
+        ).iterator():
+            cohorts[session_id] = (subject_id, day, department, semester)
+            if department is not None:
+                cell = totals[(department, semester, subject_id, day)]
+                cell[0] += 1
+                cell[1] += cohort_sizes.get((department, semester), 0)
+
+        # Grouped per session and student group, so records are counted without joining sessions row by row
+        record_counts = AttendanceRecord.objects.filter(session__in=sessions.values('id')).order_by().values_list(
+            'session_id', 'student__department', 'student__semester'
+        ).annotate(total=Count('id'), valid=Count('id', filter=Q(is_valid=True)))
+        for session_id, department, semester, total, valid in record_counts.iterator():
+            subject_id, day, cohort_department, cohort_semester = cohorts[session_id]
+            cell = totals[(department, semester, subject_id, day)]
+            cell[2] += valid
+            # Students outside the session's cohort are only expected at sessions they have a record in
+            if (department, semester) != (cohort_department, cohort_semester):
+                cell[1] += total
+
+        with transaction.atomic(using=self.db):
+            cells.delete()
+            self.bulk_create(
+                (self.model(department=department, semester=semester, subject_id=subject_id, date=day,
+                            sessions=sessions_held, expected=expected, attended=attended)
+                 for (department, semester, subject_id, day), (sessions_held, expected, attended) in totals.items()),
+                batch_size=1000
+            )
+        return len(totals)
+
+    def rollup(self, group_by):
+        """Sum cells over every dimension not in `group_by` (drill down by adding one, roll up by dropping it)"""
+        queryset = self
+        if 'month' in group_by:
+            queryset = queryset.annotate(month=TruncMonth('date'))
+        if 'subject' in group_by:
+            queryset = queryset.annotate(subject_code=F('subject__subject_code'))
+        fields = [ROLLUP_DIMENSIONS[dimension] for dimension in group_by]
+        return queryset.order_by(*fields).values(*fields).annotate(
+            sessions_held=Sum('sessions'), expected_total=Sum('expected'), attended_total=Sum('attended')
+        )
+
+
+def _any_of(conditions):
+    combined = Q(pk__in=[])
+    for condition in conditions:
+        combined |= condition
+    return combined
+
+
+class AttendanceRollup(models.Model):
+    """Attendance cube cell: one (student department, semester, subject, day).
+
+    `sessions` counts sessions held for the cell's cohort, `expected` the
+    student-sessions owed (cohort size per session, plus outsiders who
+    attended) and `attended` the valid records. Maintained by api.summaries
+    as sessions end; `manage.py rebuild_attendance_rollup` recomputes it.
+    """
+    department = models.CharField(max_length=100)
+    semester = models.IntegerField()
+    subject = models.ForeignKey(Subject, on_delete=models.CASCADE)
+    date = models.DateField()
+    sessions = models.PositiveIntegerField(default=0)
+    expected = models.PositiveIntegerField(default=0)
+    attended = models.PositiveIntegerField(default=0)
+    
+    objects = AttendanceRollupQuerySet.as_manager()
+    
+    class Meta:
+        unique_together = ['department', 'semester', 'subject', 'date']
+        indexes = [
+            models.Index(fields=['subject', 'date']),
+            models.Index(fields=['date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.department} / {self.semester} / {self.subject_id} / {self.date}: {self.attended}/{self.expected}"
+
+
+
+class SessionSnapshotQuerySet(models.QuerySet):
+    def take(self, session):
+        """Freeze a session's attendance (again, if it already has a snapshot); returns the snapshot"""
+        records = AttendanceRecord.objects.filter(session_id=session.id).values_list('student_id', 'marked_at', 'is_valid')
+        present = []
+        arrivals = []
+        invalidated = 0
+        for enrollment_number, marked_at, is_valid in records:
+            if is_valid:
+                present.append(enrollment_number)
+                arrivals.append(marked_at)
+            else:
+                invalidated += 1
+        # Sorted here rather than by the database, whose collation may not order strings
+        # the way Python compares them; remove_record bisects this list
+        present.sort()
+        snapshot, _ = self.update_or_create(session_id=session.id, defaults={
+            'present_count': len(present),
+            'invalidated_count': invalidated,
+            'present': present,
+            'first_arrival': min(arrivals, default=None),
+            'last_arrival': max(arrivals, default=None),
+        })
+        return snapshot
+
+    def remove_record(self, record):
+        """Drop an invalidated record's student from its session's snapshot, if the session has one"""
+        with transaction.atomic(using=self.db):
+            snapshot = self.select_for_update().filter(session_id=record.session_id).first()
+            if snapshot is None:
+                return
+            position = bisect.bisect_left(snapshot.present, record.student_id)
+            if position == len(snapshot.present) or snapshot.present[position] != record.student_id:
+                return
+            del snapshot.present[position]
+            snapshot.present_count -= 1
+            snapshot.invalidated_count += 1
+            if record.marked_at in (snapshot.first_arrival, snapshot.last_arrival):
+                arrivals = AttendanceRecord.objects.filter(session_id=record.session_id, is_valid=True).aggregate(
+                    first=models.Min('marked_at'), last=models.Max('marked_at')
+                )
+                snapshot.first_arrival, snapshot.last_arrival = arrivals['first'], arrivals['last']
+            snapshot.save()
+
+    def refresh_late_records(self, session_ids):
+        """Retake the snapshots of sessions that received records after they ended"""
+        for session in AttendanceSession.objects.filter(id__in=session_ids, is_active=False).only('id'):
+            self.take(session)
+
+
+class SessionSnapshot(models.Model):
+    """Final attendance of an ended session, written once by end_attendance_session.
+
+    Later views and reports read the count and the sorted list of present
+    enrollment numbers from here instead of the session's records. Records
+    invalidated after the session ended are removed from it in place.
+    """
+    session = models.OneToOneField(AttendanceSession, on_delete=models.CASCADE, primary_key=True, related_name='snapshot')
+    present_count = models.PositiveIntegerField(default=0)
+    invalidated_count = models.PositiveIntegerField(default=0)
+    # Enrollment numbers of students with a valid record, sorted in Python (codepoint) order
+    present = models.JSONField(default=list)
+    first_arrival = models.DateTimeField(null=True, blank=True)
+    last_arrival = models.DateTimeField(null=True, blank=True)
+    taken_at = models.DateTimeField(auto_now=True)
+    
+    objects = SessionSnapshotQuerySet.as_manager()
+    
+    def __str__(self):
+        return f"Snapshot of session {self.session_id}: {self.present_count} present"
@@ -0,0 +1,83 @@
+# api/qr_images.py
+
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.utils import timezone
+
+
+def render_qr_image(qr_string):
+    """Render a QR code string as a base64 PNG data URI"""
+    # qrcode pulls in PIL; importing it here keeps it off the startup path of
+    # every worker and management command that never renders an image
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(qr_string)
+    qr.make(fit=True)
+
+    img = qr.make_image(fill_color="black", back_color="white")
+
+    # Convert to base64
+    buffer = io.BytesIO()
+    img.save(buffer, format='PNG')
+    img_str = base64.b64encode(buffer.getvalue()).decode()
+
+    return f"data:image/png;base64,{img_str}"
+
+
+def qr_etag(qr_string):
+    """Strong ETag for a QR payload; the rendered image is a pure function of it"""
+    return '"qr-%s"' % hashlib.sha256(qr_string.encode()).hexdigest()[:32]
+
+
+class QRImageCache:
+    """Bounded LRU of rendered QR images, each entry dropped once its token expires.
+
+    Without an explicit max_entries the bound is QR_IMAGE_CACHE_SIZE, read on
+    every insert so override_settings and runtime changes apply.
+    """
+
+    def __init__(self, max_entries=None):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def max_entries(self):
+        return settings.QR_IMAGE_CACHE_SIZE if self._max_entries is None else self._max_entries
+
+    def get(self, qr_string, expires_at):
+        now = timezone.now()
+        with self._lock:
+            entry = self._entries.get(qr_string)
+            if entry is not None:
+                image, entry_expires_at = entry
+                if entry_expires_at is None or entry_expires_at > now:
+                    self._entries.move_to_end(qr_string)
+                    return image
+                del self._entries[qr_string]
+
+        # Render outside the lock so one slow render does not stall other sessions
+        image = render_qr_image(qr_string)
+        with self._lock:
+            self._entries[qr_string] = (image, expires_at)
+            self._entries.move_to_end(qr_string)
+            max_entries = self.max_entries
+            while len(self._entries) > max_entries:
+                self._entries.popitem(last=False)
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+qr_image_cache = QRImageCache()
@@ -0,0 +1,69 @@
+# api/qr_tokens.py
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+KEY_SALT = 'api.qr_tokens'
+SIGNATURE_LENGTH = 32
+
+
+class InvalidQRToken(ValueError):
+    """Raised when a QR token is malformed or its signature does not match"""
+
+
+class ExpiredQRToken(InvalidQRToken):
+    """Raised when a QR token was signed for a window outside the grace period"""
+
+
+def signed_mode_enabled():
+    return settings.QR_TOKEN_MODE == 'signed'
+
+
+def current_window(now=None):
+    """Return the rotation window number for the given time"""
+    now = now or timezone.now()
+    return int(now.timestamp()) // settings.QR_ROTATION_SECONDS
+
+
+def window_bounds(window):
+    """Return the (start, end) datetimes of a rotation window"""
+    start = window * settings.QR_ROTATION_SECONDS
+    return (
+        datetime.fromtimestamp(start, tz=dt_timezone.utc),
+        datetime.fromtimestamp(start + settings.QR_ROTATION_SECONDS, tz=dt_timezone.utc),
+    )
+
+
+def _signature(session_id, window):
+    value = f"{session_id}|{window}"
+    return salted_hmac(
+        KEY_SALT, value, secret=settings.QR_TOKEN_SECRET, algorithm='sha256'
+    ).hexdigest()[:SIGNATURE_LENGTH]
+
+
+def issue_token(session_id, now=None):
+    """Return (token, expires_at) for the session's current rotation window"""
+    window = current_window(now)
+    token = f"{session_id}|{window}|{_signature(session_id, window)}"
+    return token, window_bounds(window)[1]
+
+
+def verify_token(token, now=None):
+    """Validate a signed QR token and return the session id it was issued for"""
+    try:
+        session_id, window, signature = token.split('|')
+        session_id = int(session_id)
+        window = int(window)
+    except (AttributeError, ValueError):
+        raise InvalidQRToken('Malformed QR token')
+
+    if not constant_time_compare(signature, _signature(session_id, window)):
+        raise InvalidQRToken('Bad QR token signature')
+
+    if abs(current_window(now) - window) > settings.QR_TOKEN_GRACE_WINDOWS:
+        raise ExpiredQRToken('QR token window has passed')
+
+    return session_id
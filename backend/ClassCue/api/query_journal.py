@@ -0,0 +1,154 @@
+# api/query_journal.py
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from logging.handlers import RotatingFileHandler
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .metrics import current_stats
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+_IN_LIST = re.compile(r'\bIN \((?:%s, )*%s\)', re.IGNORECASE)
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_SPACE = re.compile(r'\s+')
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals and IN-list lengths removed"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def statement_shape(normalized_sql):
+    return hashlib.sha1(normalized_sql.encode()).hexdigest()[:16]
+
+
+def loggable_params(params):
+    """Numbers and NULLs as they are; anything else (emails, password hashes, tokens) as a type placeholder"""
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        params = params.values()
+    return [value if isinstance(value, (int, float, bool)) or value is None else f'<{type(value).__name__}>'
+            for value in params]
+
+
+class SlowQueryJournal:
+    """Rotating JSON-lines journal of statements slower than the threshold.
+
+    The query plan is captured the first time each statement shape is
+    journalled by this process; later entries for the shape only refer to it.
+    """
+
+    def __init__(self, path, max_bytes, backups):
+        self.path = str(path)
+        self._handler = RotatingFileHandler(self.path, maxBytes=max_bytes, backupCount=backups, delay=True)
+        self._lock = threading.Lock()
+        self._explained = set()
+        self._local = threading.local()
+
+    def record(self, connection, sql, params, duration, view, many=False):
+        normalized = normalize_sql(sql)
+        shape = statement_shape(normalized)
+        entry = {
+            'at': timezone.now().isoformat(),
+            'view': view,
+            'duration_ms': round(duration * 1000, 3),
+            'shape': shape,
+            'sql': normalized,
+            # executemany() parameter lists are not worth keeping, nor explainable as one statement
+            'params': None if many else loggable_params(params),
+        }
+        if not many:
+            with self._lock:
+                first_sighting = shape not in self._explained
+                self._explained.add(shape)
+            if first_sighting:
+                entry['plan'] = self.explain(connection, sql, params)
+        self.write(entry)
+
+    def explain(self, connection, sql, params):
+        if not sql.lstrip().upper().startswith(EXPLAINABLE):
+            return None
+        # Plain EXPLAIN never runs the statement; SQLite needs the QUERY PLAN form
+        prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+        self._local.explaining = True
+        try:
+            # A savepoint keeps a failed EXPLAIN from aborting the caller's transaction
+            with transaction.atomic(using=connection.alias):
+                with connection.cursor() as cursor:
+                    cursor.execute(prefix + sql, params)
+                    return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+        except DatabaseError as e:
+            return [f'EXPLAIN failed: {e}']
+        finally:
+            self._local.explaining = False
+
+    def is_explaining(self):
+        return getattr(self._local, 'explaining', False)
+
+    def write(self, entry):
+        record = logging.LogRecord(__name__, logging.WARNING, __file__, 0, json.dumps(entry, default=str), None, None)
+        with self._lock:
+            self._handler.emit(record)
+
+    def close(self):
+        self._handler.close()
+
+
+_journal = None
+_journal_lock = threading.Lock()
+
+
+def get_journal():
+    """Journal for the configured path (rebuilt if the setting changes)"""
+    global _journal
+    path = str(settings.SLOW_QUERY_LOG_PATH)
+    if _journal is None or _journal.path != path:
+        with _journal_lock:
+            if _journal is None or _journal.path != path:
+                if _journal is not None:
+                    _journal.close()
+                _journal = SlowQueryJournal(path, settings.SLOW_QUERY_LOG_MAX_BYTES, settings.SLOW_QUERY_LOG_BACKUPS)
+    return _journal
+
+
+def slow_query_logger(execute, sql, params, many, context):
+    """Execute wrapper that journals statements slower than SLOW_QUERY_THRESHOLD_MS"""
+    threshold = settings.SLOW_QUERY_THRESHOLD_MS
+    if threshold < 0:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    result = execute(sql, params, many, context)
+    duration = perf_counter() - started
+    if duration * 1000 >= threshold:
+        journal = get_journal()
+        if not journal.is_explaining():
+            stats = current_stats()
+            view = stats.view if stats is not None else None
+            try:
+                journal.record(context['connection'], sql, params, duration, view, many)
+            except Exception:
+                logger.exception('Could not journal slow query')
+    return result
+
+
+@receiver(connection_created)
+def install_slow_query_logger(sender, connection, **kwargs):
+    if slow_query_logger not in connection.execute_wrappers:
+        connection.execute_wrappers.append(slow_query_logger)
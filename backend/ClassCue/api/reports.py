@@ -0,0 +1,156 @@
+# api/reports.py
+
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+
+from .models import AttendanceRecord, AttendanceSession, SessionSnapshot, StudentProfile, Subject
+
+DEFAULTER_FIELDS = [
+    'enrollment_number', 'full_name', 'semester', 'subject_code', 'subject_name', 'attended', 'held',
+    'percentage', 'current_absence_streak', 'longest_absence_streak', 'classes_needed'
+]
+
+
+class AttendanceMatrix:
+    """Students × sessions boolean matrix of valid attendance for one subject.
+
+    Rows are the students of a department in the subject's semester, sorted by
+    enrollment number; columns are the subject's ended sessions taught in that
+    department, in the order they were held.
+    """
+
+    def __init__(self, students, names, session_ids, present):
+        self.students = students
+        self.names = names
+        self.session_ids = session_ids
+        self.present = present
+
+    @classmethod
+    def load(cls, subject, department, students, names, since=None, until=None, chunk_size=None):
+        chunk_size = chunk_size or settings.REPORT_CHUNK_SIZE
+        sessions = AttendanceSession.objects.filter(
+            subject=subject, is_active=False, teacher__teacherprofile__department=department
+        )
+        if since is not None:
+            sessions = sessions.filter(start_time__date__gte=since)
+        if until is not None:
+            sessions = sessions.filter(start_time__date__lte=until)
+        session_ids = np.array(sessions.order_by('start_time', 'id').values_list('id', flat=True), dtype=np.int64)
+        present = np.zeros((len(students), len(session_ids)), dtype=bool)
+        if not len(students) or not len(session_ids):
+            return cls(students, names, session_ids, present)
+
+        # Ended sessions are read from their snapshots: one row per session instead of one per record
+        columns = {session_id: column for column, session_id in enumerate(session_ids.tolist())}
+        snapshotted = set()
+        snapshots = SessionSnapshot.objects.filter(session__in=sessions).values_list('session_id', 'present')
+        for session_id, enrollment_numbers in snapshots.iterator(chunk_size=max(1, chunk_size // 100)):
+            snapshotted.add(session_id)
+            cls._mark(present, students, np.array(enrollment_numbers, dtype=str),
+                      np.full(len(enrollment_numbers), columns[session_id]))
+
+        # Sessions ended before snapshots existed fall back to their records, in chunks
+        missing = sorted(session_id for session_id in columns if session_id not in snapshotted)
+        if not missing:
+            return cls(students, names, session_ids, present)
+        missing_ids = np.array(missing, dtype=np.int64)
+        missing_columns = np.array([columns[session_id] for session_id in missing])
+        records = AttendanceRecord.objects.filter(
+            session__in=sessions.filter(snapshot__isnull=True), is_valid=True
+        ).values_list('student_id', 'session_id').iterator(chunk_size=chunk_size)
+        while chunk := list(islice(records, chunk_size)):
+            record_students = np.array([student for student, _ in chunk], dtype=str)
+            record_sessions = np.fromiter((session for _, session in chunk), dtype=np.int64, count=len(chunk))
+            cls._mark(present, students, record_students, missing_columns[np.searchsorted(missing_ids, record_sessions)])
+        return cls(students, names, session_ids, present)
+
+    @staticmethod
+    def _mark(present, students, enrollment_numbers, columns):
+        """Set present[row of each enrollment number, column]; rows are found by binary search"""
+        rows = np.searchsorted(students, enrollment_numbers)
+        # Students outside the cohort (another semester or department) are dropped
+        in_cohort = rows < len(students)
+        in_cohort[in_cohort] = students[rows[in_cohort]] == enrollment_numbers[in_cohort]
+        present[rows[in_cohort], columns[in_cohort]] = True
+
+    def attended(self):
+        return self.present.sum(axis=1)
+
+    def absence_streaks(self):
+        """(current, longest) runs of consecutive absences per student, one vector step per session"""
+        run = np.zeros(len(self.students), dtype=np.int64)
+        longest = np.zeros(len(self.students), dtype=np.int64)
+        for column in range(self.present.shape[1]):
+            run = np.where(self.present[:, column], 0, run + 1)
+            np.maximum(longest, run, out=longest)
+        return run, longest
+
+
+def classes_needed(attended, held, threshold):
+    """Consecutive classes each student must attend to reach `threshold` percent.
+
+    Smallest k with (attended + k) / (held + k) >= threshold / 100, i.e.
+    ceil((threshold * held - 100 * attended) / (100 - threshold)); at 75% that
+    is 3 * held - 4 * attended.
+    """
+    deficit = threshold * held - 100 * attended
+    return np.maximum(0, -(-deficit // (100 - threshold)))
+
+
+def cohort_students(department, semester):
+    """Enrollment numbers (sorted, as a NumPy array) and names of a department's semester"""
+    profiles = sorted(StudentProfile.objects.filter(department=department, semester=semester).values_list(
+        'enrollment_number', 'full_name'
+    ))
+    students = np.array([enrollment_number for enrollment_number, _ in profiles], dtype=str)
+    names = [full_name for _, full_name in profiles]
+    return students, names
+
+
+def defaulter_rows(department, semester=None, subject_codes=None, threshold=None, since=None, until=None,
+                   include_all=False, chunk_size=None):
+    """Yield one row per student below the threshold in each subject (every student with include_all).
+
+    Subjects are processed one at a time, so memory is bounded by the largest
+    cohort × sessions matrix rather than by the department's attendance history.
+    """
+    threshold = settings.ATTENDANCE_THRESHOLD_PERCENT if threshold is None else threshold
+    if not 0 < threshold < 100:
+        raise ValueError('threshold must be between 0 and 100')
+    subjects = Subject.objects.order_by('semester', 'subject_code')
+    if semester is not None:
+        subjects = subjects.filter(semester=semester)
+    if subject_codes:
+        subjects = subjects.filter(subject_code__in=subject_codes)
+
+    cohorts = {}
+    for subject in subjects:
+        if subject.semester not in cohorts:
+            cohorts = {subject.semester: cohort_students(department, subject.semester)}
+        students, names = cohorts[subject.semester]
+        matrix = AttendanceMatrix.load(subject, department, students, names, since, until, chunk_size)
+        held = len(matrix.session_ids)
+        if not held:
+            continue
+
+        attended = matrix.attended()
+        percentage = np.round(attended * 100 / held, 2)
+        current_streak, longest_streak = matrix.absence_streaks()
+        needed = classes_needed(attended, held, threshold)
+        selected = np.arange(len(students)) if include_all else np.flatnonzero(attended * 100 < threshold * held)
+        for row in selected:
+            yield {
+                'enrollment_number': str(students[row]),
+                'full_name': names[row],
+                'semester': subject.semester,
+                'subject_code': subject.subject_code,
+                'subject_name': subject.name,
+                'attended': int(attended[row]),
+                'held': held,
+                'percentage': float(percentage[row]),
+                'current_absence_streak': int(current_streak[row]),
+                'longest_absence_streak': int(longest_streak[row]),
+                'classes_needed': int(needed[row]),
+            }
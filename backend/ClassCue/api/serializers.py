@@ -1,18 +1,20 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import User, StudentProfile, TeacherProfile, Subject, AttendanceSession, AttendanceRecord
+from .metrics import TimedSerializerMixin
+from .models import User, StudentProfile, TeacherProfile, Subject, AttendanceSession, AttendanceRecord, StudentSubjectAttendance
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'email', 'role']
 
-class SubjectSerializer(serializers.ModelSerializer):
+class SubjectSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Subject
         fields = ['id', 'subject_code', 'name', 'semester']
 
 
-class AttendanceSessionSerializer(serializers.ModelSerializer):
+class AttendanceSessionSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     teacher_name = serializers.CharField(source='teacher.teacherprofile.full_name', read_only=True)
     subject_name = serializers.CharField(source='subject.name', read_only=True)
     attendance_count = serializers.SerializerMethodField()
@@ -23,10 +25,19 @@ class AttendanceSessionSerializer(serializers.ModelSerializer):
                  'start_time', 'end_time', 'is_active', 'current_qr_code', 'qr_expires_at', 'attendance_count']
     
     def get_attendance_count(self, obj):
+        # Listing querysets annotate the count; fall back to the counter column, the snapshot or a query
+        count = getattr(obj, 'valid_attendance_count', None)
+        if count is not None:
+            return count
+        if settings.ATTENDANCE_SESSION_COUNTER:
+            return obj.valid_record_count
+        snapshot = None if obj.is_active else getattr(obj, 'snapshot', None)
+        if snapshot is not None:
+            return snapshot.present_count
         return obj.attendance_records.filter(is_valid=True).count()
 
 
-class AttendanceRecordSerializer(serializers.ModelSerializer):
+class AttendanceRecordSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     student_name = serializers.CharField(source='student.full_name', read_only=True)
     student_enrollment = serializers.CharField(source='student.enrollment_number', read_only=True)
     
@@ -34,7 +45,17 @@ class AttendanceRecordSerializer(serializers.ModelSerializer):
         model = AttendanceRecord
         fields = ['id', 'student', 'student_name', 'student_enrollment', 'qr_code_used', 'marked_at', 'is_valid']
 
-class StudentProfileSerializer(serializers.ModelSerializer):
+
+class StudentSubjectAttendanceSerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    subject_code = serializers.CharField(source='subject.subject_code', read_only=True)
+    subject_name = serializers.CharField(source='subject.name', read_only=True)
+    percentage = serializers.FloatField(read_only=True)
+    
+    class Meta:
+        model = StudentSubjectAttendance
+        fields = ['subject', 'subject_code', 'subject_name', 'attended', 'held', 'percentage']
+
+class StudentProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # This is the key change. We tell 'email' it is for input only.
     email = serializers.CharField(required=True, write_only=True)
     password = serializers.CharField(write_only=True, required=True)
@@ -47,10 +68,9 @@ class StudentProfileSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = User.objects.create_user(
             email=validated_data['email'],
-            password=validated_data['password']
+            password=validated_data['password'],
+            role='student'
         )
-        user.role = 'student'
-        user.save()
 
         profile = StudentProfile.objects.create(
             user=user,
@@ -61,7 +81,7 @@ class StudentProfileSerializer(serializers.ModelSerializer):
         )
         return profile
 
-class TeacherProfileSerializer(serializers.ModelSerializer):
+class TeacherProfileSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     # Apply the same fix here
     email = serializers.EmailField(required=True, write_only=True)
     password = serializers.CharField(write_only=True, required=True)
@@ -73,10 +93,9 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         user = User.objects.create_user(
             email=validated_data['email'],
-            password=validated_data['password']
+            password=validated_data['password'],
+            role='teacher'
         )
-        user.role = 'teacher'
-        user.save()
 
         profile = TeacherProfile.objects.create(
             user=user,
@@ -85,12 +104,12 @@ class TeacherProfileSerializer(serializers.ModelSerializer):
         )
         return profile
 
-class StudentProfileUpdateSerializer(serializers.ModelSerializer):
+class StudentProfileUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = StudentProfile
         fields = ['full_name', 'interests', 'skills', 'goals']
 
-class TeacherProfileUpdateSerializer(serializers.ModelSerializer):
+class TeacherProfileUpdateSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = TeacherProfile
         fields = ['full_name']
\ No newline at end of file
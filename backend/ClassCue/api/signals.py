@@ -0,0 +1,18 @@
+# api/signals.py
+
+from django.dispatch import Signal
+
+# Sent after attendance records are written; kwargs: session_id, records (serialized dicts)
+attendance_marked = Signal()
+
+# Sent after a teacher invalidates a record; kwargs: session_id, record
+attendance_invalidated = Signal()
+
+# Sent when a session's QR code rotates; kwargs: session_id, qr_code, expires_at
+qr_rotated = Signal()
+
+# Sent when a teacher ends a session; kwargs: session
+session_ended = Signal()
+
+# Sent after a bulk QuerySet.update() changed users' password, role or activation; kwargs: user_ids
+users_access_changed = Signal()
@@ -0,0 +1,21 @@
+# api/summaries.py
+
+from django.dispatch import receiver
+
+from .models import AttendanceRollup, SessionSnapshot, StudentSubjectAttendance
+from .signals import attendance_invalidated, session_ended
+
+
+@receiver(session_ended)
+def credit_ended_session(sender, session, **kwargs):
+    SessionSnapshot.objects.take(session)
+    StudentSubjectAttendance.objects.credit_session(session)
+    AttendanceRollup.objects.add_session(session)
+
+
+@receiver(attendance_invalidated)
+def debit_invalidated_record(sender, session_id, record, **kwargs):
+    # Records in a running session are only counted when it ends, so these are no-ops until then
+    SessionSnapshot.objects.remove_record(record)
+    StudentSubjectAttendance.objects.debit_record(record)
+    AttendanceRollup.objects.remove_record(record)
@@ -1,3 +1,1256 @@
-from django.test import TestCase
+import csv
+import gzip
+import io
+import json
+import os
+import runpy
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import check_password, make_password
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import DatabaseError, IntegrityError, connections, transaction
+from django.test import AsyncRequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .authentication import get_token_state, issue_tokens, token_state_key, token_state_timeout
+from .benchmarks import BENCHMARKS, Fixture
+from .cache import bump_version, profile_namespace
+from .dataset import DatasetGenerator, DatasetSpec
+from .management.commands.load_test import classify, percentile
+from .events import (
+    InProcessBroker, encode_event, get_broker, issue_stream_token, session_channel, stream_session_events,
+    verify_stream_token
+)
+from .exports import streaming_response
+from .hashing import PasswordHashingPool, hash_passwords
+from .imports import import_accounts
+from .mark_log import MarkLog, MarkLogLocked, open_process_mark_log
+from .metrics import database_pool_metrics, registry
+from .models import (
+    AttendanceRecord, AttendanceRollup, AttendanceSession, SessionSnapshot, StudentProfile, StudentSubjectAttendance,
+    Subject, TeacherProfile, User
+)
+from .qr_images import QRImageCache, qr_image_cache
+from .reports import classes_needed
+from .qr_tokens import ExpiredQRToken, InvalidQRToken, issue_token, verify_token
+from .query_journal import get_journal
+
+
+def create_teacher(email='teacher@example.com', full_name='Prof. Test'):
+    teacher = User.objects.create_user(email=email, password='password123', role='teacher')
+    TeacherProfile.objects.create(user=teacher, full_name=full_name, department='Computer Engineering')
+    return teacher
+
+
+def create_student(number, full_name=None, department='Computer Engineering', semester=1):
+    user = User.objects.create_user(email=f'student{number}@example.com', password='password123', role='student')
+    return StudentProfile.objects.create(
+        user=user, enrollment_number=f'24017310700{number}', full_name=full_name or f'Student {number}',
+        department=department, semester=semester
+    )
+
+
+class ClassroomTestCase(TestCase):
+    """A teacher, the CS101 subject and numbered students, created once per class.
+
+    STUDENTS holds one (department, semester) pair per student. Each test
+    starts with an empty cache and a client authenticated as the teacher.
+    """
+
+    STUDENTS = [('Computer Engineering', 1)] * 3
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.teacher = create_teacher()
+        cls.subject = Subject.objects.create(subject_code='CS101', name='Programming Fundamentals', semester=1)
+        cls.students = [
+            create_student(number, department=department, semester=semester)
+            for number, (department, semester) in enumerate(cls.STUDENTS)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.teacher)
+
+    def create_session(self, session_name='Lecture 1', **fields):
+        return AttendanceSession.objects.create(teacher=self.teacher, subject=self.subject, session_name=session_name, **fields)
+
+
+@override_settings(QR_TOKEN_MODE='signed', QR_ROTATION_SECONDS=10, QR_TOKEN_GRACE_WINDOWS=1)
+class SignedQRTokenTests(TestCase):
+    def test_round_trip(self):
+        token, expires_at = issue_token(42)
+        self.assertEqual(verify_token(token), 42)
+        self.assertGreater(expires_at, timezone.now())
+
+    def test_grace_window(self):
+        now = timezone.now()
+        token, _ = issue_token(7, now=now)
+        self.assertEqual(verify_token(token, now=now + timedelta(seconds=10)), 7)
+        with self.assertRaises(ExpiredQRToken):
+            verify_token(token, now=now + timedelta(seconds=30))
+
+    def test_tampered_token(self):
+        token, _ = issue_token(7)
+        session_id, window, signature = token.split('|')
+        with self.assertRaises(InvalidQRToken):
+            verify_token(f"8|{window}|{signature}")
+        with self.assertRaises(InvalidQRToken):
+            verify_token('not-a-token')
+
+
+class CurrentQRCodeTests(ClassroomTestCase):
+    STUDENTS = []
+
+    def setUp(self):
+        super().setUp()
+        response = self.client.post(reverse('attendance-sessions'), {'session_name': 'Lecture 1', 'subject_id': self.subject.id})
+        self.session = AttendanceSession.objects.get(id=response.data['id'])
+        self.url = reverse('get-current-qr', args=[self.session.id])
+        qr_image_cache.clear()
+
+    def test_unchanged_poll_returns_304(self):
+        first = self.client.get(self.url)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first.data['qr_code'], self.session.current_qr_code)
+
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second.content, b'')
+        self.assertEqual(second['ETag'], first['ETag'])
+
+    def test_rotation_changes_etag(self):
+        first = self.client.get(self.url)
+        AttendanceSession.objects.filter(id=self.session.id).update(qr_expires_at=timezone.now() - timedelta(seconds=1))
+        second = self.client.get(self.url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second['ETag'], first['ETag'])
+
+    def test_image_is_rendered_on_first_poll_only(self):
+        with mock.patch('api.qr_images.render_qr_image', return_value='data:image/png;base64,') as render:
+            response = self.client.post(reverse('attendance-sessions'), {'session_name': 'Lecture 2', 'subject_id': self.subject.id})
+            render.assert_not_called()
+            url = reverse('get-current-qr', args=[response.data['id']])
+            self.client.get(url)
+            self.client.get(url)
+        render.assert_called_once()
+
+    def test_cache_size_follows_settings(self):
+        cache = QRImageCache()
+        with override_settings(QR_IMAGE_CACHE_SIZE=2), mock.patch('api.qr_images.render_qr_image', side_effect=str):
+            for number in range(3):
+                cache.get(f'code-{number}', None)
+        self.assertEqual(len(cache), 2)
+
+
+class InProcessBrokerTests(SimpleTestCase):
+    async def test_fan_out_to_every_viewer(self):
+        broker = InProcessBroker()
+        first = broker.subscribe('attendance-session:1')
+        second = broker.subscribe('attendance-session:1')
+        other = broker.subscribe('attendance-session:2')
+
+        message = encode_event('attendance', {'id': 1})
+        self.assertEqual(broker.publish('attendance-session:1', message), 2)
+        self.assertEqual(await first.get(1), message)
+        self.assertEqual(await second.get(1), message)
+        self.assertIsNone(await other.get(0.01))
+
+    async def test_stream_closes_when_session_ends(self):
+        broker = InProcessBroker()
+        subscription = broker.subscribe('attendance-session:1')
+        stream = stream_session_events(1, subscription, {'qr_code': None})
+        self.assertTrue((await stream.__anext__()).startswith(b'event: snapshot'))
+
+        broker.publish('attendance-session:1', encode_event('attendance', {'id': 5}))
+        broker.publish('attendance-session:1', encode_event('ended', {'session_id': 1}))
+        self.assertTrue((await stream.__anext__()).startswith(b'event: attendance'))
+        self.assertTrue((await stream.__anext__()).startswith(b'event: ended'))
+        with self.assertRaises(StopAsyncIteration):
+            await stream.__anext__()
+        self.assertEqual(broker.subscriber_count('attendance-session:1'), 0)
+
+
+class SessionStreamTokenTests(ClassroomTestCase):
+    STUDENTS = []
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.create_session()
+
+    def test_token_is_scoped_to_one_session(self):
+        response = self.client.post(reverse('session-events-token', args=[self.session.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(verify_stream_token(response.data['token'], self.session.id), self.teacher.id)
+        self.assertIsNone(verify_stream_token(response.data['token'], self.session.id + 1))
+        self.assertIsNone(verify_stream_token(response.data['token'] + 'x', self.session.id))
+
+    def test_token_expires(self):
+        token = issue_stream_token(self.session.id, self.teacher.id)
+        with override_settings(ATTENDANCE_EVENT_TOKEN_MAX_AGE=-1):
+            self.assertIsNone(verify_stream_token(token, self.session.id))
+
+    def test_only_the_sessions_teacher_gets_a_token(self):
+        other = User.objects.create_user(email='other@example.com', password='password123', role='teacher')
+        self.client.force_authenticate(other)
+        response = self.client.post(reverse('session-events-token', args=[self.session.id]))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_stream_rejects_access_token_in_query(self):
+        access = str(issue_tokens(self.teacher).access_token)
+        url = reverse('session-events', args=[self.session.id])
+        response = await self.async_client.get(url, {'access_token': access})
+        self.assertEqual(response.status_code, 401)
+        response = await self.async_client.get(url, {'token': 'not-a-token'})
+        self.assertEqual(response.status_code, 401)
+
+
+    def test_wsgi_stream_is_a_sync_iterator(self):
+        token = issue_stream_token(self.session.id, self.teacher.id)
+        response = self.client.get(reverse('session-events', args=[self.session.id]), {'token': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.is_async)
+
+        events = iter(response.streaming_content)
+        self.assertTrue(next(events).startswith(b'event: snapshot'))
+        channel = session_channel(self.session.id)
+        get_broker().publish(channel, encode_event('ended', {'session_id': self.session.id}))
+        self.assertTrue(next(events).startswith(b'event: ended'))
+        self.assertEqual(list(events), [])
+        self.assertEqual(get_broker().subscriber_count(channel), 0)
+
+
+@override_settings(ATTENDANCE_FEED_SETTLE_SECONDS=0)
+class AttendanceFeedTests(ClassroomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = self.create_session()
+        self.url = reverse('get-session-attendance', args=[self.session.id])
+
+    def mark(self, student):
+        return AttendanceRecord.objects.create(session=self.session, student=student, qr_code_used='code')
+
+    def test_since_returns_only_changes(self):
+        first = self.mark(self.students[0])
+        full = self.client.get(self.url)
+        self.assertEqual(full.data['total_attended'], 1)
+
+        second = self.mark(self.students[1])
+        first.invalidate()
+        delta = self.client.get(self.url, {'since': full.data['cursor']})
+        self.assertNotIn('session', delta.data)
+        self.assertEqual([record['id'] for record in delta.data['attendance_records']], [second.id])
+        self.assertEqual(delta.data['invalidated_records'], [first.id])
+        self.assertEqual(delta.data['total_attended'], 1)
+
+        empty = self.client.get(self.url, {'since': delta.data['cursor']})
+        self.assertEqual(empty.data['attendance_records'], [])
+        self.assertEqual(empty.data['invalidated_records'], [])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url, {'since': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MarkLogTests(ClassroomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = self.create_session()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / 'marks.log'
+
+    def test_replay_commits_each_scan_once(self):
+        mark_log = MarkLog(self.path, batch_size=2)
+        marked_at = timezone.now()
+        for student in self.students:
+            self.assertTrue(mark_log.append(self.session.id, student.enrollment_number, 'code', marked_at))
+        self.assertFalse(mark_log.append(self.session.id, self.students[0].enrollment_number, 'code', marked_at))
+
+        # Simulate a crash after the inserts but before the checkpoint advanced
+        mark_log._commit_batch([{
+            'session': self.session.id, 'student': student.enrollment_number,
+            'qr_code': 'code', 'marked_at': marked_at.isoformat()
+        } for student in self.students])
+        self.path.with_name('marks.log.offset').write_text('0')
+        mark_log.stop()
+
+        restarted = MarkLog(self.path, batch_size=2)
+        self.addCleanup(restarted.stop)
+        self.assertEqual(restarted.commit_pending(), 3)
+        self.assertEqual(AttendanceRecord.objects.filter(session=self.session).count(), 3)
+        self.assertEqual(AttendanceRecord.objects.first().marked_at, marked_at)
+        self.assertEqual(self.path.stat().st_size, 0)
+
+    def test_torn_tail_is_dropped(self):
+        self.path.write_bytes(b'{"session": 1, "stud')
+        MarkLog(self.path).stop()
+        self.assertEqual(self.path.read_bytes(), b'')
+
+    def test_each_process_owns_its_log(self):
+        mark_log = MarkLog(self.path)
+        with self.assertRaises(MarkLogLocked):
+            MarkLog(self.path)
+        other = open_process_mark_log(self.path)
+        self.assertEqual(other.path, self.path.with_name('marks.log.1'))
+        other.stop()
+        with self.assertRaises(CommandError):
+            call_command('commit_mark_log', path=str(self.path), stdout=io.StringIO())
+
+        mark_log.append(self.session.id, self.students[0].enrollment_number, 'code', timezone.now())
+        mark_log.stop()
+        output = io.StringIO()
+        call_command('commit_mark_log', path=str(self.path), stdout=output)
+        self.assertIn('Committed 1 logged scans', output.getvalue())
+
+    def test_poison_entry_is_dead_lettered(self):
+        mark_log = MarkLog(self.path, max_attempts=2)
+        self.addCleanup(mark_log.stop)
+        marked_at = timezone.now()
+        for enrollment_number in (self.students[0].enrollment_number, 'ghost', self.students[1].enrollment_number):
+            mark_log.append(self.session.id, enrollment_number, 'code', marked_at)
+
+        commit_batch = mark_log._commit_batch
+
+        def reject_ghost(entries):
+            if any(entry['student'] == 'ghost' for entry in entries):
+                raise IntegrityError('FOREIGN KEY constraint failed')
+            commit_batch(entries)
+
+        with mock.patch.object(mark_log, '_commit_batch', side_effect=reject_ghost):
+            with self.assertRaises(IntegrityError):
+                mark_log.commit_pending()
+            with self.assertLogs('api.mark_log', 'ERROR'):
+                self.assertEqual(mark_log.commit_pending(), 3)
+
+        self.assertEqual(AttendanceRecord.objects.filter(session=self.session).count(), 2)
+        dead = [json.loads(line) for line in self.path.with_name('marks.log.dead').read_text().splitlines()]
+        self.assertEqual([entry['student'] for entry in dead], ['ghost'])
+        self.assertIn('FOREIGN KEY', dead[0]['error'])
+        self.assertEqual(self.path.stat().st_size, 0)
+
+
+class MarkAttendanceQueryBudgetTests(ClassroomTestCase):
+    """The scan hot path is a single conditional INSERT once the student identity is cached"""
+
+    STUDENTS = []
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.student = create_student(2, full_name='Aryan Chalaliya')
+
+    def setUp(self):
+        super().setUp()
+        self.session = self.create_session(current_qr_code='code', qr_expires_at=timezone.now() + timedelta(minutes=5))
+        self.client.force_authenticate(self.student.user)
+        self.url = reverse('mark-attendance')
+        self.qr_code = f'{self.session.id}|code'
+
+    def test_success_uses_one_query_when_warm(self):
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'qr_code': self.qr_code})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['student_name'], 'Aryan Chalaliya')
+        self.assertEqual(response.data['id'], AttendanceRecord.objects.get().id)
+
+        other_session = AttendanceSession.objects.create(
+            teacher=self.session.teacher, subject=self.session.subject, session_name='Lecture 2',
+            qr_expires_at=timezone.now() + timedelta(minutes=5)
+        )
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, {'qr_code': f'{other_session.id}|code'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_rejections(self):
+        self.client.post(self.url, {'qr_code': self.qr_code})
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, {'qr_code': self.qr_code})
+        self.assertEqual(response.data['error'], 'Attendance already marked')
+
+        AttendanceSession.objects.filter(id=self.session.id).update(qr_expires_at=timezone.now() - timedelta(seconds=1))
+        AttendanceRecord.objects.all().delete()
+        response = self.client.post(self.url, {'qr_code': self.qr_code})
+        self.assertEqual(response.data['error'], 'QR code has expired')
+
+        AttendanceSession.objects.filter(id=self.session.id).update(is_active=False)
+        response = self.client.post(self.url, {'qr_code': self.qr_code})
+        self.assertEqual(response.data['error'], 'Invalid or expired QR code')
+        self.assertFalse(AttendanceRecord.objects.exists())
+
+
+@override_settings(ATTENDANCE_SESSION_COUNTER=True, SLOW_QUERY_THRESHOLD_MS=-1)
+class SQLiteConcurrentModeTests(SimpleTestCase):
+    """A class-sized burst of marks against a file database configured by SQLITE_CONCURRENT_MODE"""
+
+    ALIAS = 'concurrent'
+    STUDENTS = 200
+
+    @classmethod
+    def setUpClass(cls):
+        # The alias only exists for this class, so the test runner must not see it in
+        # `databases`; it is registered before SimpleTestCase checks the aliases in use
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        environment = {
+            'DB_ENGINE': 'sqlite',
+            'SQLITE_CONCURRENT_MODE': 'True',
+            'SQLITE_PATH': str(Path(directory.name) / 'db.sqlite3'),
+        }
+        with mock.patch.dict(os.environ, environment):
+            configured = runpy.run_path(Path(__file__).resolve().parent.parent / 'ClassCue' / 'settings.py')
+        connections.settings[cls.ALIAS] = connections.configure_settings(configured['DATABASES'])['default']
+        cls.addClassCleanup(connections.settings.pop, cls.ALIAS)
+        cls.addClassCleanup(connections.__delitem__, cls.ALIAS)
+        cls.addClassCleanup(lambda: connections[cls.ALIAS].close())
+        cls.databases = {cls.ALIAS}
+        super().setUpClass()
+
+    def setUp(self):
+        call_command('migrate', database=self.ALIAS, verbosity=0)
+        teacher = User.objects.db_manager(self.ALIAS).create_user(
+            email='teacher@example.com', password='password123', role='teacher'
+        )
+        subject = Subject.objects.using(self.ALIAS).create(subject_code='CS101', name='Programming Fundamentals', semester=1)
+        self.session = AttendanceSession.objects.using(self.ALIAS).create(
+            teacher=teacher, subject=subject, session_name='Lecture 1'
+        )
+        users = User.objects.using(self.ALIAS).bulk_create(
+            User(email=f'student{number}@example.com', role='student') for number in range(self.STUDENTS)
+        )
+        self.students = StudentProfile.objects.using(self.ALIAS).bulk_create(
+            StudentProfile(user=user, enrollment_number=f'2401731{number:05d}', full_name=f'Student {number}',
+                           department='Computer Engineering', semester=1)
+            for number, user in enumerate(users)
+        )
+
+    def test_parallel_marks_do_not_hit_lock_errors(self):
+        with connections[self.ALIAS].cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+
+        start = threading.Barrier(self.STUDENTS)
+        errors = []
+        inserted = []
+
+        def mark(student):
+            try:
+                start.wait()
+                # Read, then write, in one transaction: the shape that fails with
+                # "database is locked" when a deferred transaction upgrades its lock
+                with transaction.atomic(using=self.ALIAS):
+                    StudentProfile.objects.using(self.ALIAS).get(enrollment_number=student.enrollment_number)
+                    record_id = AttendanceRecord.objects.db_manager(self.ALIAS).insert_if_absent(
+                        self.session.id, student.enrollment_number, 'code', timezone.now()
+                    )
+                inserted.append(record_id)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections[self.ALIAS].close()
+
+        threads = [threading.Thread(target=mark, args=(student,)) for student in self.students]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(inserted), self.STUDENTS)
+        self.assertNotIn(None, inserted)
+        self.assertEqual(AttendanceRecord.objects.using(self.ALIAS).count(), self.STUDENTS)
+        self.session.refresh_from_db(using=self.ALIAS)
+        self.assertEqual(self.session.valid_record_count, self.STUDENTS)
+
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+    SETTINGS = Path(__file__).resolve().parent.parent / 'ClassCue' / 'settings.py'
+
+    def configure(self, **environment):
+        with mock.patch.dict(os.environ, {'DB_NAME': 'classcue_db', 'DB_HOST': 'localhost'}):
+            os.environ.pop('DB_ENGINE', None)
+            os.environ.update(environment)
+            return runpy.run_path(self.SETTINGS)['DATABASES']['default']
+
+    def test_sqlite_unless_postgresql_is_chosen(self):
+        self.assertEqual(self.configure()['ENGINE'], 'django.db.backends.sqlite3')
+        self.assertEqual(self.configure(DB_ENGINE='postgresql')['ENGINE'], 'django.db.backends.postgresql')
+
+    def test_unknown_engine_is_rejected(self):
+        with self.assertRaisesMessage(ImproperlyConfigured, "DB_ENGINE must be 'postgresql' or 'sqlite'"):
+            self.configure(DB_ENGINE='mysql')
+
+    def test_qrcode_is_not_imported_at_startup(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        output = Path(directory.name) / 'startup.json'
+        call_command('startup_benchmark', runs=1, output=str(output), stdout=io.StringIO())
+        heavy = json.loads(output.read_text())['heavy_modules_after_first_requests']
+        self.assertNotIn('qrcode', heavy)
+        self.assertNotIn('PIL', heavy)
+
+class TeacherSessionListingTests(ClassroomTestCase):
+    STUDENTS = [('Computer Engineering', 1)]
+
+    def create_sessions(self, count):
+        for number in range(count):
+            session = self.create_session(f'Lecture {number}')
+            AttendanceRecord.objects.create(session=session, student=self.students[0], qr_code_used='code')
+
+    def test_query_count_does_not_grow_with_sessions(self):
+        self.create_sessions(3)
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('attendance-sessions'))
+        self.assertEqual(len(response.json()['results']), 3)
+        self.assertEqual(response.json()['results'][0]['attendance_count'], 1)
+        self.assertEqual(response.json()['results'][0]['teacher_name'], 'Prof. Test')
+
+        self.create_sessions(20)
+        with self.assertNumQueries(1):
+            self.client.get(reverse('attendance-sessions'))
+
+    def test_keyset_pages_cover_every_session_once(self):
+        self.create_sessions(7)
+        # Identical start times exercise the id tie-breaker
+        AttendanceSession.objects.update(start_time=timezone.now())
+        seen, cursor = [], None
+        while True:
+            params = {'page_size': 3, **({'cursor': cursor} if cursor else {})}
+            with self.assertNumQueries(1):
+                response = self.client.get(reverse('attendance-sessions'), params)
+            seen.extend(session['id'] for session in response.json()['results'])
+            cursor = response.json()['next_cursor']
+            if cursor is None:
+                break
+        expected = list(AttendanceSession.objects.order_by('-start_time', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    @override_settings(ATTENDANCE_SESSION_COUNTER=True)
+    def test_denormalized_counter(self):
+        session = self.create_session(qr_expires_at=timezone.now() + timedelta(minutes=5))
+        record_id = AttendanceRecord.objects.insert_if_absent(session.id, self.students[0].enrollment_number, 'code', timezone.now())
+        self.assertIsNone(AttendanceRecord.objects.insert_if_absent(session.id, self.students[0].enrollment_number, 'code', timezone.now()))
+        session.refresh_from_db()
+        self.assertEqual(session.valid_record_count, 1)
+
+        record = AttendanceRecord.objects.get(id=record_id)
+        self.assertTrue(record.invalidate())
+        self.assertFalse(record.invalidate())
+        session.refresh_from_db()
+        self.assertEqual(session.valid_record_count, 0)
+
+
+class StudentSubjectAttendanceTests(ClassroomTestCase):
+    STUDENTS = [('Computer Engineering', semester) for semester in (1, 1, 1, 3)]
+
+    def run_session(self, *attendees):
+        session = self.create_session('Lecture')
+        records = [AttendanceRecord.objects.create(session=session, student=self.students[number], qr_code_used='code')
+                   for number in attendees]
+        return session, records
+
+    def end(self, session):
+        response = self.client.post(reverse('end-attendance-session', args=[session.id]))
+        self.assertEqual(response.status_code, 200)
+
+    def summary(self):
+        return {
+            (row.student_id[-1], row.subject_id): (row.attended, row.held)
+            for row in StudentSubjectAttendance.objects.all()
+        }
+
+    def test_incremental_updates_match_rebuild(self):
+        # Student 3 is in another semester and only counts the session they attended
+        first, records = self.run_session(0, 1, 3)
+        self.end(first)
+        self.end(first)
+        self.client.post(reverse('invalidate-attendance-record', args=[records[1].id]))
+
+        second, records = self.run_session(0, 2)
+        self.client.post(reverse('invalidate-attendance-record', args=[records[1].id]))
+        self.end(second)
+
+        subject = self.subject.id
+        expected = {('0', subject): (2, 2), ('1', subject): (0, 2), ('2', subject): (0, 2), ('3', subject): (1, 1)}
+        self.assertEqual(self.summary(), expected)
+        self.assertEqual(StudentSubjectAttendance.objects.rebuild(), 4)
+        self.assertEqual(self.summary(), expected)
+
+    def test_failed_crediting_leaves_the_session_open(self):
+        session, _ = self.run_session(0, 1)
+        with mock.patch('api.summaries.AttendanceRollup.objects.add_session', side_effect=DatabaseError('disk full')):
+            with self.assertRaises(DatabaseError):
+                self.client.post(reverse('end-attendance-session', args=[session.id]))
+        session.refresh_from_db()
+        self.assertTrue(session.is_active)
+        self.assertFalse(SessionSnapshot.objects.filter(session=session).exists())
+        self.assertEqual(self.summary(), {})
+
+        # Nothing was half-credited, so ending it again counts it exactly once
+        self.end(session)
+        self.assertEqual(self.summary()[('0', self.subject.id)], (1, 1))
+        self.assertEqual(SessionSnapshot.objects.get(session=session).present_count, 2)
+
+    def test_late_records_are_refreshed(self):
+        session, _ = self.run_session(0)
+        self.end(session)
+        AttendanceRecord.objects.create(session=session, student=self.students[1], qr_code_used='code')
+        StudentSubjectAttendance.objects.refresh_late_records({session.id}, {self.students[1].enrollment_number})
+        self.assertEqual(self.summary()[('1', self.subject.id)], (1, 1))
+
+    def test_student_summary_is_one_read(self):
+        session, _ = self.run_session(0)
+        self.end(session)
+        student = self.students[0]
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {issue_tokens(student.user, student_profile=student).access_token}")
+        client.get(reverse('attendance-summary'))  # warm the token state cache
+
+        with self.assertNumQueries(1):
+            response = client.get(reverse('attendance-summary'))
+        self.assertEqual(response.data['subjects'], [{
+            'subject': self.subject.id, 'subject_code': 'CS101', 'subject_name': 'Programming Fundamentals',
+            'attended': 1, 'held': 1, 'percentage': 100.0
+        }])
+        self.assertEqual(self.client.get(reverse('attendance-summary')).status_code, 404)
+
+
+class SessionSnapshotTests(ClassroomTestCase):
+    def setUp(self):
+        super().setUp()
+        self.session = self.create_session()
+        started = timezone.now()
+        self.records = [
+            AttendanceRecord.objects.create(
+                session=self.session, student=self.students[number], qr_code_used='code',
+                marked_at=started + timedelta(minutes=number)
+            )
+            for number in (2, 0, 1)
+        ]
+        self.client.post(reverse('end-attendance-session', args=[self.session.id]))
+
+    def test_end_freezes_attendance_and_invalidation_updates_it(self):
+        snapshot = SessionSnapshot.objects.get(session=self.session)
+        self.assertEqual(snapshot.present, ['240173107000', '240173107001', '240173107002'])
+        self.assertEqual((snapshot.present_count, snapshot.invalidated_count), (3, 0))
+        self.assertEqual(snapshot.last_arrival, self.records[0].marked_at)
+
+        # The latest arrival is invalidated, so the arrival window shrinks
+        self.client.post(reverse('invalidate-attendance-record', args=[self.records[0].id]))
+        snapshot.refresh_from_db()
+        self.assertEqual(snapshot.present, ['240173107000', '240173107001'])
+        self.assertEqual((snapshot.present_count, snapshot.invalidated_count), (2, 1))
+        self.assertEqual((snapshot.first_arrival, snapshot.last_arrival), (self.records[1].marked_at, self.records[2].marked_at))
+
+    def test_present_is_in_python_order_whatever_the_collation(self):
+        students = [create_student(number) for number in ('abc', 'ABD', 'b')]
+        session = self.create_session('Lecture 2', is_active=False)
+        records = [AttendanceRecord.objects.create(session=session, student=student, qr_code_used='code')
+                   for student in students]
+        # A locale collation (en_US on PostgreSQL) hands rows back case-insensitively: abc, ABD, b
+        rows = sorted(
+            AttendanceRecord.objects.filter(session=session).values_list('student_id', 'marked_at', 'is_valid'),
+            key=lambda row: row[0].lower()
+        )
+        collated = mock.Mock()
+        collated.filter.return_value.values_list.return_value = rows
+        collated.filter.return_value.order_by.return_value.values_list.return_value = rows
+        with mock.patch.object(AttendanceRecord, 'objects', collated):
+            snapshot = SessionSnapshot.objects.take(session)
+        self.assertEqual(snapshot.present, ['24017310700ABD', '24017310700abc', '24017310700b'])
+
+        for record in records:
+            record.invalidate()
+            SessionSnapshot.objects.remove_record(record)
+        snapshot.refresh_from_db()
+        self.assertEqual((snapshot.present, snapshot.present_count, snapshot.invalidated_count), ([], 0, 3))
+
+    def test_historical_views_read_the_snapshot(self):
+        # Rows changed behind the snapshot's back are not recounted
+        AttendanceRecord.objects.filter(session=self.session).update(is_valid=False)
+        listing = self.client.get(reverse('attendance-sessions'))
+        self.assertEqual(listing.json()['results'][0]['attendance_count'], 3)
+        page = self.client.get(reverse('get-session-attendance', args=[self.session.id]), {'page_size': 10})
+        self.assertEqual(page.data['total_attended'], 3)
+        self.assertEqual(page.data['session']['attendance_count'], 3)
+
+
+class AttendanceRollupTests(ClassroomTestCase):
+    STUDENTS = [('Computer Engineering', semester) for semester in (1, 1, 3)]
+
+    def run_session(self, *attendees):
+        session = self.create_session('Lecture')
+        records = [AttendanceRecord.objects.create(session=session, student=self.students[number], qr_code_used='code')
+                   for number in attendees]
+        self.client.post(reverse('end-attendance-session', args=[session.id]))
+        return records
+
+    def cells(self):
+        return sorted(AttendanceRollup.objects.values_list('department', 'semester', 'sessions', 'expected', 'attended'))
+
+    def test_incremental_cells_match_rebuild_and_roll_up(self):
+        # Student 2 is in semester 3 and only expected at the session they attended
+        self.run_session(0, 2)
+        records = self.run_session(1)
+        self.client.post(reverse('invalidate-attendance-record', args=[records[0].id]))
+
+        expected = [('Computer Engineering', 1, 2, 4, 1), ('Computer Engineering', 3, 0, 1, 1)]
+        self.assertEqual(self.cells(), expected)
+        self.assertEqual(AttendanceRollup.objects.rebuild(), 2)
+        self.assertEqual(self.cells(), expected)
+
+        url = reverse('attendance-rollup')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'group_by': 'department'})
+        self.assertEqual(response.data['results'], [{
+            'department': 'Computer Engineering', 'sessions': 2, 'expected': 5, 'attended': 2, 'rate': 40.0
+        }])
+        response = self.client.get(url, {'group_by': 'semester,subject,month', 'semester': 1})
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertEqual(response.data['results'][0]['subject_code'], 'CS101')
+        self.assertEqual(response.data['totals']['rate'], 25.0)
+        self.assertEqual(self.client.get(url, {'group_by': 'teacher'}).status_code, 400)
+
+
+class DefaulterReportTests(ClassroomTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        # Present (1) or absent (0) in four ended sessions; an open session is not counted
+        attendance = dict(zip(cls.students, ['1111', '1100', '0101']))
+        for index in range(5):
+            session = AttendanceSession.objects.create(
+                teacher=cls.teacher, subject=cls.subject, session_name=f'Lecture {index}', is_active=index == 4
+            )
+            for student, pattern in attendance.items():
+                if index == 4 or pattern[index] == '1':
+                    AttendanceRecord.objects.create(session=session, student=student, qr_code_used='code')
+        AttendanceRecord.objects.filter(student=cls.students[2], session__session_name='Lecture 3').update(is_valid=False)
+        cls.url = reverse('defaulter-report')
+
+    def test_defaulters_with_streaks_and_shortfall(self):
+        response = self.client.get(self.url, {'department': 'Computer Engineering', 'output': 'csv'})
+        self.assertEqual(response.status_code, 200)
+        rows = list(csv.DictReader(io.StringIO(b''.join(response.streaming_content).decode())))
+        self.assertEqual(
+            [(row['enrollment_number'], row['attended'], row['held'], row['percentage'], row['current_absence_streak'],
+              row['longest_absence_streak'], row['classes_needed']) for row in rows],
+            [('240173107001', '2', '4', '50.0', '2', '2', '4'), ('240173107002', '1', '4', '25.0', '2', '2', '8')]
+        )
+
+        response = self.client.get(self.url, {'department': 'Computer Engineering', 'output': 'json', 'all': 'true'})
+        rows = json.loads(b''.join(response.streaming_content))
+        self.assertEqual([row['percentage'] for row in rows], [100.0, 50.0, 25.0])
+
+    def test_snapshots_and_records_agree(self):
+        params = {'department': 'Computer Engineering', 'output': 'json', 'all': 'true'}
+        from_records = json.loads(b''.join(self.client.get(self.url, params).streaming_content))
+        call_command('snapshot_sessions', stdout=io.StringIO())
+        self.assertEqual(SessionSnapshot.objects.count(), 4)
+        from_snapshots = json.loads(b''.join(self.client.get(self.url, params).streaming_content))
+        self.assertEqual(from_snapshots, from_records)
+
+    def test_classes_needed_reaches_the_threshold(self):
+        attended = np.array([0, 2, 3, 7, 10])
+        needed = classes_needed(attended, 10, 75)
+        self.assertEqual(needed.tolist(), [30, 22, 18, 2, 0])
+        self.assertTrue(((attended + needed) * 100 >= 75 * (10 + needed)).all())
+        self.assertTrue(((attended + needed - 1) * 100 < 75 * (10 + needed - 1))[needed > 0].all())
+
+    def test_rejections(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        response = self.client.get(self.url, {'department': 'Computer Engineering', 'since': '2024-13-01'})
+        self.assertEqual(response.status_code, 400)
+        student = APIClient()
+        student.force_authenticate(User.objects.get(email='student0@example.com'))
+        self.assertEqual(student.get(self.url, {'department': 'Computer Engineering'}).status_code, 403)
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('defaulter_report', 'Computer Engineering', '--subject', 'CS101', stdout=output)
+        self.assertEqual(output.getvalue().splitlines()[0].split(',')[0], 'enrollment_number')
+        self.assertEqual(len(output.getvalue().splitlines()), 3)
+
+
+class AttendanceExportTests(ClassroomTestCase):
+    STUDENTS = [(department, 1) for department in ('Computer Engineering', 'Computer Engineering', 'Mechanical Engineering')]
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        session = AttendanceSession.objects.create(teacher=cls.teacher, subject=cls.subject, session_name='Lecture 1')
+        for student in cls.students:
+            AttendanceRecord.objects.create(session=session, student=student, qr_code_used='code')
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('export-attendance')
+
+    def test_csv_jsonl_and_gzip(self):
+        response = self.client.get(self.url, {'department': 'Computer Engineering'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="attendance.csv"')
+        plain = b''.join(response.streaming_content)
+        rows = list(csv.DictReader(io.StringIO(plain.decode())))
+        self.assertEqual([row['enrollment_number'] for row in rows], ['240173107000', '240173107001'])
+        self.assertEqual(rows[0]['subject_code'], 'CS101')
+
+        response = self.client.get(self.url, {'department': 'Computer Engineering', 'gzip': 'true'})
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+        response = self.client.get(self.url, {'output': 'jsonl', 'until': '2000-01-01'})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        response = self.client.get(self.url, {'output': 'jsonl'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['department'] for line in lines][-1], 'Mechanical Engineering')
+
+    def test_rejections(self):
+        self.assertEqual(self.client.get(self.url, {'output': 'xml'}).status_code, 400)
+        student = APIClient()
+        student.force_authenticate(User.objects.get(email='student0@example.com'))
+        self.assertEqual(student.get(self.url).status_code, 403)
+
+    async def test_asgi_responses_stream_without_buffering(self):
+        request = AsyncRequestFactory().get(self.url)
+        response = streaming_response(request, iter(['a,b\n', '1,2\n']), 'text/csv')
+        self.assertTrue(response.is_async)
+        self.assertEqual(b''.join([block async for block in response.streaming_content]), b'a,b\n1,2\n')
+
+
+class AccountImportTests(TestCase):
+    STUDENTS = (
+        'email,password,full_name,enrollment_number,department,semester\n'
+        'a@example.com,secret-a,Student A,240173107001,Computer Engineering,1\n'
+        'not-an-email,secret-b,Student B,240173107002,Computer Engineering,1\n'
+        'c@example.com,secret-c,Student C,240173107001,Computer Engineering,first\n'
+        'taken@example.com,secret-d,Student D,240173107004,Computer Engineering,1\n'
+        'E@Example.COM,secret-e,Student E,240173107005,Computer Engineering,2\n'
+        'f@example.com,12345678,Student F,240173107006,Computer Engineering,2\n'
+    )
+
+    def setUp(self):
+        User.objects.create_user(email='taken@example.com', password='password123', role='teacher')
+
+    def test_imports_valid_rows_and_reports_the_rest(self):
+        report = import_accounts(io.StringIO(self.STUDENTS), 'student', batch_size=1, workers=1)
+        self.assertEqual([(entry['row'], entry['status']) for entry in report], [
+            (2, 'created'), (3, 'invalid'), (4, 'invalid'), (5, 'invalid'), (6, 'created'), (7, 'invalid')
+        ])
+        self.assertIn('enrollment_number repeats row 2', report[2]['errors'])
+        self.assertIn('semester must be a positive whole number', report[2]['errors'])
+        self.assertEqual(report[3]['errors'], 'email is already registered')
+        self.assertIn('password: This password is too common.', report[5]['errors'])
+        self.assertIn('password: This password is entirely numeric.', report[5]['errors'])
+        self.assertFalse(User.objects.filter(email='f@example.com').exists())
+
+        user = User.objects.get(email='E@example.com')
+        self.assertEqual(user.role, 'student')
+        self.assertTrue(user.check_password('secret-e'))
+        self.assertEqual(user.studentprofile.enrollment_number, '240173107005')
+        self.assertEqual(user.studentprofile.semester, 2)
+
+        # Running the same file again resumes: imported rows are skipped, nothing is created twice
+        report = import_accounts(io.StringIO(self.STUDENTS), 'student', workers=1)
+        self.assertEqual([entry['status'] for entry in report], ['skipped', 'invalid', 'invalid', 'invalid', 'skipped', 'invalid'])
+        self.assertEqual(StudentProfile.objects.count(), 2)
+
+    def test_dry_run_and_missing_columns(self):
+        report = import_accounts(io.StringIO(self.STUDENTS), 'student', dry_run=True)
+        self.assertEqual([entry['status'] for entry in report].count('valid'), 2)
+        self.assertFalse(StudentProfile.objects.exists())
+        with self.assertRaisesMessage(ValueError, 'missing column(s): password'):
+            import_accounts(io.StringIO('email,full_name,department\n'), 'teacher')
+
+    def test_passwords_are_hashed_in_worker_processes(self):
+        hashes = list(hash_passwords(['one', 'two', 'three'], workers=2))
+        self.assertEqual([check_password(raw, encoded) for raw, encoded in zip(['one', 'two', 'three'], hashes)],
+                         [True, True, True])
+
+    def test_endpoint_is_for_admins(self):
+        upload = SimpleUploadedFile('teachers.csv', b'email,password,full_name,department\n'
+                                                    b't@example.com,secret-t,Teacher T,Computer Engineering\n'
+                                                    b'taken@example.com,secret-u,Teacher U,Computer Engineering\n')
+        client = APIClient()
+        client.force_authenticate(User.objects.get(email='taken@example.com'))
+        self.assertEqual(client.post(reverse('import-accounts'), {'file': upload}).status_code, 403)
+
+        upload.seek(0)
+        client.force_authenticate(User.objects.create_user(email='admin@example.com', password='x', role='admin'))
+        response = client.post(reverse('import-accounts'), {'file': upload, 'role': 'teacher'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['invalid']), (1, 1))
+        self.assertEqual(response.data['errors'][0]['row'], 3)
+        self.assertEqual(TeacherProfile.objects.get(user__email='t@example.com').full_name, 'Teacher T')
+        self.assertEqual(client.post(reverse('import-accounts'), {'role': 'teacher'}).status_code, 400)
+
+
+class DatasetGeneratorTests(TestCase):
+    SPEC = DatasetSpec(seed=7, departments=2, students=64, teachers=4, subjects=6, weeks=2, lectures_per_week=2,
+                       batch_size=100)
+
+    def fingerprint(self):
+        return list(AttendanceRecord.objects.order_by('session__start_time', 'session__subject__subject_code', 'student_id')
+                    .values_list('session__start_time', 'session__subject__subject_code', 'student_id', 'marked_at',
+                                 'is_valid'))
+
+    def test_same_seed_gives_the_same_campus(self):
+        counts = DatasetGenerator(self.SPEC).generate()
+        self.assertEqual((counts['students'], counts['teachers'], counts['subjects']), (64, 4, 6))
+        self.assertEqual(counts['records'], AttendanceRecord.objects.count())
+        first = self.fingerprint()
+        self.assertTrue(first)
+        with self.assertRaises(ValueError):
+            DatasetGenerator(self.SPEC).generate()
+
+        User.objects.all().delete()
+        Subject.objects.all().delete()
+        DatasetGenerator(self.SPEC).generate()
+        self.assertEqual(self.fingerprint(), first)
+
+    def test_derived_data_matches_the_records(self):
+        DatasetGenerator(self.SPEC).generate()
+        for session in AttendanceSession.objects.select_related('snapshot'):
+            self.assertLess(session.start_time, session.end_time)
+            snapshot = session.snapshot
+            retaken = SessionSnapshot.objects.take(session)
+            self.assertEqual((snapshot.present, snapshot.invalidated_count), (retaken.present, retaken.invalidated_count))
+            self.assertEqual(session.valid_record_count, retaken.present_count)
+
+        summaries = set(StudentSubjectAttendance.objects.values_list('student_id', 'subject_id', 'attended', 'held'))
+        StudentSubjectAttendance.objects.rebuild()
+        self.assertEqual(set(StudentSubjectAttendance.objects.values_list('student_id', 'subject_id', 'attended', 'held')),
+                         summaries)
+
+
+class PrincipalAuthenticationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = create_student(2, full_name='Aryan Chalaliya', semester=5).user
+
+    def setUp(self):
+        cache.clear()
+        response = self.client.post(reverse('login'), {'email': '240173107002', 'password': 'password123'})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+
+    def test_profile_skips_users_table(self):
+        self.client.get(reverse('user-profile'))
+        bump_version(profile_namespace(self.user.id))
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.json()['enrollment_number'], '240173107002')
+        self.assertEqual(response.json()['user_email'], 'student2@example.com')
+
+    def test_password_change_revokes_tokens(self):
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+        user = User.objects.get(id=self.user.id)
+        user.set_password('new-password123')
+        user.save()
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    def test_deactivation_revokes_tokens(self):
+        user = User.objects.get(id=self.user.id)
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    def test_bulk_deactivation_revokes_tokens(self):
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+        token_version = User.objects.get(id=self.user.id).token_version
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        self.assertEqual(User.objects.get(id=self.user.id).token_version, token_version + 1)
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+
+    def test_stale_state_in_another_worker_expires(self):
+        self.client.get(reverse('user-profile'))
+        stale = get_token_state(self.user.id)
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        # A worker whose per-process cache never saw the revocation still holds the old state
+        cache.set(token_state_key(self.user.id), stale, token_state_timeout())
+        self.assertEqual(self.client.get(reverse('user-profile')).status_code, 200)
+
+        later = time.time() + settings.TOKEN_STATE_LOCAL_CACHE_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: later)):
+            self.assertEqual(self.client.get(reverse('user-profile')).status_code, 401)
+        self.assertLess(token_state_timeout(), settings.SIMPLE_JWT['ACCESS_TOKEN_LIFETIME'].total_seconds())
+
+
+class LoginTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_student(2, full_name='Aryan Chalaliya', semester=5)
+
+    def test_enrollment_login_hashes_once_in_one_query(self):
+        with mock.patch('api.hashing.check_password', wraps=check_password) as hashed:
+            with self.assertNumQueries(1):
+                response = self.client.post(reverse('login'), {'email': '240173107002', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(hashed.call_count, 1)
+        self.assertEqual(response.json()['user']['user_email'], 'student2@example.com')
+
+    def test_rehash_on_login_keeps_the_new_tokens_valid(self):
+        User.objects.filter(email='student2@example.com').update(
+            password=make_password('password123', hasher='pbkdf2_sha1')
+        )
+        token_version = User.objects.get(email='student2@example.com').token_version
+        response = self.client.post(reverse('login'), {'email': 'student2@example.com', 'password': 'password123'})
+        self.assertEqual(response.status_code, 200)
+        user = User.objects.get(email='student2@example.com')
+        self.assertTrue(user.password.startswith('pbkdf2_sha256$'))
+        self.assertEqual(user.token_version, token_version)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+        self.assertEqual(client.get(reverse('user-profile')).status_code, 200)
+
+    def test_wrong_password_hashes_once(self):
+        with mock.patch('api.hashing.check_password', wraps=check_password) as hashed:
+            response = self.client.post(reverse('login'), {'email': '240173107002', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(hashed.call_count, 1)
+
+    def test_saturated_pool_sheds_load(self):
+        release = threading.Event()
+        pool = PasswordHashingPool(workers=1, max_pending=0)
+        pool._executor.submit(release.wait)
+        pool._slots.acquire()
+        try:
+            with mock.patch('api.views.get_hashing_pool', return_value=pool):
+                response = self.client.post(reverse('login'), {'email': 'student2@example.com', 'password': 'password123'})
+        finally:
+            release.set()
+        self.assertEqual(response.status_code, 429)
+        self.assertIn('Retry-After', response)
+
+
+class ResponseCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.profile = create_student(2, full_name='Aryan Chalaliya', semester=5)
+
+    def setUp(self):
+        cache.clear()
+        response = self.client.post(reverse('login'), {'email': '240173107002', 'password': 'password123'})
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['access']}")
+
+    def test_profile_is_served_from_cache_until_it_changes(self):
+        first = self.client.get(reverse('user-profile'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('user-profile'))
+        self.assertEqual(first.content, second.content)
+
+        self.profile.full_name = 'Aryan C.'
+        self.profile.save()
+        response = self.client.get(reverse('user-profile'))
+        self.assertEqual(response.json()['full_name'], 'Aryan C.')
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_unseen_change_expires_from_a_per_process_cache(self):
+        first = self.client.get(reverse('user-profile'))
+        # Changed without a signal in this process, as when another worker saved it
+        StudentProfile.objects.filter(pk=self.profile.pk).update(full_name='Aryan C.')
+        self.assertEqual(self.client.get(reverse('user-profile')).content, first.content)
+
+        later = time.time() + settings.RESPONSE_CACHE_LOCAL_SECONDS + 1
+        with mock.patch('django.core.cache.backends.locmem.time', mock.Mock(time=lambda: later)):
+            response = self.client.get(reverse('user-profile'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['full_name'], 'Aryan C.')
+
+    def test_conditional_request_gets_304(self):
+        Subject.objects.create(subject_code='CS101', name='Programming Fundamentals', semester=1)
+        response = self.client.get(reverse('subjects-list'))
+        self.assertEqual(len(response.json()), 1)
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse('subjects-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        Subject.objects.create(subject_code='CS102', name='Data Structures', semester=2)
+        response = self.client.get(reverse('subjects-list'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': tempfile.gettempdir() + '/classcue-test-cache',
+    }})
+    def test_file_based_backend(self):
+        cache.clear()
+        first = self.client.get(reverse('user-profile'))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('user-profile'))
+        self.assertEqual(first.content, second.content)
+        cache.clear()
+
+
+class RequestMetricsTests(ClassroomTestCase):
+    STUDENTS = []
+
+    def setUp(self):
+        super().setUp()
+        registry.clear()
+
+    def test_server_timing_and_metrics(self):
+        response = self.client.get(reverse('subjects-list'))
+        self.assertIn('desc="1 queries"', response['Server-Timing'])
+
+        with override_settings(DEBUG=True):
+            metrics = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('classcue_request_queries_count{view="subjects-list",method="GET"} 1', metrics)
+        self.assertIn('classcue_responses_total{view="subjects-list",method="GET",status="200"} 1', metrics)
+
+    @override_settings(METRICS_TOKEN='scrape-secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer scrape-secret')
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(METRICS_TOKEN='', DEBUG=False)
+    def test_metrics_closed_without_a_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+
+
+
+class DatabasePoolMetricsTests(SimpleTestCase):
+    def pooled(self, **stats):
+        connection = mock.Mock(vendor='postgresql', settings_dict={'OPTIONS': {'pool': {'max_size': 10}}})
+        connection.pool.get_stats.return_value = stats
+        return connection
+
+    def connections(self):
+        return {
+            'default': self.pooled(pool_size=4, pool_available=3, requests_waiting=0),
+            'replica"1': self.pooled(pool_size=2, pool_available=2, requests_waiting=5),
+            'direct': mock.Mock(vendor='postgresql', settings_dict={'OPTIONS': {}}),
+            'local': mock.Mock(vendor='sqlite', settings_dict={}),
+        }
+
+    def test_gauges_for_pooled_databases_only(self):
+        connections = self.connections()
+        with mock.patch('api.metrics.connections', connections):
+            metrics = database_pool_metrics()
+        self.assertEqual(metrics.splitlines()[:6], [
+            '# TYPE classcue_db_pool_available gauge',
+            'classcue_db_pool_available{alias="default"} 3',
+            '# TYPE classcue_db_pool_size gauge',
+            'classcue_db_pool_size{alias="default"} 4',
+            '# TYPE classcue_db_pool_requests_waiting gauge',
+            'classcue_db_pool_requests_waiting{alias="default"} 0',
+        ])
+        self.assertIn('classcue_db_pool_requests_waiting{alias="replica\\"1"} 5', metrics)
+        self.assertNotIn('direct', metrics)
+        self.assertNotIn('local', metrics)
+        connections['direct'].pool.get_stats.assert_not_called()
+
+    def test_no_pool_means_no_output(self):
+        with mock.patch('api.metrics.connections', {'local': mock.Mock(vendor='sqlite', settings_dict={})}):
+            self.assertEqual(database_pool_metrics(), '')
+
+    def test_metrics_endpoint_appends_pool_gauges(self):
+        with mock.patch('api.metrics.connections', self.connections()), override_settings(DEBUG=True):
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        metrics = response.content.decode()
+        self.assertIn('classcue_db_pool_size{alias="default"} 4', metrics)
+        self.assertIn('classcue_db_pool_size{alias="replica\\"1"} 2', metrics)
+
+class SlowQueryJournalTests(ClassroomTestCase):
+    STUDENTS = []
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / 'slow_queries.log'
+        self.addCleanup(self.directory.cleanup)
+
+    def test_slow_queries_are_journalled_with_one_plan_per_shape(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG_PATH=str(self.path)):
+            self.client.get(reverse('subjects-list'))
+            cache.clear()
+            self.client.get(reverse('subjects-list'))
+            get_journal().close()
+
+        entries = [json.loads(line) for line in self.path.read_text().splitlines()]
+        subject_entries = [entry for entry in entries if 'api_subject' in entry['sql']]
+        self.assertEqual(len(subject_entries), 2)
+        self.assertEqual(subject_entries[0]['view'], 'subjects-list')
+        self.assertIn('SCAN', ' '.join(subject_entries[0]['plan']))
+        self.assertNotIn('plan', subject_entries[1])
+
+        output = io.StringIO()
+        call_command('slow_queries', path=str(self.path), stdout=output)
+        self.assertIn('subjects-list (2)', output.getvalue())
+
+    def test_string_parameters_are_not_journalled(self):
+        with override_settings(SLOW_QUERY_THRESHOLD_MS=0, SLOW_QUERY_LOG_PATH=str(self.path)):
+            response = APIClient().post(reverse('login'), {'email': 'teacher@example.com', 'password': 'password123'})
+            get_journal().close()
+        self.assertEqual(response.status_code, 200)
+
+        journal = self.path.read_text()
+        self.assertNotIn('teacher@example.com', journal)
+        self.assertNotIn(self.teacher.password, journal)
+        self.assertIn('"<str>"', journal)
+
+
+class LoadTestReportTests(SimpleTestCase):
+    def test_error_classes(self):
+        self.assertEqual(classify(201, b'{}'), 'ok')
+        self.assertEqual(classify(400, b'{"error":"QR code has expired"}'), 'expired')
+        self.assertEqual(classify(400, b'{"error":"Attendance already marked"}'), 'duplicate')
+        self.assertEqual(classify(500, b'OperationalError: database is locked'), 'lock_timeout')
+        self.assertEqual(classify(429, b'{}'), 'shed')
+        self.assertEqual(classify(0, b'timed out'), 'timeout')
+
+    def test_percentile_is_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile([7], 0.95), 7)
+
+
+class EndpointQueryBudgetTests(TestCase):
+    """Query budgets for the endpoints the benchmark suite times, on campus-sized data"""
+
+    BUDGETS = {
+        'endpoint.get_teacher_sessions[10]': 1,
+        'endpoint.get_teacher_sessions[100]': 1,
+        'endpoint.mark_attendance': 1,
+        'endpoint.get_current_qr_code': 1,
+        'endpoint.get_session_attendance': 2,
+        'endpoint.user_profile': 1,
+        'endpoint.subjects_list': 1,
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.fixture = Fixture()
+
+    def setUp(self):
+        cache.clear()
+
+    def test_budgets(self):
+        benchmarks = {bench.name: bench for bench in BENCHMARKS}
+        for name, budget in self.BUDGETS.items():
+            bench = benchmarks[name]
+            with self.subTest(name):
+                bench.run(self.fixture)  # warm the per-user caches, as in production
+                if bench.setup:
+                    bench.setup(self.fixture)
+                with self.assertNumQueries(budget):
+                    bench.run(self.fixture)
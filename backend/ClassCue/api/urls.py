@@ -8,12 +8,19 @@ from .views import (
     user_profile, 
     update_user_profile,
     subjects_list,
-    create_attendance_session,
+    attendance_sessions,
     get_current_qr_code,
     mark_attendance,
     get_session_attendance,
+    session_events,
+    session_events_token,
     end_attendance_session,
-    get_teacher_sessions
+    invalidate_attendance_record,
+    student_attendance_summary,
+    defaulter_report,
+    attendance_rollup,
+    export_attendance,
+    import_accounts_view
 )
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -21,6 +28,7 @@ urlpatterns = [
     # Registration URLs
     path('register/student/', StudentRegistrationView.as_view(), name='student-register'),
     path('register/teacher/', TeacherRegistrationView.as_view(), name='teacher-register'),
+    path('register/import/', import_accounts_view, name='import-accounts'),
     
     # Authentication URLs
     path('login/', login_view, name='login'),
@@ -32,10 +40,18 @@ urlpatterns = [
     path('subjects/', subjects_list, name='subjects-list'),
     
     # Dynamic QR Attendance URLs
-    path('attendance/sessions/', create_attendance_session, name='create-attendance-session'),
+    path('attendance/sessions/', attendance_sessions, name='attendance-sessions'),
     path('attendance/sessions/<int:session_id>/qr/', get_current_qr_code, name='get-current-qr'),
     path('attendance/sessions/<int:session_id>/attendance/', get_session_attendance, name='get-session-attendance'),
+    path('attendance/sessions/<int:session_id>/events/', session_events, name='session-events'),
+    path('attendance/sessions/<int:session_id>/events/token/', session_events_token, name='session-events-token'),
     path('attendance/sessions/<int:session_id>/end/', end_attendance_session, name='end-attendance-session'),
-    path('attendance/sessions/', get_teacher_sessions, name='get-teacher-sessions'),
     path('attendance/mark/', mark_attendance, name='mark-attendance'),
+    path('attendance/records/<int:record_id>/invalidate/', invalidate_attendance_record, name='invalidate-attendance-record'),
+    path('attendance/summary/', student_attendance_summary, name='attendance-summary'),
+    
+    # Reports
+    path('reports/defaulters/', defaulter_report, name='defaulter-report'),
+    path('reports/rollup/', attendance_rollup, name='attendance-rollup'),
+    path('exports/attendance/', export_attendance, name='export-attendance'),
 ]
\ No newline at end of file
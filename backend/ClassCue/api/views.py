@@ -3,16 +3,45 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import F, Q, Sum
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_GET
 from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.utils.crypto import constant_time_compare
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+from collections import Counter
 from datetime import timedelta
-import uuid
-import qrcode
 import io
-import base64
-from .models import User, StudentProfile, TeacherProfile, Subject, AttendanceSession, AttendanceRecord
-from .serializers import UserSerializer, StudentProfileSerializer, TeacherProfileSerializer, SubjectSerializer, AttendanceSessionSerializer, AttendanceRecordSerializer, StudentProfileUpdateSerializer
+import uuid
+from .models import User, StudentProfile, TeacherProfile, Subject, AttendanceSession, AttendanceRecord, StudentSubjectAttendance, AttendanceRollup, ROLLUP_DIMENSIONS
+from .serializers import UserSerializer, StudentProfileSerializer, TeacherProfileSerializer, SubjectSerializer, AttendanceSessionSerializer, AttendanceRecordSerializer, StudentProfileUpdateSerializer, TeacherProfileUpdateSerializer, StudentSubjectAttendanceSerializer
+from .authentication import PrincipalJWTAuthentication, issue_tokens
+from .cache import (
+    ATTENDANCE_COUNTS, SUBJECTS, cached_json_response, get_student_identity, profile_namespace,
+    teacher_sessions_namespace, versioned_key
+)
+from .cursors import (
+    InvalidCursor, decode_cursor, encode_cursor, keyset_page, micros_to_timestamp, parse_page_size, timestamp_to_micros
+)
+from .events import (
+    get_broker, issue_stream_token, iterate_session_events, session_channel, stream_session_events, verify_stream_token
+)
+from .exports import EXPORT_FIELDS, attendance_export_rows, stream_csv, stream_json, stream_jsonl, streaming_response
+from .hashing import HashingPoolSaturated, get_hashing_pool, password_needs_rehash
+from .imports import import_accounts
+from .mark_log import get_mark_log, log_ingest_enabled
+from .metrics import database_pool_metrics, registry
+from .qr_images import qr_etag, qr_image_cache
+from .qr_tokens import ExpiredQRToken, InvalidQRToken, issue_token, signed_mode_enabled, verify_token
+from .signals import attendance_invalidated, attendance_marked, qr_rotated, session_ended
 
 class StudentRegistrationView(generics.CreateAPIView):
     queryset = StudentProfile.objects.all()
@@ -37,98 +66,124 @@ def login_view(request):
             status=status.HTTP_400_BAD_REQUEST
         )
     
-    # For students, try to find by enrollment number first
+    # One query resolves the account: students may sign in with their enrollment number
+    lookup = Q(email=email)
     if role == 'student':
-        try:
-            # Try to find student by enrollment number
-            student_profile = StudentProfile.objects.get(enrollment_number=email)
-            user = student_profile.user
-            if user.check_password(password):
-                refresh = RefreshToken.for_user(user)
-                # Return complete student profile
-                student_data = StudentProfileSerializer(student_profile).data
-                student_data['user_id'] = user.id
-                student_data['user_email'] = user.email
-                student_data['role'] = user.role  # Changed from 'user_role' to 'role'
-                return Response({
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'user': student_data
-                })
-        except StudentProfile.DoesNotExist:
-            pass
-    
-    # For teachers or if student lookup failed, try email authentication
-    user = authenticate(email=email, password=password)
-    if user:
-        refresh = RefreshToken.for_user(user)
-        # Return complete profile based on user role
-        if user.role == 'teacher':
-            try:
-                teacher_profile = TeacherProfile.objects.get(user=user)
-                teacher_data = TeacherProfileSerializer(teacher_profile).data
-                teacher_data['user_id'] = user.id
-                teacher_data['user_email'] = user.email
-                teacher_data['role'] = user.role  # Changed from 'user_role' to 'role'
-                return Response({
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'user': teacher_data
-                })
-            except TeacherProfile.DoesNotExist:
-                pass
-        elif user.role == 'student':
-            try:
-                student_profile = StudentProfile.objects.get(user=user)
-                student_data = StudentProfileSerializer(student_profile).data
-                student_data['user_id'] = user.id
-                student_data['user_email'] = user.email
-                student_data['role'] = user.role  # Changed from 'user_role' to 'role'
-                return Response({
-                    'access': str(refresh.access_token),
-                    'refresh': str(refresh),
-                    'user': student_data
-                })
-            except StudentProfile.DoesNotExist:
-                pass
-        
+        lookup |= Q(studentprofile__enrollment_number=email)
+    candidates = list(User.objects.select_related('studentprofile', 'teacherprofile').filter(lookup)[:2])
+    # An enrollment number match wins over an email match, as it did before
+    user = None
+    for candidate in candidates:
+        candidate_profile = related_profile(candidate, 'studentprofile')
+        if user is None or (candidate_profile is not None and candidate_profile.enrollment_number == email):
+            user = candidate
+
+    pool = get_hashing_pool()
+    try:
+        if user is None:
+            # Hash anyway so unknown accounts take as long as wrong passwords
+            pool.make_password(password)
+            password_valid = False
+        else:
+            password_valid = pool.check_password(password, user.password)
+    except HashingPoolSaturated:
+        return Response(
+            {'error': 'Too many login attempts right now, please retry shortly'},
+            status=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={'Retry-After': str(settings.LOGIN_RETRY_AFTER_SECONDS)}
+        )
+
+    if not password_valid or not user.is_active:
+        return Response(
+            {'error': 'Invalid credentials'}, 
+            status=status.HTTP_401_UNAUTHORIZED
+        )
+
+    upgrade_password_hash(user, password)
+
+    student_profile = related_profile(user, 'studentprofile')
+    teacher_profile = related_profile(user, 'teacherprofile')
+    if user.role == 'teacher' and teacher_profile is not None:
+        refresh = issue_tokens(user, teacher_profile=teacher_profile)
+        user_data = TeacherProfileSerializer(teacher_profile).data
+    elif student_profile is not None and (user.role == 'student' or student_profile.enrollment_number == email):
+        refresh = issue_tokens(user, student_profile=student_profile)
+        user_data = StudentProfileSerializer(student_profile).data
+    else:
         # Fallback to basic user data
+        refresh = issue_tokens(user)
         return Response({
             'access': str(refresh.access_token),
             'refresh': str(refresh),
             'user': UserSerializer(user).data
         })
-    else:
-        return Response(
-            {'error': 'Invalid credentials'}, 
-            status=status.HTTP_401_UNAUTHORIZED
-        )
+
+    user_data['user_id'] = user.id
+    user_data['user_email'] = user.email
+    user_data['role'] = user.role
+    return Response({
+        'access': str(refresh.access_token),
+        'refresh': str(refresh),
+        'user': user_data
+    })
+
+def related_profile(user, name):
+    """Profile loaded through select_related, or None when the user has none"""
+    try:
+        return getattr(user, name)
+    except ObjectDoesNotExist:
+        return None
+
+def upgrade_password_hash(user, password):
+    """Re-hash with the current hasher settings, like User.check_password would"""
+    if not password_needs_rehash(user.password):
+        return
+    try:
+        encoded = get_hashing_pool().make_password(password)
+    except HashingPoolSaturated:
+        return  # Try again on a quieter login
+    # Written directly: a re-hash is not a password change and must not revoke tokens,
+    # so token_version is pinned rather than bumped as other password updates do
+    User.objects.filter(pk=user.pk, password=user.password).update(
+        password=encoded, token_version=F('token_version')
+    )
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def user_profile(request):
     user = request.user
+    key = versioned_key(f"profile:{user.id}:{user.role}", profile_namespace(user.id))
+    return cached_json_response(request, key, lambda: build_user_profile(user))
+
+def build_user_profile(user):
+    # Profiles are fetched by the key carried in the token, not via the users table
     if user.role == 'student':
-        profile = StudentProfile.objects.get(user=user)
+        try:
+            profile = StudentProfile.objects.get(enrollment_number=user.enrollment_number)
+        except StudentProfile.DoesNotExist:
+            return Response({'error': 'Student profile not found'}, status=status.HTTP_404_NOT_FOUND)
         serializer = StudentProfileSerializer(profile)
         # Add user info to the response
         profile_data = serializer.data
         profile_data['user_id'] = user.id
         profile_data['user_email'] = user.email
         profile_data['role'] = user.role
-        return Response(profile_data)
+        return profile_data
     elif user.role == 'teacher':
-        profile = TeacherProfile.objects.get(user=user)
+        try:
+            profile = TeacherProfile.objects.get(id=user.teacher_profile_id)
+        except TeacherProfile.DoesNotExist:
+            return Response({'error': 'Teacher profile not found'}, status=status.HTTP_404_NOT_FOUND)
         serializer = TeacherProfileSerializer(profile)
         # Add user info to the response
         profile_data = serializer.data
         profile_data['user_id'] = user.id
         profile_data['user_email'] = user.email
         profile_data['role'] = user.role
-        return Response(profile_data)
+        return profile_data
     else:
         serializer = UserSerializer(user)
-        return Response(serializer.data)
+        return serializer.data
 
 @api_view(['PUT', 'PATCH'])
 @permission_classes([permissions.IsAuthenticated])
@@ -138,7 +193,7 @@ def update_user_profile(request):
     
     if user.role == 'student':
         try:
-            profile = StudentProfile.objects.get(user=user)
+            profile = StudentProfile.objects.get(enrollment_number=user.enrollment_number)
             serializer = StudentProfileUpdateSerializer(profile, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
@@ -155,7 +210,7 @@ def update_user_profile(request):
     
     elif user.role == 'teacher':
         try:
-            profile = TeacherProfile.objects.get(user=user)
+            profile = TeacherProfile.objects.get(id=user.teacher_profile_id)
             serializer = TeacherProfileUpdateSerializer(profile, data=request.data, partial=True)
             if serializer.is_valid():
                 serializer.save()
@@ -176,13 +231,25 @@ def update_user_profile(request):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def subjects_list(request):
-    subjects = Subject.objects.all()
-    serializer = SubjectSerializer(subjects, many=True)
-    return Response(serializer.data)
+    def build():
+        subjects = Subject.objects.all()
+        serializer = SubjectSerializer(subjects, many=True)
+        return serializer.data
+    
+    return cached_json_response(request, versioned_key('subjects', SUBJECTS), build)
 
 
 # Dynamic QR Attendance API Views
 
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def attendance_sessions(request):
+    """List the teacher's sessions (GET) or start a new one (POST)"""
+    if request.method == 'POST':
+        return create_attendance_session(request._request)
+    return get_teacher_sessions(request._request)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def create_attendance_session(request):
@@ -203,15 +270,17 @@ def create_attendance_session(request):
     
     # Create session
     session = AttendanceSession.objects.create(
-        teacher=request.user,
+        teacher_id=request.user.id,
         subject=subject,
         session_name=session_name
     )
     
     # Generate initial QR code
-    qr_data = generate_qr_code(session.id)
-    session.current_qr_code = qr_data['qr_string']
-    session.qr_expires_at = timezone.now() + timedelta(seconds=10)
+    if signed_mode_enabled():
+        session.current_qr_code, session.qr_expires_at = issue_token(session.id)
+    else:
+        session.qr_expires_at = timezone.now() + timedelta(seconds=settings.QR_ROTATION_SECONDS)
+        session.current_qr_code = generate_qr_code(session.id)
     session.save()
     
     serializer = AttendanceSessionSerializer(session)
@@ -223,30 +292,52 @@ def create_attendance_session(request):
 def get_current_qr_code(request, session_id):
     """Get the current QR code for a session"""
     try:
-        session = AttendanceSession.objects.get(id=session_id, teacher=request.user)
+        session = AttendanceSession.objects.get(id=session_id, teacher_id=request.user.id)
     except AttendanceSession.DoesNotExist:
         return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
     
     if not session.is_active:
         return Response({'error': 'Session is not active'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Check if QR code is expired
-    if timezone.now() > session.qr_expires_at:
+    if signed_mode_enabled():
+        # Signed tokens are derived from the clock, so rotation needs no write
+        session.current_qr_code, session.qr_expires_at = issue_token(session.id)
+    elif timezone.now() > session.qr_expires_at:
         # Generate new QR code
-        qr_data = generate_qr_code(session.id)
-        session.current_qr_code = qr_data['qr_string']
-        session.qr_expires_at = timezone.now() + timedelta(seconds=10)
-        session.save()
+        session.qr_expires_at = timezone.now() + timedelta(seconds=settings.QR_ROTATION_SECONDS)
+        session.current_qr_code = generate_qr_code(session.id)
+        session.save(update_fields=['current_qr_code', 'qr_expires_at'])
+        qr_rotated.send(sender=AttendanceSession, session_id=session.id,
+                        qr_code=session.current_qr_code, expires_at=session.qr_expires_at)
     
-    # Generate QR code image
-    qr_data = generate_qr_code(session.id)
+    # The payload only changes on rotation, so unchanged polls get a 304 without rendering
+    etag = qr_etag(session.current_qr_code)
+    last_modified = int((session.qr_expires_at - timedelta(seconds=settings.QR_ROTATION_SECONDS)).timestamp())
+    if qr_not_modified(request, etag, last_modified):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response({
+            'qr_code': session.current_qr_code,
+            'qr_image': qr_image_cache.get(session.current_qr_code, session.qr_expires_at),
+            'expires_at': session.qr_expires_at,
+            'session_id': session.id
+        })
     
-    return Response({
-        'qr_code': session.current_qr_code,
-        'qr_image': qr_data['qr_image'],
-        'expires_at': session.qr_expires_at,
-        'session_id': session.id
-    })
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def qr_not_modified(request, etag, last_modified):
+    """Evaluate If-None-Match / If-Modified-Since against the current QR payload"""
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or etag in etags
+    
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and last_modified <= if_modified_since
 
 
 @api_view(['POST'])
@@ -258,70 +349,291 @@ def mark_attendance(request):
     if not qr_code:
         return Response({'error': 'QR code is required'}, status=status.HTTP_400_BAD_REQUEST)
     
-    try:
+    if signed_mode_enabled():
+        # Signature and window are checked without touching the database
+        try:
+            session_id = verify_token(qr_code)
+        except ExpiredQRToken:
+            return Response({'error': 'QR code has expired'}, status=status.HTTP_400_BAD_REQUEST)
+        except InvalidQRToken:
+            return Response({'error': 'Invalid or expired QR code'}, status=status.HTTP_400_BAD_REQUEST)
+    else:
         # Parse QR code to get session ID
-        session_id = qr_code.split('|')[0]
-        session = AttendanceSession.objects.get(id=session_id, is_active=True)
-    except (ValueError, AttendanceSession.DoesNotExist):
-        return Response({'error': 'Invalid or expired QR code'}, status=status.HTTP_400_BAD_REQUEST)
-    
-    # Check if QR code is still valid
-    if timezone.now() > session.qr_expires_at:
-        return Response({'error': 'QR code has expired'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            session_id = int(qr_code.split('|')[0])
+        except ValueError:
+            return Response({'error': 'Invalid or expired QR code'}, status=status.HTTP_400_BAD_REQUEST)
     
-    # Get student profile
-    try:
-        student_profile = StudentProfile.objects.get(user=request.user)
-    except StudentProfile.DoesNotExist:
+    # Get student profile (cached per user)
+    identity = get_student_identity(request.user.id)
+    if identity is None:
         return Response({'error': 'Student profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    enrollment_number, full_name = identity
     
-    # Check if already marked attendance
-    existing_record = AttendanceRecord.objects.filter(session=session, student=student_profile).first()
-    if existing_record:
-        return Response({'error': 'Attendance already marked'}, status=status.HTTP_400_BAD_REQUEST)
+    now = timezone.now()
+    if log_ingest_enabled():
+        return queue_attendance_mark(session_id, enrollment_number, full_name, qr_code, now)
     
-    # Create attendance record
-    attendance_record = AttendanceRecord.objects.create(
-        session=session,
-        student=student_profile,
-        qr_code_used=qr_code
+    # One conditional insert: session state, expiry and duplicates are all settled by the database
+    record_id = AttendanceRecord.objects.insert_if_absent(
+        session_id, enrollment_number, qr_code, now,
+        expires_after=None if signed_mode_enabled() else now
     )
+    if record_id is None:
+        return attendance_rejection(session_id, now)
     
+    attendance_record = AttendanceRecord(
+        id=record_id,
+        session_id=session_id,
+        student=StudentProfile(enrollment_number=enrollment_number, full_name=full_name),
+        qr_code_used=qr_code,
+        marked_at=now
+    )
     serializer = AttendanceRecordSerializer(attendance_record)
+    attendance_marked.send(sender=AttendanceRecord, session_id=session_id, records=[serializer.data])
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
+def attendance_rejection(session_id, now):
+    """Work out why a conditional insert did nothing (cold path, off the success budget)"""
+    session = AttendanceSession.objects.filter(id=session_id).values('is_active', 'qr_expires_at').first()
+    if session is None or not session['is_active']:
+        return Response({'error': 'Invalid or expired QR code'}, status=status.HTTP_400_BAD_REQUEST)
+    if not signed_mode_enabled() and (session['qr_expires_at'] is None or now > session['qr_expires_at']):
+        return Response({'error': 'QR code has expired'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({'error': 'Attendance already marked'}, status=status.HTTP_400_BAD_REQUEST)
+
+
+def queue_attendance_mark(session_id, enrollment_number, full_name, qr_code, now):
+    """Validate a scan and append it to the mark log instead of inserting it"""
+    session = AttendanceSession.objects.filter(id=session_id, is_active=True).values('qr_expires_at').first()
+    if session is None:
+        return Response({'error': 'Invalid or expired QR code'}, status=status.HTTP_400_BAD_REQUEST)
+    if not signed_mode_enabled() and (session['qr_expires_at'] is None or now > session['qr_expires_at']):
+        return Response({'error': 'QR code has expired'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if AttendanceRecord.objects.filter(session_id=session_id, student_id=enrollment_number).exists():
+        return Response({'error': 'Attendance already marked'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Acknowledge once the scan is durable in the log; the committer inserts it in a batch
+    if not get_mark_log().append(session_id, enrollment_number, qr_code, now):
+        return Response({'error': 'Attendance already marked'}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({
+        'status': 'queued',
+        'session': session_id,
+        'student': enrollment_number,
+        'student_name': full_name,
+        'marked_at': now
+    }, status=status.HTTP_202_ACCEPTED)
+
+
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_session_attendance(request, session_id):
-    """Get attendance records for a session"""
+    """Get attendance records for a session, or only the changes after ?since=<cursor>"""
     try:
-        session = AttendanceSession.objects.get(id=session_id, teacher=request.user)
+        session = AttendanceSession.objects.select_related('teacher__teacherprofile', 'subject', 'snapshot').get(
+            id=session_id, teacher_id=request.user.id
+        )
     except AttendanceSession.DoesNotExist:
         return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    attendance_records = session.attendance_records.filter(is_valid=True)
-    serializer = AttendanceRecordSerializer(attendance_records, many=True)
+    if 'cursor' in request.query_params or 'page_size' in request.query_params:
+        return session_attendance_page(request, session)
+    
+    since = request.query_params.get('since')
+    if since is None:
+        attendance_records = list(
+            session.attendance_records.filter(is_valid=True).select_related('student').order_by('marked_at', 'id')
+        )
+        serializer = AttendanceRecordSerializer(attendance_records, many=True)
+        session.valid_attendance_count = len(attendance_records)
+        return Response({
+            'session': AttendanceSessionSerializer(session).data,
+            'attendance_records': serializer.data,
+            'total_attended': len(attendance_records),
+            'cursor': attendance_feed_cursor(attendance_records)
+        })
+    
+    try:
+        marked_after, id_after, changed_after = decode_cursor(since, 3)
+    except InvalidCursor:
+        return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # Only rows past the cursor are read, so the cost stays flat as the lecture fills up
+    marked_after_time = micros_to_timestamp(marked_after)
+    added_records = list(
+        session.attendance_records.filter(is_valid=True).filter(
+            Q(marked_at__gt=marked_after_time) | Q(marked_at=marked_after_time, id__gt=id_after)
+        ).select_related('student').order_by('marked_at', 'id')
+    )
+    invalidated_ids = list(
+        session.attendance_records.filter(
+            is_valid=False, invalidated_at__gt=micros_to_timestamp(changed_after)
+        ).values_list('id', flat=True)
+    )
     
     return Response({
-        'session': AttendanceSessionSerializer(session).data,
-        'attendance_records': serializer.data,
-        'total_attended': attendance_records.count()
+        'attendance_records': AttendanceRecordSerializer(added_records, many=True).data,
+        'invalidated_records': invalidated_ids,
+        'total_attended': session_total_attended(session),
+        'cursor': attendance_feed_cursor(added_records, (marked_after, id_after, changed_after))
     })
 
 
+def session_attendance_page(request, session):
+    """One keyset page of a session's valid records, ordered by (marked_at, id)"""
+    cursor = request.query_params.get('cursor')
+    try:
+        page_size = parse_page_size(request.query_params.get('page_size'))
+        attendance_records, next_cursor = keyset_page(
+            session.attendance_records.filter(is_valid=True).select_related('student'),
+            'marked_at', cursor, page_size
+        )
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    data = {
+        'attendance_records': AttendanceRecordSerializer(attendance_records, many=True).data,
+        'next_cursor': next_cursor,
+        'total_attended': session_total_attended(session)
+    }
+    if not cursor:
+        session.valid_attendance_count = data['total_attended']
+        data['session'] = AttendanceSessionSerializer(session).data
+    return Response(data)
+
+
+def session_total_attended(session):
+    """Number of valid records, read from the snapshot once the session has ended"""
+    snapshot = None if session.is_active else getattr(session, 'snapshot', None)
+    if snapshot is not None:
+        return snapshot.present_count
+    return session.attendance_records.filter(is_valid=True).count()
+
+
+def attendance_feed_cursor(records, previous=(0, 0, 0)):
+    """Next feed cursor after `records` (ordered by marked_at, id).
+
+    The cursor stops short of the last ATTENDANCE_FEED_SETTLE_SECONDS so rows
+    committed slightly out of order are sent again rather than skipped;
+    clients de-duplicate by record id.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.ATTENDANCE_FEED_SETTLE_SECONDS)
+    marked_after, id_after, changed_after = previous
+    for record in records:
+        if record.marked_at > cutoff:
+            break
+        marked_after, id_after = timestamp_to_micros(record.marked_at), record.id
+    return encode_cursor(marked_after, id_after, max(changed_after, timestamp_to_micros(cutoff)))
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
-def end_attendance_session(request, session_id):
-    """End an attendance session"""
+def invalidate_attendance_record(request, record_id):
+    """Invalidate an attendance record in one of the teacher's sessions"""
     try:
-        session = AttendanceSession.objects.get(id=session_id, teacher=request.user)
-    except AttendanceSession.DoesNotExist:
+        record = AttendanceRecord.objects.select_related('student').get(id=record_id, session__teacher_id=request.user.id)
+    except AttendanceRecord.DoesNotExist:
+        return Response({'error': 'Attendance record not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    if record.invalidate():
+        attendance_invalidated.send(sender=AttendanceRecord, session_id=record.session_id, record=record)
+    
+    serializer = AttendanceRecordSerializer(record)
+    return Response(serializer.data)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def session_events_token(request, session_id):
+    """Issue a short-lived token for opening the session's event stream"""
+    if not AttendanceSession.objects.filter(id=session_id, teacher_id=request.user.id).exists():
         return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+    return Response({
+        'token': issue_stream_token(session_id, request.user.id),
+        'expires_in': settings.ATTENDANCE_EVENT_TOKEN_MAX_AGE
+    })
+
+
+@require_GET
+async def session_events(request, session_id):
+    """Stream new attendance records and QR rotations for a session as Server-Sent Events"""
+    user_id = await sync_to_async(authenticate_stream_request)(request, session_id)
+    if user_id is None:
+        return JsonResponse({'error': 'Authentication credentials were not provided'}, status=status.HTTP_401_UNAUTHORIZED)
     
-    session.is_active = False
-    session.end_time = timezone.now()
-    session.save()
+    session = await AttendanceSession.objects.select_related('subject', 'teacher__teacherprofile').filter(
+        id=session_id, teacher_id=user_id
+    ).afirst()
+    if session is None:
+        return JsonResponse({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+    if not session.is_active:
+        return JsonResponse({'error': 'Session is not active'}, status=status.HTTP_400_BAD_REQUEST)
+    
+    if isinstance(request, ASGIRequest):
+        # Subscribe before reading the snapshot so no record falls between the two
+        subscription = get_broker().subscribe(session_channel(session.id))
+        snapshot = await sync_to_async(session_event_snapshot)(session)
+        events = stream_session_events(session.id, subscription, snapshot)
+    else:
+        # WSGI (runserver) buffers async iterators, which would never send a byte of an endless stream
+        events = iterate_session_events(session.id, lambda: session_event_snapshot(session))
+    
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def authenticate_stream_request(request, session_id):
+    """User id from a ?token= stream token (EventSource cannot send headers) or the Authorization header"""
+    stream_token = request.GET.get('token')
+    if stream_token:
+        return verify_stream_token(stream_token, session_id)
+    authentication = PrincipalJWTAuthentication()
+    try:
+        result = authentication.authenticate(request)
+    except (AuthenticationFailed, TokenError):
+        return None
+    return result[0].id if result else None
+
+
+def session_event_snapshot(session):
+    """Initial state sent to a new stream subscriber"""
+    attendance_records = session.attendance_records.filter(is_valid=True).select_related('student')
+    records = AttendanceRecordSerializer(attendance_records, many=True).data
+    if signed_mode_enabled():
+        qr_code, expires_at = issue_token(session.id)
+    else:
+        qr_code, expires_at = session.current_qr_code, session.qr_expires_at
+    return {
+        'session': AttendanceSessionSerializer(session).data,
+        'attendance_records': records,
+        'total_attended': len(records),
+        'qr_code': qr_code,
+        'expires_at': expires_at
+    }
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def end_attendance_session(request, session_id):
+    """End an attendance session"""
+    # Ending and crediting the session commit together: if a receiver fails the session
+    # stays active and can be ended again, and the row lock makes a concurrent end wait
+    with transaction.atomic():
+        try:
+            session = AttendanceSession.objects.select_for_update().get(id=session_id, teacher_id=request.user.id)
+        except AttendanceSession.DoesNotExist:
+            return Response({'error': 'Session not found'}, status=status.HTTP_404_NOT_FOUND)
+        
+        # Ending twice must not count the session as held twice
+        if session.is_active:
+            session.is_active = False
+            session.end_time = timezone.now()
+            session.save()
+            session_ended.send(sender=AttendanceSession, session=session)
     
     serializer = AttendanceSessionSerializer(session)
     return Response(serializer.data)
@@ -330,29 +642,214 @@ def end_attendance_session(request, session_id):
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_teacher_sessions(request):
-    """Get all sessions for a teacher"""
-    sessions = AttendanceSession.objects.filter(teacher=request.user).order_by('-start_time')
-    serializer = AttendanceSessionSerializer(sessions, many=True)
-    return Response(serializer.data)
+    """Get a teacher's sessions, newest first, one keyset page at a time"""
+    cursor = request.query_params.get('cursor')
+    page_size = request.query_params.get('page_size')
+    teacher_id = request.user.id
+    key = versioned_key(
+        f"teacher-sessions:{teacher_id}:{cursor}:{page_size}",
+        teacher_sessions_namespace(teacher_id), profile_namespace(teacher_id), SUBJECTS, ATTENDANCE_COUNTS
+    )
+    
+    def build():
+        try:
+            sessions, next_cursor = keyset_page(
+                AttendanceSession.objects.with_listing_data().filter(teacher_id=teacher_id),
+                'start_time', cursor, parse_page_size(page_size), descending=True
+            )
+        except InvalidCursor as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        serializer = AttendanceSessionSerializer(sessions, many=True)
+        return {
+            'results': serializer.data,
+            'next_cursor': next_cursor
+        }
+    
+    # Counts on an active session change with every scan, so such pages are not stored
+    def cacheable(payload):
+        return not any(session['is_active'] for session in payload['results'])
+    
+    return cached_json_response(request, key, build, cacheable)
 
 
-def generate_qr_code(session_id):
-    """Generate QR code data for a session"""
-    qr_string = f"{session_id}|{uuid.uuid4()}|{int(timezone.now().timestamp())}"
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def student_attendance_summary(request):
+    """Get the student's attended/held counts and percentage per subject, over ended sessions"""
+    enrollment_number = request.user.enrollment_number
+    if enrollment_number is None:
+        return Response({'error': 'Student profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    
+    summaries = StudentSubjectAttendance.objects.filter(student_id=enrollment_number).select_related('subject').order_by(
+        'subject__subject_code'
+    )
+    serializer = StudentSubjectAttendanceSerializer(summaries, many=True)
+    return Response({
+        'enrollment_number': enrollment_number,
+        'subjects': serializer.data
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def defaulter_report(request):
+    """Stream the students of a department below the attendance threshold in each subject, as CSV or JSON"""
+    if request.user.role not in ('teacher', 'admin'):
+        return Response({'error': 'Only teachers can view reports'}, status=status.HTTP_403_FORBIDDEN)
+    
+    params = request.query_params
+    department = params.get('department')
+    if not department:
+        return Response({'error': 'department is required'}, status=status.HTTP_400_BAD_REQUEST)
+    output = params.get('output', 'csv')
+    if output not in ('csv', 'json'):
+        return Response({'error': "output must be 'csv' or 'json'"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = report_filters(params)
+        threshold = int(params['threshold']) if params.get('threshold') else settings.ATTENDANCE_THRESHOLD_PERCENT
+        if not 0 < threshold < 100:
+            raise ValueError('threshold must be between 0 and 100')
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    # NumPy is only imported once a report is actually requested
+    from .reports import DEFAULTER_FIELDS, defaulter_rows
+    
+    rows = defaulter_rows(
+        department, filters['semester'], filters['subject_codes'], threshold, filters['since'], filters['until'],
+        include_all=params.get('all') == 'true'
+    )
+    if output == 'csv':
+        return streaming_response(request, stream_csv(rows, DEFAULTER_FIELDS), 'text/csv', 'defaulters.csv')
+    return streaming_response(request, stream_json(rows), 'application/json')
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_attendance(request):
+    """Stream attendance records as CSV or JSON lines (?output=csv|jsonl, ?gzip=true), in constant memory"""
+    if request.user.role not in ('teacher', 'admin'):
+        return Response({'error': 'Only teachers can export attendance'}, status=status.HTTP_403_FORBIDDEN)
     
-    # Generate QR code image
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(qr_string)
-    qr.make(fit=True)
+    params = request.query_params
+    output = params.get('output', 'csv')
+    if output not in ('csv', 'jsonl'):
+        return Response({'error': "output must be 'csv' or 'jsonl'"}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = report_filters(params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    img = qr.make_image(fill_color="black", back_color="white")
+    rows = attendance_export_rows(params.get('department'), **filters)
+    compress = params.get('gzip') == 'true'
+    if output == 'csv':
+        return streaming_response(request, stream_csv(rows, EXPORT_FIELDS), 'text/csv', 'attendance.csv', compress)
+    return streaming_response(request, stream_jsonl(rows), 'application/x-ndjson', 'attendance.jsonl', compress)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def import_accounts_view(request):
+    """Create student or teacher accounts from an uploaded CSV file (multipart field 'file', 'role', 'dry_run')"""
+    if request.user.role != 'admin':
+        return Response({'error': 'Only admins can import accounts'}, status=status.HTTP_403_FORBIDDEN)
     
-    # Convert to base64
-    buffer = io.BytesIO()
-    img.save(buffer, format='PNG')
-    img_str = base64.b64encode(buffer.getvalue()).decode()
+    upload = request.FILES.get('file')
+    if upload is None:
+        return Response({'error': 'A CSV file is required'}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        report = import_accounts(
+            io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline=''),
+            request.data.get('role', 'student'), dry_run=request.data.get('dry_run') == 'true'
+        )
+    except (ValueError, UnicodeDecodeError) as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
     
-    return {
-        'qr_string': qr_string,
-        'qr_image': f"data:image/png;base64,{img_str}"
-    } 
\ No newline at end of file
+    counts = Counter(entry['status'] for entry in report)
+    return Response({
+        **{state: counts[state] for state in ('created', 'skipped', 'invalid', 'failed', 'valid')},
+        'errors': [entry for entry in report if entry['status'] in ('invalid', 'failed')],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def attendance_rollup(request):
+    """Attendance rates from the rollup cube, grouped by ?group_by= (department, semester, subject, date, month)"""
+    if request.user.role not in ('teacher', 'admin'):
+        return Response({'error': 'Only teachers can view reports'}, status=status.HTTP_403_FORBIDDEN)
+    
+    params = request.query_params
+    group_by = [dimension for dimension in params.get('group_by', 'department').split(',') if dimension]
+    unknown = [dimension for dimension in group_by if dimension not in ROLLUP_DIMENSIONS]
+    if unknown or len(set(group_by)) != len(group_by):
+        return Response({'error': f"group_by takes distinct values from {', '.join(ROLLUP_DIMENSIONS)}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+    try:
+        filters = report_filters(params)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    
+    cells = AttendanceRollup.objects.all()
+    if params.get('department'):
+        cells = cells.filter(department=params['department'])
+    if filters['semester'] is not None:
+        cells = cells.filter(semester=filters['semester'])
+    if filters['subject_codes']:
+        cells = cells.filter(subject__subject_code__in=filters['subject_codes'])
+    if filters['since'] is not None:
+        cells = cells.filter(date__gte=filters['since'])
+    if filters['until'] is not None:
+        cells = cells.filter(date__lte=filters['until'])
+    
+    totals = cells.aggregate(sessions_held=Sum('sessions'), expected_total=Sum('expected'), attended_total=Sum('attended'))
+    return Response({
+        'group_by': group_by,
+        'results': [rollup_row(row) for row in cells.rollup(group_by)],
+        'totals': rollup_row(totals)
+    })
+
+
+def rollup_row(row):
+    sessions, expected, attended = (row.pop(name) or 0 for name in ('sessions_held', 'expected_total', 'attended_total'))
+    row.update({
+        'sessions': sessions,
+        'expected': expected,
+        'attended': attended,
+        'rate': round(100 * attended / expected, 2) if expected else None
+    })
+    return row
+
+
+def report_filters(params):
+    """Parse ?semester=, repeated ?subject=<code>, ?since= and ?until= (YYYY-MM-DD); raises ValueError"""
+    filters = {
+        'semester': int(params['semester']) if params.get('semester') else None,
+        'subject_codes': params.getlist('subject'),
+    }
+    for name in ('since', 'until'):
+        value = params.get(name)
+        filters[name] = parse_date(value) if value else None
+        if value and filters[name] is None:
+            raise ValueError(f'{name} must be a date (YYYY-MM-DD)')
+    return filters
+
+
+def generate_qr_code(session_id):
+    """Generate a QR code string for a session; its image is rendered on the first poll that needs it"""
+    return f"{session_id}|{uuid.uuid4()}|{int(timezone.now().timestamp())}"
+
+
+@require_GET
+def metrics(request):
+    """Prometheus scrape endpoint for this worker's request histograms"""
+    if not settings.METRICS_TOKEN:
+        # Fail closed: latency and volume figures are not for the public
+        if not settings.DEBUG:
+            return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+    else:
+        expected = f"Bearer {settings.METRICS_TOKEN}"
+        if not constant_time_compare(request.headers.get('Authorization', ''), expected):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    return HttpResponse(registry.render() + database_pool_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
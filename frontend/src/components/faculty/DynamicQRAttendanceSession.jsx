@@ -4,6 +4,9 @@ import { useAuth } from '../../contexts/AuthContext.jsx';
 import { useTheme } from '../../contexts/ThemeContext.jsx';
 import apiService from '../../services/api.js';
 
+// How long to wait for the stream's first event before polling instead
+const SNAPSHOT_TIMEOUT_MS = 5000;
+
 const DynamicQRAttendanceSession = ({ onStopSession }) => {
   const { user } = useAuth();
   const { theme } = useTheme();
@@ -11,7 +14,6 @@ const DynamicQRAttendanceSession = ({ onStopSession }) => {
   const [isActive, setIsActive] = useState(false);
   const [qrCode, setQrCode] = useState(null);
   const [qrImage, setQrImage] = useState(null);
-  const [attendanceCount, setAttendanceCount] = useState(0);
   const [attendanceRecords, setAttendanceRecords] = useState([]);
   const [timeRemaining, setTimeRemaining] = useState(10);
   const [qrExpired, setQrExpired] = useState(false);
@@ -22,6 +24,11 @@ const DynamicQRAttendanceSession = ({ onStopSession }) => {
   
   const intervalRef = useRef(null);
   const qrIntervalRef = useRef(null);
+  const eventSourceRef = useRef(null);
+  const snapshotTimeoutRef = useRef(null);
+
+  // Every source (snapshot, stream, polling) keeps the full list of valid records
+  const attendanceCount = attendanceRecords.length;
 
   useEffect(() => {
     // Load subjects
@@ -30,6 +37,8 @@ const DynamicQRAttendanceSession = ({ onStopSession }) => {
     return () => {
       if (intervalRef.current) clearInterval(intervalRef.current);
       if (qrIntervalRef.current) clearInterval(qrIntervalRef.current);
+      if (eventSourceRef.current) eventSourceRef.current.close();
+      if (snapshotTimeoutRef.current) clearTimeout(snapshotTimeoutRef.current);
     };
   }, []);
 
@@ -62,8 +71,8 @@ const DynamicQRAttendanceSession = ({ onStopSession }) => {
       // Start QR code rotation
       startQRCodeRotation(response.id);
       
-      // Start attendance polling
-      startAttendancePolling(response.id);
+      // Subscribe to live attendance, falling back to polling
+      startAttendanceStream(response.id);
       
     } catch (error) {
       console.error('Failed to start session:', error);
@@ -80,6 +89,8 @@ const DynamicQRAttendanceSession = ({ onStopSession }) => {
       
       if (intervalRef.current) clearInterval(intervalRef.current);
       if (qrIntervalRef.current) clearInterval(qrIntervalRef.current);
+      if (eventSourceRef.current) eventSourceRef.current.close();
+      if (snapshotTimeoutRef.current) clearTimeout(snapshotTimeoutRef.current);
       
       onStopSession({
         sessionId: session.id,
@@ -134,12 +145,64 @@ const DynamicQRAttendanceSession = ({ onStopSession }) => {
     }
   };
 
+  const startAttendanceStream = async (sessionId) => {
+    if (typeof EventSource === 'undefined') {
+      startAttendancePolling(sessionId);
+      return;
+    }
+
+    let source;
+    try {
+      source = await apiService.openSessionEvents(sessionId);
+    } catch (error) {
+      console.error('Failed to open attendance stream:', error);
+      startAttendancePolling(sessionId);
+      return;
+    }
+    eventSourceRef.current = source;
+
+    const fallBackToPolling = () => {
+      clearTimeout(snapshotTimeoutRef.current);
+      snapshotTimeoutRef.current = null;
+      source.close();
+      if (eventSourceRef.current !== source) return;
+      eventSourceRef.current = null;
+      startAttendancePolling(sessionId);
+    };
+
+    // A server that buffers the stream never errors and never sends anything, so give it a few seconds
+    snapshotTimeoutRef.current = setTimeout(fallBackToPolling, SNAPSHOT_TIMEOUT_MS);
+
+    source.addEventListener('snapshot', (event) => {
+      clearTimeout(snapshotTimeoutRef.current);
+      snapshotTimeoutRef.current = null;
+      const data = JSON.parse(event.data);
+      setAttendanceRecords(data.attendance_records);
+    });
+
+    source.addEventListener('attendance', (event) => {
+      const record = JSON.parse(event.data);
+      setAttendanceRecords(prev => (
+        prev.some(existing => existing.id === record.id) ? prev : [...prev, record]
+      ));
+    });
+
+    source.addEventListener('invalidated', (event) => {
+      const { id } = JSON.parse(event.data);
+      setAttendanceRecords(prev => prev.filter(existing => existing.id !== id));
+    });
+
+    source.addEventListener('ended', () => source.close());
+
+    // Stream unavailable or connection dropped: poll instead
+    source.onerror = fallBackToPolling;
+  };
+
   const startAttendancePolling = (sessionId) => {
     // Poll attendance every 2 seconds
     intervalRef.current = setInterval(async () => {
       try {
         const response = await apiService.getSessionAttendance(sessionId);
-        setAttendanceCount(response.total_attended);
         setAttendanceRecords(response.attendance_records);
       } catch (error) {
         console.error('Failed to fetch attendance:', error);
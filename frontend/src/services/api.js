@@ -155,6 +155,19 @@ class ApiService {
     return this.handleResponse(response);
   }
 
+  // Live attendance stream (Server-Sent Events); EventSource cannot send headers,
+  // so a short-lived token scoped to this session's stream travels as a query parameter
+  async openSessionEvents(sessionId) {
+    const response = await fetch(`${this.baseURL}/attendance/sessions/${sessionId}/events/token/`, {
+      method: 'POST',
+      headers: this.getHeaders(),
+    });
+    const { token } = await this.handleResponse(response);
+    return new EventSource(
+      `${this.baseURL}/attendance/sessions/${sessionId}/events/?token=${encodeURIComponent(token)}`
+    );
+  }
+
   async endAttendanceSession(sessionId) {
     const response = await fetch(`${this.baseURL}/attendance/sessions/${sessionId}/end/`, {
       method: 'POST',